@@ -4,8 +4,9 @@ This module contains function to convert an alias config file an/or an alias int
 regular expressions for matching purposes"""
 
 import re
-from typing import List, Optional, Set, Text
-from logging import warning, info
+import sys
+from logging import info, warning
+from typing import Any, Dict, Iterable, List, Match, Optional, Pattern, Set, Text, Tuple
 
 
 def alias_set_from_config(config_file_name: Text) -> Set[Text]:
@@ -26,11 +27,18 @@ def alias_set_from_config(config_file_name: Text) -> Set[Text]:
     return alias_set
 
 
-def regex_from_alias(alias: Text) -> Text:
-    """convert a alias to a more general form using regex. All "breaks" in the
-    alias (camlecase, numbers, underscores etc) is allowed to be "as is", a set
-    of whitespace (one or more) and also -_/. to allow for different
-    conventions in writing aliases"""
+# Regular expression allowing a "break" in an alias to be written with
+# whitespace and/or one of -_/.
+SEPARATOR = r"\s?[- _.]?"
+
+# Characters in aliases that are not matched literally by regex_from_alias
+REGEX_SPECIAL = set("\\^$*+?{}[]|()")
+
+
+def regex_tokens(alias: Text) -> List[Text]:
+    """Split alias into the regular expression elements used by regex_from_alias.
+    Each element is a (lower case) character of the alias, \\d for digits or
+    SEPARATOR for breaks"""
 
     def camel_case_break(alias: Text, i: int) -> bool:
         """Detect transistion from lower case to uppper case"""
@@ -58,24 +66,32 @@ def regex_from_alias(alias: Text) -> Text:
             return False
         return True
 
-    tmp_re: Text = r"\b("  # start with word boundry
+    tokens: List[Text] = []
     for i, c in enumerate(alias):
         # transistions from lower to upper case and from letter to number may
         # also be written with a space.
         if camel_case_break(alias, i) or alpha_to_digit_break(alias, i):
-            tmp_re += r"\s?[- _.]?"
+            tokens.append(SEPARATOR)
         # Any space may or may not be there in text (som concat and use lower
         # to upper)
         if c.isspace():
-            tmp_re += r"\s?[- _.]?"
+            tokens.append(SEPARATOR)
         elif c.isdigit():
-            tmp_re += r"\d"
+            tokens.append(r"\d")
         else:
-            tmp_re += c.lower()
+            tokens.append(c.lower())
+
+    return tokens
 
-    tmp_re += r")\b"
 
-    return tmp_re
+def regex_from_alias(alias: Text) -> Text:
+    """convert a alias to a more general form using regex. All "breaks" in the
+    alias (camlecase, numbers, underscores etc) is allowed to be "as is", a set
+    of whitespace (one or more) and also -_/. to allow for different
+    conventions in writing aliases"""
+
+    # start with word boundry
+    return r"\b(" + "".join(regex_tokens(alias)) + r")\b"
 
 
 def normalize(
@@ -145,21 +161,129 @@ def normalize(
     return name
 
 
+def regex_alias_set(config_file_name: Text) -> Set[Text]:
+    """Aliases from config file that regular expressions can be created from"""
+
+    alias_set = set()
+
+    for alias in alias_set_from_config(config_file_name):
+        if alias.isdigit():
+            info(f"Unable to create regex from all digit alias {alias}")
+            continue
+        alias_set.add(alias)
+
+    return alias_set
+
+
 def get_reg_ex_set(config_file_name: Text) -> Set[Text]:
     """Helper function to take a config file, parse it and create regular
     expressions from the aliases contained within. The aliases is returned in
     a set og regex strings"""
 
-    regex_set = set()
+    return {regex_from_alias(alias) for alias in regex_alias_set(config_file_name)}
 
-    alias_set = alias_set_from_config(config_file_name)
-    for alias in alias_set:
-        if alias.isdigit():
-            info(f"Unable to create regex from all digit alias {alias}")
-            continue
-        regex_set.add(regex_from_alias(alias))
 
-    return regex_set
+class AliasMatcher:
+    """Find matches of the regular expressions created by regex_from_alias for
+    a set of aliases, with a single scan of the text.
+
+    All the alias regexes are combined in a prefilter, where aliases with
+    common prefixes share a branch (a trie). The prefilter finds the positions
+    where at least one alias matches, and only the aliases starting with the
+    character at these positions are tried. The result is the same as running
+    findall for each alias regex.
+
+    Aliases with regex special characters (other than ".") can not be
+    combined, and are searched for separately."""
+
+    def __init__(self, aliases: Iterable[Text], flags: int = re.IGNORECASE) -> None:
+        tokens = {}
+        for alias in aliases:
+            alias_tokens = regex_tokens(alias)
+            # Different aliases may give the same regex, e.g. "APT 1" and "APT1"
+            tokens[r"\b(" + "".join(alias_tokens) + r")\b"] = alias_tokens
+
+        self.separate: List[Pattern[Text]] = []
+        self.candidates: Dict[Text, List[Pattern[Text]]] = {}
+
+        trie: Dict[Text, Any] = {}
+
+        for regex, alias_tokens in sorted(tokens.items()):
+            try:
+                pattern = re.compile(regex, flags)
+            except re.error:
+                sys.stderr.write(f"ERROR in regex {regex}\n")
+                raise
+
+            if any(token in REGEX_SPECIAL for token in alias_tokens):
+                self.separate.append(pattern)
+                continue
+
+            self.candidates.setdefault(alias_tokens[0], []).append(pattern)
+
+            node = trie
+            for token in alias_tokens:
+                node = node.setdefault(token, {})
+            node[""] = {}  # End of alias
+
+        self.prefilter: Optional[Pattern[Text]] = None
+        if trie:
+            self.prefilter = re.compile(r"\b(?=" + trie_regex(trie) + ")", flags)
+
+    def finditer(self, text: Text) -> List[Tuple[Pattern[Text], Match[Text]]]:
+        """Find all matches in text, as (pattern, match), ordered by position"""
+
+        matches = [
+            (pattern, match)
+            for pattern in self.separate
+            for match in pattern.finditer(text)
+        ]
+
+        if self.prefilter:
+            # End of last match for each pattern. Matches from the same pattern
+            # do not overlap, like with findall
+            match_end: Dict[Pattern[Text], int] = {}
+
+            for hit in self.prefilter.finditer(text):
+                pos = hit.start()
+                for pattern in self.candidates_at(text[pos]):
+                    if match_end.get(pattern, 0) > pos:
+                        continue
+                    match = pattern.match(text, pos)
+                    if match:
+                        matches.append((pattern, match))
+                        match_end[pattern] = match.end()
+
+        matches.sort(key=lambda m: m[1].start())
+
+        return matches
+
+    def candidates_at(self, char: Text) -> List[Pattern[Text]]:
+        """Patterns that can start with char"""
+
+        res: List[Pattern[Text]] = []
+
+        keys = {char.lower(), char.upper().lower(), "."}
+        if char.isdigit():
+            keys.add(r"\d")
+
+        for key in keys:
+            res += self.candidates.get(key, [])
+
+        return res
+
+
+def trie_regex(node: Dict[Text, Any]) -> Text:
+    """Create regex from trie of regex tokens, where "" marks the end of an alias"""
+
+    branches = [
+        (token + trie_regex(child)) if token else r"\b" for token, child in node.items()
+    ]
+
+    if len(branches) == 1:
+        return branches[0]
+
+    return "(?:" + "|".join(branches) + ")"
 
 
 if __name__ == "__main__":
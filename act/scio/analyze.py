@@ -10,9 +10,11 @@ import json
 import logging
 import os.path
 import re
+import signal
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional, Text
+from typing import Dict, List, Optional, Set, Text
 
 import addict
 import caep
@@ -23,6 +25,11 @@ import requests
 import act.scio.config
 import act.scio.logsetup
 from act.scio import plugin
+from act.scio.beanstalk import AsyncBeanstalk
+from act.scio.es import FIRST_SEEN_INDEX, BulkWriter, FirstSeenWriter
+from act.scio.resultcache import ResultCache
+from act.scio.runner import PluginRunner
+from act.scio.tokens import TokenStore
 
 DEFAULT_METADATA_DATE_FIELDS = [
     "Creation-Date",
@@ -47,6 +54,9 @@ DEFAULT_METADATA_DATE_FIELDS = [
 
 ISO8601_DATE_RE = re.compile(r"^\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\dZ$")
 
+# Seconds to wait for a job before checking if the worker should stop
+RESERVE_TIMEOUT = 5
+
 
 def parse_args() -> argparse.Namespace:
     """Helper setting up the argsparse configuration"""
@@ -56,6 +66,102 @@ def parse_args() -> argparse.Namespace:
     arg_parser.add_argument(
         "--metadata-date-fields", default=",".join(DEFAULT_METADATA_DATE_FIELDS)
     )
+    arg_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of documents to work on concurrently (default=1)",
+    )
+    arg_parser.add_argument(
+        "--plugin-processes",
+        type=int,
+        help="Number of processes used to run CPU bound plugins. "
+        + "Default is the number of CPUs, 0 runs all plugins in the main process",
+    )
+    arg_parser.add_argument(
+        "--plugin-timeout",
+        type=float,
+        default=300,
+        help="Max seconds a plugin can use on a document, 0 for no limit (default=300)",
+    )
+    arg_parser.add_argument(
+        "--plugin-timeouts",
+        default="",
+        help="Max seconds per plugin, overriding --plugin-timeout, "
+        + "e.g. 'pos_tag:600, openai:120'",
+    )
+    arg_parser.add_argument(
+        "--result-cache",
+        default=str(caep.get_cache_dir("scio/plugin-results.db")),
+        help="sqlite database used to cache results from plugins that support "
+        + "it (e.g. pos_tag), indexed on the document hexdigest. "
+        + "Set to empty value to disable",
+    )
+    arg_parser.add_argument(
+        "--result-cache-size",
+        type=int,
+        default=1024,
+        help="Max size (MB) of the result cache (default=1024)",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-batch-size",
+        type=int,
+        default=50,
+        help="Number of documents sent to elasticsearch in one bulk request (default=50)",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-flush-interval",
+        type=float,
+        default=5,
+        help="Max seconds a document waits before it is sent to elasticsearch "
+        + "(default=5)",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-max-retries",
+        type=int,
+        default=5,
+        help="Number of retries, with exponential backoff, for documents that "
+        + "fail to index (default=5)",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-spool",
+        default=str(caep.get_cache_dir("scio/elasticsearch-spool")),
+        help="Directory where documents that could not be indexed are stored. They "
+        + "are indexed again when scio-analyze is restarted. "
+        + "Set to empty value to disable",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-first-seen-index",
+        default=FIRST_SEEN_INDEX,
+        help="Index where the time each indicator was first seen is stored, "
+        + f"used by the incremental indicator feed (default={FIRST_SEEN_INDEX}). "
+        + "Set to empty value to disable",
+    )
+    arg_parser.add_argument(
+        "--elasticsearch-fields",
+        default="*, -content",
+        help="Comma separated list of fields stored in elasticsearch. * is all "
+        + "fields except results from transient plugins (e.g. pos_tag), "
+        + "-<field> removes a field (default='*, -content')",
+    )
+    arg_parser.add_argument(
+        "--webdump-fields",
+        default="*",
+        help="Fields sent to webdump, see --elasticsearch-fields (default='*')",
+    )
+    arg_parser.add_argument(
+        "--stdout-fields",
+        default="*",
+        help="Fields written to stdout, see --elasticsearch-fields (default='*')",
+    )
+    arg_parser.add_argument(
+        "--pos-tag-tokens",
+        choices=["full", "summary", "drop"],
+        default="full",
+        help="Output of pos_tag tokens, if pos_tag is selected in the output "
+        + "fields. full: all tokens as [token, tag], summary: number of tokens "
+        + "per tag, drop: no tokens (default=full)",
+    )
     arg_parser.add_argument("--proxy-string", help="Proxy to use webdump upload")
     arg_parser.add_argument(
         "--webdump", dest="webdump", type=str, help="URI to post result data"
@@ -67,9 +173,32 @@ def parse_args() -> argparse.Namespace:
         field.strip() for field in args.metadata_date_fields.split(",")
     ]
 
+    args.plugin_timeouts = parse_plugin_timeouts(args.plugin_timeouts)
+
+    args.elasticsearch_fields = parse_fields(args.elasticsearch_fields)
+    args.webdump_fields = parse_fields(args.webdump_fields)
+    args.stdout_fields = parse_fields(args.stdout_fields)
+
     return args  # type: ignore
 
 
+def parse_plugin_timeouts(timeouts: Text) -> Dict[Text, float]:
+    """Parse comma separated list of <plugin>:<seconds>"""
+
+    res: Dict[Text, float] = {}
+
+    for entry in timeouts.split(","):
+        if not entry.strip():
+            continue
+        try:
+            name, timeout = entry.split(":")
+            res[name.strip()] = float(timeout)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Illegal plugin timeout: {entry}")
+
+    return res
+
+
 def remove_non_iso_dates(
     metadata: Dict[Text, Text], isodate_fields: List[Text]
 ) -> Dict[Text, Text]:
@@ -88,18 +217,26 @@ def remove_non_iso_dates(
     return filtered
 
 
-def get_input(beanstalk_client: Optional[greenstalk.Client] = None) -> addict.Dict:
-    """Helper function to abstract away how we get the text to work on"""
+async def get_input(
+    beanstalk_client: Optional[AsyncBeanstalk] = None,
+    reserve_timeout: Optional[int] = None,
+) -> Optional[addict.Dict]:
+    """Helper function to abstract away how we get the text to work on.
+    Returns None if no job was reserved within reserve_timeout"""
 
     nlpdata = addict.Dict()
     if not beanstalk_client:
         logging.info("Waiting for work on stdin")
-        data = sys.stdin.read()
+        loop = asyncio.get_event_loop()
+        data = await loop.run_in_executor(None, sys.stdin.read)
         nlpdata.content = data
     else:
         # ADD BEANSTALK JOB CONSUMPTION
         logging.info("Waiting for work from beanstalk")
-        job = beanstalk_client.reserve()
+        try:
+            job = await beanstalk_client.reserve(timeout=reserve_timeout)
+        except greenstalk.TimedOutError:
+            return None
         try:
             nlpdata = addict.Dict(json.loads(gzip.decompress(job.body)))
             logging.info("Started work on %s", nlpdata.get("hexdigest", "No Hexdigest"))
@@ -108,20 +245,26 @@ def get_input(beanstalk_client: Optional[greenstalk.Client] = None) -> addict.Di
             logging.error(e)
         finally:
             # Remove job, either on success or file not found
-            beanstalk_client.delete(job)
+            await beanstalk_client.delete(job)
 
     return nlpdata
 
 
 async def analyze(
     plugins: List[plugin.BasePlugin],
-    beanstalk_client: Optional[greenstalk.Client] = None,
+    beanstalk_client: Optional[AsyncBeanstalk] = None,
+    runner: Optional[PluginRunner] = None,
+    reserve_timeout: Optional[int] = None,
 ) -> addict.Dict:
     """Main analyze loop running all plugins on the text"""
 
-    loop = asyncio.get_event_loop()
+    if not runner:
+        runner = PluginRunner(plugins, processes=0)
+
+    nlpdata = await get_input(beanstalk_client, reserve_timeout)
+    if nlpdata is None:
+        return addict.Dict({})
 
-    nlpdata: addict.Dict = get_input(beanstalk_client)
     if not nlpdata.content:
         logging.error("Missing content")
         return addict.Dict({})
@@ -136,48 +279,244 @@ async def analyze(
         "dcterms:created", nlpdata["Analyzed-Date"]
     )
 
-    staged = []  # for plugins with dependencies
-    pipeline = []  # for plugins to be run now
+    await runner.run_all(nlpdata)
 
-    for p in plugins:
-        if p.dependencies:
-            staged.append(p)
+    return nlpdata
+
+
+def parse_fields(fields: Text) -> List[Text]:
+    """Parse comma separated list of output fields"""
+
+    return [field.strip() for field in fields.split(",") if field.strip()]
+
+
+def project(
+    result: addict.Dict, fields: List[Text], transient: Set[Text]
+) -> addict.Dict:
+    """Select the fields of result that should be output. Fields are handled in
+    order, where
+
+        *           selects all fields, except results from transient plugins
+        name        selects a field, e.g. "pos_tag" or "indicators.fqdn"
+        -name       removes a field, e.g. "-content" or "-metadata.X-Parsed-By"
+
+    The values are not copied, so the projection must not be modified in place"""
+
+    projection = addict.Dict()
+
+    for field in fields:
+        if field == "*":
+            projection.update(
+                {key: value for key, value in result.items() if key not in transient}
+            )
+            continue
+
+        remove = field.startswith("-")
+        path = field.lstrip("-").split(".")
+
+        # Copy the dicts on the path, so the result is not modified
+        source = result
+        target = projection
+        for key in path[:-1]:
+            if not isinstance(source.get(key), dict):
+                break
+            source = source[key]
+            target[key] = addict.Dict(target.get(key, {}))
+            target = target[key]
         else:
-            pipeline.append(p)
-
-    while pipeline:
-        tasks = []
-        for p in pipeline:
-            tasks.append(loop.create_task(p.analyze(nlpdata)))
-
-        await asyncio.gather(*tasks, return_exceptions=True)
-
-        for task in tasks:
-            if task.exception():
-                logging.error(
-                    "%s returned an exception: %s, \n%s",
-                    task,
-                    task.exception(),
-                    "\n".join(str(frame) for frame in task.get_stack()),
+            key = path[-1]
+            if remove:
+                target.pop(key, None)
+            elif key in source:
+                target[key] = source[key]
+
+    return projection
+
+
+def output_tokens(result: addict.Dict, mode: Text) -> None:
+    """Replace the pos_tag tokens in result with a list of [token, tag] (full),
+    the number of tokens per tag (summary) or remove them (drop). pos_tag is
+    replaced with a new Dict, so other projections of the result are not
+    modified"""
+
+    pos_tag = result.get("pos_tag")
+
+    if not pos_tag or "tokens" not in pos_tag:
+        return
+
+    tokens = pos_tag.tokens
+
+    if not isinstance(tokens, TokenStore):
+        tokens = TokenStore("", tokens)
+
+    pos_tag = result["pos_tag"] = addict.Dict(
+        {key: value for key, value in pos_tag.items() if key != "tokens"}
+    )
+
+    if mode == "full":
+        pos_tag.tokens = tokens.to_list()
+    elif mode == "summary":
+        pos_tag.summary = tokens.summary()
+
+
+def output(
+    args: argparse.Namespace,
+    result: addict.Dict,
+    fields: List[Text],
+    transient: Set[Text],
+) -> addict.Dict:
+    """Projection of result with fields, ready to be serialized"""
+
+    projection = project(result, fields, transient)
+    output_tokens(projection, args.pos_tag_tokens)
+
+    return projection
+
+
+def store_result(
+    args: argparse.Namespace,
+    result: addict.Dict,
+    elasticsearch_writer: Optional[BulkWriter],
+    transient: Optional[Set[Text]] = None,
+    first_seen_writer: Optional[FirstSeenWriter] = None,
+) -> None:
+    """Send result to webdump/elasticsearch (or stdout) and remove
+    the document if it should not be stored. Only the fields selected for
+    each output (args.*_fields) are sent, and results from transient plugins
+    are only sent if selected explicitly. Indicators in documents stored in
+    elasticsearch are sent to the first seen index"""
+
+    transient = transient or set()
+
+    store = result.get("store", False)
+    filename = result["filename"]
+    hexdigest = result.get("hexdigest")
+    owner = result.get("owner")
+    tlp = result.get("tlp")
+
+    logging.info(
+        "Recieved job: hexdigest=%s, filename=%s, tlp=%s, owner=%s, store=%s",
+        hexdigest,
+        filename,
+        tlp,
+        owner,
+        store,
+    )
+
+    if args.webdump:
+        proxies = (
+            {"http": args.proxy_string, "https": args.proxy_string}
+            if args.proxy_string
+            else None
+        )
+
+        r = requests.post(
+            args.webdump,
+            data=json.dumps(
+                output(args, result, args.webdump_fields, transient), indent="  "
+            ),
+            proxies=proxies,
+        )
+        if r.status_code != 200:
+            logging.error("Unable to post result data to webdump: %s", r.text)
+
+    if elasticsearch_writer and store:
+        if not hexdigest:
+            logging.error("Missing hexdigest, skipping elasticsearch storage")
+        else:
+            document = output(args, result, args.elasticsearch_fields, transient)
+
+            if "metadata" in document:
+                document["metadata"] = remove_non_iso_dates(
+                    document["metadata"], args.metadata_date_fields
                 )
-            else:
-                res = task.result()
-                nlpdata[res.name] = res.result
-
-        pipeline = []
-        for candidate in staged[:]:
-            if all(dep in nlpdata for dep in candidate.dependencies):
-                pipeline.append(candidate)
-                staged.remove(candidate)
-
-    for candidate in staged:
-        logging.warning(
-            "Candidate %s did not run due to unmet dependency %s",
-            candidate.name,
-            candidate.dependencies,
+
+            # Indexed in batches by the writer thread
+            elasticsearch_writer.add(hexdigest, document)
+
+            logging.info("Queued %s for elasticsearch", hexdigest)
+
+            if first_seen_writer:
+                for indicator_type, values in result.get("indicators", {}).items():
+                    for value in values:
+                        first_seen_writer.add_indicator(indicator_type, value)
+
+    if not (args.webdump or elasticsearch_writer):
+        # Print to stdout if we do not send to webdump or elasticsearch
+        print(
+            json.dumps(output(args, result, args.stdout_fields, transient), indent="  ")
         )
 
-    return nlpdata
+    if (not store) and filename:
+        # Delete file after it has been analyzed
+        logging.info(
+            "Removed file because store=False (hexdigest=%s, filename=%s)",
+            hexdigest,
+            filename,
+        )
+
+        try:
+            Path(filename).unlink()
+        except (NotADirectoryError, FileNotFoundError, TypeError) as e:
+            logging.error("Unable to remove %s: %s", filename, e)
+
+
+async def worker(
+    worker_id: int,
+    args: argparse.Namespace,
+    plugins: List[plugin.BasePlugin],
+    runner: PluginRunner,
+    elasticsearch_writer: Optional[BulkWriter],
+    first_seen_writer: Optional[FirstSeenWriter],
+    stop: asyncio.Event,
+) -> None:
+    """Reserve, analyze and store documents until stop is set. Each worker
+    has its own beanstalk connection and works on one document at a time"""
+
+    loop = asyncio.get_event_loop()
+
+    beanstalk_client = act.scio.config.async_beanstalk_client(
+        args, watch="scio_analyze"
+    )
+
+    # Results from these plugins are only output if selected explicitly
+    transient = {p.name for p in plugins if p.transient}
+
+    logging.info("Worker [%s] started", worker_id)
+
+    while not stop.is_set():
+        try:
+            result = await analyze(
+                plugins, beanstalk_client, runner, reserve_timeout=RESERVE_TIMEOUT
+            )
+        except LookupError:
+            logging.error(
+                "Got LookupError. If nltk data is missing, "
+                "run scio-nltk-download, which should download "
+                "all nltk data to ~/nltk_data."
+            )
+            raise
+
+        if result:
+            await loop.run_in_executor(
+                None,
+                store_result,
+                args,
+                result,
+                elasticsearch_writer,
+                transient,
+                first_seen_writer,
+            )
+
+        # If we are not listening on a beanstalk work queue, behave like a command line
+        # utility and exit after one document.
+        if not beanstalk_client:
+            break
+
+    if beanstalk_client:
+        beanstalk_client.close()
+
+    logging.info("Worker [%s] stopped", worker_id)
 
 
 async def async_main() -> None:
@@ -200,91 +539,99 @@ async def async_main() -> None:
     for p in plugins:
         p.configdir = os.path.join(args.config_dir, "etc/plugins")
 
-    beanstalk_client = act.scio.config.beanstalk_client(args, watch="scio_analyze")
-    elasticsearch_client = act.scio.config.elasticsearch_client(args)
+    concurrency = max(args.concurrency, 1) if args.beanstalk else 1
 
     loop = asyncio.get_event_loop()
 
-    while True:
-        task = loop.create_task(analyze(plugins, beanstalk_client))
-        try:
-            await task
-        except LookupError:
-            logging.error(
-                "Got LookupError. If nltk data is missing, "
-                "run scio-nltk-download, which should download "
-                "all nltk data to ~/nltk_data."
-            )
-            raise
-
-        result = task.result()
-        if not result:
-            continue
-        result_json = json.dumps(result, indent="  ")
-
-        store = result.get("store", False)
-        filename = result["filename"]
-        hexdigest = result.get("hexdigest")
-        owner = result.get("owner")
-        tlp = result.get("tlp")
-
-        logging.info(
-            "Recieved job: hexdigest=%s, filename=%s, tlp=%s, owner=%s, store=%s",
-            hexdigest,
-            filename,
-            tlp,
-            owner,
-            store,
-        )
-
-        if args.webdump:
-            proxies = (
-                {"http": args.proxy_string, "https": args.proxy_string}
-                if args.proxy_string
-                else None
-            )
+    # Each worker blocks one thread while storing results
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=concurrency + 4))
 
-            r = requests.post(args.webdump, data=result_json, proxies=proxies)
-            if r.status_code != 200:
-                logging.error("Unable to post result data to webdump: %s", r.text)
+    # Stop reserving new jobs on SIGTERM/SIGINT, and let the workers
+    # finish the documents they are working on
+    stop = asyncio.Event()
 
-        if elasticsearch_client and store:
-            if not hexdigest:
-                logging.error("Missing hexdigest, skipping elasticsearch storage")
-            else:
-                result["metadata"] = remove_non_iso_dates(
-                    result["metadata"], args.metadata_date_fields
-                )
+    def drain(signame: Text) -> None:
+        logging.info("Got %s, finishing documents in progress", signame)
+        stop.set()
 
-                try:
-                    elasticsearch_client.index(index="scio2", id=hexdigest, body=result)
-                except Exception as e:
-                    logging.error("Error storing %s to elasticsearch: %s", hexdigest, e)
-                    raise
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, drain, sig.name)
 
-                logging.info("Stored %s to elasticsearch", hexdigest)
+    cache = None
+    if args.result_cache and args.result_cache_size > 0:
+        cache = ResultCache(args.result_cache, args.result_cache_size * 1024 * 1024)
 
-        if not (args.webdump or elasticsearch_client):
-            # Print to stdout if we do not send to webdump or elasticsearch
-            print(result_json)
+    runner = PluginRunner(
+        plugins,
+        processes=args.plugin_processes,
+        timeout=args.plugin_timeout,
+        timeouts=args.plugin_timeouts,
+        cache=cache,
+    )
 
-        if (not store) and filename:
-            # Delete file after it has been analyzed
-            logging.info(
-                "Removed file because store=False (hexdigest=%s, filename=%s)",
-                hexdigest,
-                filename,
-            )
+    # Load config and prepare state once, instead of for every document.
+    # Plugins run in the process pool are set up in the worker processes
+    for p in plugins:
+        if runner.pool and p.name in runner.pool_plugins:
+            continue
+        try:
+            p.warmup()
+        except Exception as e:
+            logging.error("Unable to set up plugin %s: %s", p.name, e)
 
-            try:
-                Path(filename).unlink()
-            except (NotADirectoryError, FileNotFoundError, TypeError) as e:
-                logging.error("Unable to remove %s: %s", filename, e)
+    elasticsearch_client = act.scio.config.elasticsearch_client(args)
 
-        # If we are not listening on a beanstalk work queue, behave like a command line
-        # utility and exit after one document.
-        if not beanstalk_client:
-            break
+    elasticsearch_writer = None
+    if elasticsearch_client:
+        elasticsearch_writer = BulkWriter(
+            elasticsearch_client,
+            batch_size=args.elasticsearch_batch_size,
+            flush_interval=args.elasticsearch_flush_interval,
+            max_retries=args.elasticsearch_max_retries,
+            spool_dir=args.elasticsearch_spool or None,
+        )
+        elasticsearch_writer.start()
+
+    first_seen_writer = None
+    if elasticsearch_client and args.elasticsearch_first_seen_index:
+        first_seen_writer = FirstSeenWriter(
+            elasticsearch_client,
+            index=args.elasticsearch_first_seen_index,
+            batch_size=args.elasticsearch_batch_size * 10,
+            flush_interval=args.elasticsearch_flush_interval,
+            max_retries=args.elasticsearch_max_retries,
+            spool_dir=(
+                os.path.join(args.elasticsearch_spool, "first-seen")
+                if args.elasticsearch_spool
+                else None
+            ),
+        )
+        first_seen_writer.start()
+
+    try:
+        await asyncio.gather(
+            *[
+                worker(
+                    i,
+                    args,
+                    plugins,
+                    runner,
+                    elasticsearch_writer,
+                    first_seen_writer,
+                    stop,
+                )
+                for i in range(concurrency)
+            ]
+        )
+    finally:
+        runner.shutdown()
+        if cache:
+            cache.close()
+        if elasticsearch_writer:
+            # Send pending documents
+            elasticsearch_writer.close()
+        if first_seen_writer:
+            first_seen_writer.close()
 
 
 def main() -> None:
@@ -19,30 +19,87 @@ SCIO API
 """
 
 import argparse
+import asyncio
 import base64
+import functools
 import hashlib
 import logging
+import mimetypes
 import os
 import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import asynccontextmanager
 from functools import lru_cache
 from pathlib import Path, PurePath
-from typing import Dict, List, Text, cast, Any
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    NamedTuple,
+    Optional,
+    Text,
+    Tuple,
+    Union,
+    cast,
+)
 
 import caep
 import elasticsearch
-import greenstalk
+import magic
 import uvicorn
-from fastapi import Depends, FastAPI, HTTPException, Response
-from fastapi.responses import FileResponse, PlainTextResponse
-from pydantic import ConstrainedStr
+from elasticsearch import AsyncElasticsearch
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from pydantic import ConstrainedStr, ValidationError
 
 import act.scio.config
 import act.scio.es
-from act.scio.models import Document, LookupResponse, SubmitResponse
+from act.scio.beanstalk import AsyncBeanstalk
+from act.scio.digestset import DigestSet
+from act.scio.docstore import DocumentStore
+from act.scio.models import (
+    BatchSubmitResponse,
+    Document,
+    LookupResponse,
+    ScioBaseDocument,
+    SubmitResponse,
+)
 
 XDG_CACHE = Path(os.environ.get("XDG_CACHE_HOME", "~/.cache")).expanduser()
 
-app = FastAPI()
+SECONDS = {"w": 604800, "d": 86400, "h": 3600, "m": 60, "s": 1}
+
+# Tubes checked for backpressure
+QUEUE_TUBES = ["scio_doc", "scio_analyze"]
+
+# Bytes buffered before writing uploaded documents to disk
+WRITE_BUFFER = 1024 * 1024
+
+# Bytes read at a time when streaming base64 encoded documents (multiple of 3)
+BASE64_CHUNK = 3 * 256 * 1024
+
+# Cached indicators not requested for this many TTLs are removed
+CACHE_IDLE_TTLS = 10
+
+# Seconds before the file of a removed cache entry is deleted
+RETIRE_DELAY = 60
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """Run startup() and shutdown()"""
+    await startup()
+    yield
+    await shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # pylint: disable=too-few-public-methods
 
@@ -59,21 +116,279 @@ class SHA256Regex(ConstrainedStr):
     regex = re.compile(r"^[0-9A-Fa-f]{64}$")
 
 
-def max_current_jobs_ready(client: greenstalk.Client, tubes: List[Text]) -> int:
-    """Get max current-jobs-ready from tubes specified"""
-    max_jobs = 0
+class CursorRegex(ConstrainedStr):
+    regex = re.compile(r"^\d+(-[0-9a-f]{64})?$")
+
+
+class CacheEntry(NamedTuple):
+    """Cached response body, stored in filename"""
+
+    filename: Path
+    etag: Text
+    created: float
+
+
+class ResponseCache:
+    """Cache of response bodies with time to live.
+
+    Bodies are written to files in a temporary directory (created in
+    directory), and are not kept in memory. Expired entries are still
+    returned, while a new body is fetched in the background, so only the
+    first request for a key waits for the body. Concurrent requests for the
+    same key share one fetch. Entries that are not requested for idle seconds
+    are removed, and the least recently requested entries are removed if
+    there are more than max_entries. Files of removed entries are deleted
+    after RETIRE_DELAY seconds, so responses already sending them can open
+    them"""
+
+    def __init__(
+        self,
+        ttl: float,
+        idle: float,
+        max_entries: int = 64,
+        directory: Optional[Text] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.idle = idle
+        self.max_entries = max_entries
+
+        # One directory per process, as several API processes may share
+        # the parent directory
+        self.directory = Path(tempfile.mkdtemp(prefix="scio-cache-", dir=directory))
+
+        self.entries: Dict[Hashable, CacheEntry] = {}
+        self.accessed: Dict[Hashable, float] = {}
+        self.fetching: Dict[Hashable, "asyncio.Task[CacheEntry]"] = {}
+
+    async def get(
+        self, key: Hashable, fetch: Callable[[], AsyncIterator[bytes]]
+    ) -> CacheEntry:
+        """Return cached entry for key, using fetch to get the body if
+        the key is not cached or the entry is expired"""
+
+        now = time.monotonic()
+        self.accessed[key] = now
+        self.expire(now)
+
+        entry = self.entries.get(key)
+
+        if not entry:
+            return await self.refresh(key, fetch)
+
+        if now - entry.created > self.ttl:
+            # Serve the expired entry while refreshing in the background
+            self.refresh(key, fetch).add_done_callback(log_refresh_error)
+
+        return entry
+
+    def refresh(
+        self, key: Hashable, fetch: Callable[[], AsyncIterator[bytes]]
+    ) -> "asyncio.Task[CacheEntry]":
+        """Fetch body for key, unless already fetching"""
+
+        if key not in self.fetching:
+            self.fetching[key] = asyncio.ensure_future(self.store(key, fetch))
+
+        return self.fetching[key]
+
+    async def store(
+        self, key: Hashable, fetch: Callable[[], AsyncIterator[bytes]]
+    ) -> CacheEntry:
+        """Fetch body and write it to a file"""
+
+        try:
+            filename = self.directory / f"{uuid.uuid4().hex}.body"
+            digest, _ = await write_stream(filename, fetch())
+            entry = CacheEntry(
+                filename=filename, etag=f'"{digest[:32]}"', created=time.monotonic()
+            )
+            if key in self.accessed:
+                self.remove(key)
+                self.entries[key] = entry
+            else:
+                # Removed while fetching
+                self.retire(filename)
+            return entry
+        finally:
+            del self.fetching[key]
+
+    def expire(self, now: float) -> None:
+        """Remove idle entries, and the least recently used entries if
+        there are too many"""
+
+        by_access = sorted(self.accessed, key=self.accessed.__getitem__)
+        remove = len(by_access) - self.max_entries
+
+        for key in by_access:
+            if remove <= 0 and now - self.accessed[key] <= self.idle:
+                break
+            del self.accessed[key]
+            self.remove(key)
+            remove -= 1
+
+    def remove(self, key: Hashable) -> None:
+        """Remove entry for key, if any"""
+
+        entry = self.entries.pop(key, None)
+
+        if entry:
+            self.retire(entry.filename)
+
+    def retire(self, filename: Path) -> None:
+        """Delete file after RETIRE_DELAY seconds"""
+
+        asyncio.get_running_loop().call_later(
+            RETIRE_DELAY, functools.partial(filename.unlink, missing_ok=True)
+        )
+
+    def close(self) -> None:
+        """Delete all cached bodies"""
+
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def log_refresh_error(task: "asyncio.Task[CacheEntry]") -> None:
+    """Log errors from background refresh of cache entries"""
+
+    if not task.cancelled() and task.exception():
+        logging.error("Cache refresh failed: %s", task.exception())
+
+
+def etag_match(if_none_match: Optional[Text], etag: Text) -> bool:
+    """Return True if etag is in the If-None-Match header"""
+
+    if not if_none_match:
+        return False
+
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+
+    # Weak comparison, as specified for If-None-Match
+    return "*" in tags or etag in [re.sub(r"^W/", "", tag) for tag in tags]
+
+
+def normalize_period(last: Text) -> Text:
+    """Normalize period, so equal periods (e.g. 1d and 24h) have the same
+    cache key. Months and years vary in length, and are kept as is"""
+
+    match = re.search(r"^(\d+)([yMwdhms]?)$", last)
+
+    if not match:
+        return last
+
+    num, unit = int(match.group(1)), match.group(2)
+
+    if unit in SECONDS:
+        return f"{num * SECONDS[unit]}s"
+
+    return f"{num}{unit}"
+
+
+async def current_jobs_ready(
+    client: AsyncBeanstalk, tubes: List[Text]
+) -> Dict[Text, int]:
+    """Get current-jobs-ready for each of the tubes specified"""
+    jobs = {}
+    existing_tubes = await client.tubes()
     for tube in tubes:
+        jobs[tube] = 0
         # We need to check for the existense of a beanstalk tube
         # to avoid "NOT_FOUND" exceptions in the case where the tubes
         # are empty before first init
-        if tube not in client.tubes():
+        if tube not in existing_tubes:
             continue
-        stats = client.stats_tube(tube)
+        stats = await client.stats_tube(tube)
 
         if stats:
-            max_jobs = max(max_jobs, stats.get("current-jobs-ready", 0))
+            jobs[tube] = stats.get("current-jobs-ready", 0)
+
+    return jobs
+
 
-    return max_jobs
+async def max_current_jobs_ready(client: AsyncBeanstalk, tubes: List[Text]) -> int:
+    """Get max current-jobs-ready from tubes specified"""
+    return max(list((await current_jobs_ready(client, tubes)).values()) + [0])
+
+
+class QueueMonitor:
+    """Sample the number of jobs ready in beanstalk tubes in the background,
+    so the queue depth can be checked without a request to beanstalk.
+
+    The monitor uses its own beanstalk connection, which is reconnected if a
+    sample fails. The sample is stale if it is older than max_age seconds
+    (e.g. when beanstalk is down)."""
+
+    def __init__(
+        self,
+        connect: Callable[[], AsyncBeanstalk],
+        tubes: List[Text],
+        interval: float = 0.5,
+        max_age: float = 10,
+    ) -> None:
+        self.connect = connect
+        self.tubes = tubes
+        self.interval = interval
+        self.max_age = max_age
+
+        self.client: Optional[AsyncBeanstalk] = None
+        self.jobs_ready: Dict[Text, int] = {}
+        self.sampled = 0.0
+        self.failed = False
+        self.task: Optional["asyncio.Task[None]"] = None
+
+    def start(self) -> None:
+        """Start sampling in the background"""
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self) -> None:
+        """Stop sampling and close the connection"""
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        if self.client:
+            self.client.close()
+            self.client = None
+
+    async def run(self) -> None:
+        """Sample every interval seconds"""
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    async def sample(self) -> None:
+        """Sample jobs ready in each tube. Errors are logged once, until
+        sampling succeeds again"""
+        try:
+            if not self.client:
+                self.client = await asyncio.get_running_loop().run_in_executor(
+                    None, self.connect
+                )
+            self.jobs_ready = await current_jobs_ready(self.client, self.tubes)
+            self.sampled = time.monotonic()
+        except Exception as e:
+            if not self.failed:
+                logging.error("Unable to sample beanstalk queue depth: %s", e)
+            self.failed = True
+            if self.client:
+                self.client.close()
+                self.client = None
+            return
+
+        if self.failed:
+            logging.info("Sampling beanstalk queue depth again")
+            self.failed = False
+
+    def age(self) -> float:
+        """Seconds since the last successful sample"""
+        return time.monotonic() - self.sampled
+
+    def max_jobs_ready(self) -> Optional[int]:
+        """Max jobs ready in the tubes, None if the sample is stale"""
+        if self.age() > self.max_age:
+            return None
+        return max(list(self.jobs_ready.values()) + [0])
 
 
 def create_path_if_not_exists(path: Path) -> None:
@@ -98,6 +413,13 @@ def parse_args() -> argparse.Namespace:
         default=10,
         help="Max jobs in queue before submit responds " + "with backpressure (429)",
     )
+    arg_parser.add_argument(
+        "--queue-sample-interval",
+        type=float,
+        default=0.5,
+        help="Seconds between samples of the number of jobs in queue, used for "
+        + "backpressure. 0 checks the queue on every submit (default=0.5)",
+    )
     arg_parser.add_argument(
         "--reload",
         action="store_true",
@@ -116,6 +438,63 @@ def parse_args() -> argparse.Namespace:
         help="Host interface (default=127.0.0.1)",
     )
 
+    arg_parser.add_argument(
+        "--first-seen-index",
+        default=act.scio.es.FIRST_SEEN_INDEX,
+        help="Index with the time indicators were first seen, maintained by "
+        + f"scio-analyze (default={act.scio.es.FIRST_SEEN_INDEX})",
+    )
+    arg_parser.add_argument(
+        "--indicators-feed-delay",
+        type=int,
+        default=30,
+        help="Only return indicators first seen more than this number of seconds "
+        + "ago from the indicator feed, so indicators that are not yet searchable "
+        + "are not skipped (default=30)",
+    )
+    arg_parser.add_argument(
+        "--indicators-cache-ttl",
+        type=int,
+        default=300,
+        help="Seconds indicators are cached before they are refreshed in the "
+        + "background. 0 disables the cache (default=300)",
+    )
+    arg_parser.add_argument(
+        "--indicators-cache-size",
+        type=int,
+        default=64,
+        help="Max number of indicator types/periods cached (default=64)",
+    )
+    arg_parser.add_argument(
+        "--indicators-cache-dir",
+        default="",
+        help="Directory where cached indicators are stored, in a temporary "
+        + "directory for each process (default is the system temp directory)",
+    )
+
+    arg_parser.add_argument(
+        "--dedup-ttl",
+        type=float,
+        default=24,
+        help="Hours a submitted document is remembered. Documents submitted "
+        + "again within this time are not analyzed again. 0 disables (default=24)",
+    )
+    arg_parser.add_argument(
+        "--dedup-db",
+        default=os.path.join(caep.get_cache_dir("scio"), "submitted.db"),
+        help=f"Database of submitted documents (default={XDG_CACHE}/scio/submitted.db)",
+    )
+    arg_parser.add_argument(
+        "--dedup-elasticsearch",
+        action="store_true",
+        help="Also check if documents are stored in elasticsearch",
+    )
+    arg_parser.add_argument(
+        "--dedup-merge",
+        action="store_true",
+        help="Add uri and owner of duplicate documents to the stored document",
+    )
+
     args = caep.config.handle_args(arg_parser, "scio/etc", "scio.ini", "api")
 
     nostore_path = args.document_path / "NOSTORE"
@@ -123,22 +502,123 @@ def parse_args() -> argparse.Namespace:
     create_path_if_not_exists(args.document_path)
     create_path_if_not_exists(nostore_path)
 
-    args.beanstalk_client = act.scio.config.beanstalk_client(args, use="scio_doc")
-    args.elasticsearch_client = act.scio.config.elasticsearch_client(args)
+    args.document_store = DocumentStore(args.document_path)
+    args.beanstalk_client = act.scio.config.async_beanstalk_client(args, use="scio_doc")
+    args.queue_monitor = (
+        QueueMonitor(
+            lambda: AsyncBeanstalk((args.beanstalk, args.beanstalk_port)),
+            QUEUE_TUBES,
+            interval=args.queue_sample_interval,
+        )
+        if args.beanstalk_client and args.queue_sample_interval > 0
+        else None
+    )
+    args.elasticsearch_client = act.scio.config.async_elasticsearch_client(args)
+    args.submitted = (
+        DigestSet(args.dedup_db, args.dedup_ttl * 3600) if args.dedup_ttl > 0 else None
+    )
+    args.indicators_cache = (
+        ResponseCache(
+            ttl=args.indicators_cache_ttl,
+            idle=args.indicators_cache_ttl * CACHE_IDLE_TTLS,
+            max_entries=args.indicators_cache_size,
+            directory=args.indicators_cache_dir or None,
+        )
+        if args.indicators_cache_ttl
+        else None
+    )
 
     return args  # type: ignore
 
 
-def document_lookup(
-    document_id: Text, elasticsearch_client: elasticsearch.Elasticsearch
+async def startup() -> None:
+    """Start sampling the queue depth"""
+    args = parse_args()
+
+    if args.queue_monitor:
+        args.queue_monitor.start()
+
+
+async def shutdown() -> None:
+    """Close connections to beanstalk, elasticsearch and the submitted
+    documents database, and delete cached indicators"""
+    args = parse_args()
+
+    if args.queue_monitor:
+        await args.queue_monitor.stop()
+
+    if args.elasticsearch_client:
+        await args.elasticsearch_client.close()
+
+    if args.submitted:
+        args.submitted.close()
+
+    if args.indicators_cache:
+        args.indicators_cache.close()
+
+
+def sha256(content: bytes) -> Text:
+    """Return sha256 hexdigest of content"""
+    return hashlib.sha256(content).hexdigest()
+
+
+async def base64_chunks(
+    filename: Text, chunk_size: int = BASE64_CHUNK
+) -> AsyncIterator[bytes]:
+    """Base64 encoded content of filename, read chunk_size bytes at a time.
+    chunk_size must be a multiple of 3, so the encoded chunks can be joined"""
+
+    loop = asyncio.get_running_loop()
+
+    f = await loop.run_in_executor(None, open, filename, "rb")
+
+    try:
+        while True:
+            chunk = await loop.run_in_executor(None, f.read, chunk_size)
+            if not chunk:
+                break
+            yield base64.b64encode(chunk)
+    finally:
+        f.close()
+
+
+async def lines(
+    rows: AsyncIterator[Tuple[Text, int]], chunk_size: int = 65536
+) -> AsyncIterator[bytes]:
+    """New line separated keys of rows, sent in chunks of about chunk_size bytes"""
+
+    chunk: List[Text] = []
+    size = 0
+    separator = ""
+
+    async for key, _ in rows:
+        # Separator before each line, so there is no trailing new line
+        chunk.append(separator + key)
+        size += len(chunk[-1])
+        separator = "\n"
+
+        if size >= chunk_size:
+            yield "".join(chunk).encode("utf8")
+            chunk = []
+            size = 0
+
+    if chunk:
+        yield "".join(chunk).encode("utf8")
+
+
+async def document_lookup(
+    document_id: Text, elasticsearch_client: Optional[AsyncElasticsearch]
 ) -> LookupResponse:
     """Lookup document location and content type from document_id (hexdigest)"""
 
     filename: Text = ""
     content_type: Text = ""
 
+    if not elasticsearch_client:
+        raise HTTPException(status_code=412, detail="Elasticsearch is not configured")
+
     try:
-        res = elasticsearch_client.get(index="scio2", id=document_id.lower())
+        res = await elasticsearch_client.get(index="scio2", id=document_id.lower())
         filename = res["_source"].get("filename")
         content_type = res["_source"].get("metadata", {}).get("Content-Type")
     except elasticsearch.exceptions.NotFoundError:
@@ -147,17 +627,36 @@ def document_lookup(
     return LookupResponse(filename=filename, content_type=content_type)
 
 
-@app.post("/submit")  # type: ignore
-async def submit(
-    doc: Document, args: argparse.Namespace = Depends(parse_args)
-) -> SubmitResponse:
-    # Depends on parse_args which are used for settings. The result
-    # is cached the first time it is executed
-    """Submit document"""
+async def resolve_document(
+    document_id: Text, args: argparse.Namespace
+) -> LookupResponse:
+    """Lookup document location and content type from document_id
+    (hexdigest). Documents in the document store are found without
+    elasticsearch, documents stored before the document store are looked up
+    in elasticsearch"""
 
-    max_jobs = max_current_jobs_ready(
-        args.beanstalk_client, ["scio_doc", "scio_analyze"]
-    )
+    path = args.document_store.lookup(document_id)
+
+    if path:
+        content_type = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: magic.from_file(str(path), mime=True)
+        )
+        return LookupResponse(filename=str(path), content_type=content_type)
+
+    if not args.elasticsearch_client:
+        return LookupResponse(filename="", content_type="")
+
+    return await document_lookup(document_id, args.elasticsearch_client)
+
+
+async def check_queue(args: argparse.Namespace) -> None:
+    """Raise HTTPException (429) if there are too many jobs in queue"""
+
+    max_jobs = args.queue_monitor.max_jobs_ready() if args.queue_monitor else None
+
+    if max_jobs is None:
+        # No recent sample, ask beanstalk
+        max_jobs = await max_current_jobs_ready(args.beanstalk_client, QUEUE_TUBES)
 
     if max_jobs >= args.max_jobs:
         logging.warning("%s jobs in queue", max_jobs)
@@ -165,34 +664,388 @@ async def submit(
             status_code=429, detail="To many jobs in queue, try again later"
         )
 
-    path = args.document_path if doc.store else args.document_path / "NOSTORE"
 
-    filename = path / PurePath(doc.filename).name
-    content: bytes = base64.b64decode(doc.content)
-    with open(filename, "bw") as f:
-        f.write(content)
+def submit_response(
+    doc: ScioBaseDocument,
+    filename: Path,
+    hexdigest: Text,
+    count: int,
+    duplicate: bool = False,
+) -> SubmitResponse:
+    """Response to submit, also used as job for analysis"""
 
-    response = SubmitResponse(
+    return SubmitResponse(
         filename=str(filename),
-        hexdigest=hashlib.sha256(content).hexdigest(),
-        count=len(content),
+        original_filename=PurePath(doc.filename).name,
+        hexdigest=hexdigest,
+        count=count,
         tlp=doc.tlp,
         error=None,
         uri=doc.uri,
         store=doc.store,
+        force=doc.force,
         owner=doc.owner,
+        duplicate=duplicate,
     )
 
-    args.beanstalk_client.put(response.json().encode("utf8"))
+
+async def store_document(args: argparse.Namespace, doc: Document) -> SubmitResponse:
+    """Decode and store document, unless it is a duplicate. Returns the
+    response to submit, with duplicate set if the document is not stored"""
+
+    loop = asyncio.get_running_loop()
+
+    content: bytes = base64.b64decode(doc.content)
+
+    # Hash and write in a thread, so large documents do not block other requests
+    hexdigest = await loop.run_in_executor(None, sha256, content)
+    filename = args.document_store.path(hexdigest, doc.store)
+
+    duplicate = await check_duplicate(args, doc, filename, hexdigest, len(content))
+    if duplicate:
+        return duplicate
+
+    response = submit_response(doc, filename, hexdigest, len(content))
+
+    try:
+        await loop.run_in_executor(
+            None,
+            args.document_store.write,
+            content,
+            hexdigest,
+            doc.store,
+            response.original_filename,
+        )
+    except BaseException:
+        await forget(args, hexdigest, doc.store)
+        raise
+
+    return response
+
+
+async def ndjson_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Non-empty lines from chunks of new line delimited JSON"""
+
+    buffer = bytearray()
+    # Bytes of buffer already searched for new lines. Only new data is
+    # searched, so long lines (e.g. large documents) are not scanned again
+    # for each chunk
+    scanned = 0
+
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+
+        while True:
+            end = buffer.find(b"\n", scanned)
+            if end == -1:
+                break
+            line = bytes(buffer[start:end])
+            start = scanned = end + 1
+            if line.strip():
+                yield line
+
+        del buffer[:start]
+        scanned = len(buffer)
+
+    if buffer.strip():
+        yield bytes(buffer)
+
+
+async def enqueue(
+    args: argparse.Namespace,
+    doc: ScioBaseDocument,
+    filename: Path,
+    hexdigest: Text,
+    count: int,
+) -> SubmitResponse:
+    """Send document to analysis"""
+
+    response = submit_response(doc, filename, hexdigest, count)
+
+    try:
+        await args.beanstalk_client.put(response.json().encode("utf8"))
+    except BaseException:
+        await forget(args, hexdigest, doc.store)
+        raise
+
     return response
 
 
+def dedup_key(hexdigest: Text, store: bool) -> Text:
+    """Key of document in the submitted documents"""
+
+    return hexdigest if store else f"{hexdigest}-nostore"
+
+
+async def forget(args: argparse.Namespace, hexdigest: Text, store: bool) -> None:
+    """Remove document from the submitted documents, if it could not be
+    submitted, so it can be submitted again"""
+
+    if args.submitted:
+        await asyncio.get_running_loop().run_in_executor(
+            None, args.submitted.discard, dedup_key(hexdigest, store)
+        )
+
+
+async def check_duplicate(
+    args: argparse.Namespace,
+    doc: ScioBaseDocument,
+    filename: Path,
+    hexdigest: Text,
+    count: int,
+) -> Optional[SubmitResponse]:
+    """Return response marked as duplicate if the document is submitted
+    recently (or is stored in elasticsearch, with --dedup-elasticsearch),
+    otherwise None. The uri and owner of duplicates are added to the stored
+    document with --dedup-merge. Documents submitted with force are never
+    duplicates"""
+
+    if not args.submitted:
+        return None
+
+    loop = asyncio.get_running_loop()
+
+    if doc.store:
+        new = await loop.run_in_executor(None, args.submitted.add, hexdigest)
+    else:
+        # Documents that are not stored are only duplicates of documents
+        # submitted without store, or documents that are stored. A document
+        # submitted without store is still new if it is submitted with store
+        stored = await loop.run_in_executor(None, args.submitted.contains, hexdigest)
+        new = not stored and await loop.run_in_executor(
+            None, args.submitted.add, dedup_key(hexdigest, False)
+        )
+
+    if doc.force:
+        # Still remembered as submitted, for submits without force
+        return None
+
+    if new and args.dedup_elasticsearch and args.elasticsearch_client:
+        try:
+            new = not await args.elasticsearch_client.exists(
+                index="scio2", id=hexdigest
+            )
+        except (elasticsearch.ApiError, elasticsearch.TransportError) as e:
+            logging.warning("Unable to check if %s is stored: %s", hexdigest, e)
+
+    if new:
+        return None
+
+    logging.info("Duplicate document %s (%s)", hexdigest, filename.name)
+
+    if args.dedup_merge and args.elasticsearch_client and (doc.uri or doc.owner):
+        try:
+            await act.scio.es.async_merge_metadata(
+                args.elasticsearch_client, hexdigest, doc.uri, doc.owner
+            )
+        except elasticsearch.exceptions.NotFoundError:
+            # Not analyzed yet, or not stored
+            pass
+        except (elasticsearch.ApiError, elasticsearch.TransportError) as e:
+            logging.warning("Unable to merge metadata of %s: %s", hexdigest, e)
+
+    return submit_response(doc, filename, hexdigest, count, duplicate=True)
+
+
+async def write_stream(
+    filename: Path, chunks: AsyncIterator[bytes], buffer_size: int = WRITE_BUFFER
+) -> Tuple[Text, int]:
+    """Write chunks to filename, while computing the sha256 hexdigest.
+    The file is removed if writing fails. Returns (hexdigest, bytes written)"""
+
+    loop = asyncio.get_running_loop()
+    sha256 = hashlib.sha256()
+    count = 0
+
+    f = await loop.run_in_executor(None, open, filename, "wb")
+
+    try:
+        buffer = bytearray()
+        async for chunk in chunks:
+            sha256.update(chunk)
+            count += len(chunk)
+            buffer += chunk
+
+            if len(buffer) >= buffer_size:
+                await loop.run_in_executor(None, f.write, bytes(buffer))
+                buffer.clear()
+
+        await loop.run_in_executor(None, f.write, bytes(buffer))
+        await loop.run_in_executor(None, f.close)
+    except BaseException:
+        f.close()
+        filename.unlink()
+        raise
+
+    return sha256.hexdigest(), count
+
+
+def document_metadata(
+    filename: Text,
+    uri: Optional[Text] = None,
+    tlp: Optional[Text] = None,
+    owner: Optional[Text] = None,
+    store: bool = True,
+    force: bool = False,
+) -> ScioBaseDocument:
+    """Document metadata from query parameters"""
+
+    try:
+        return ScioBaseDocument(
+            filename=filename, uri=uri, tlp=tlp, owner=owner, store=store, force=force
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors())
+
+
+@app.post("/submit")  # type: ignore
+async def submit(
+    doc: Document, args: argparse.Namespace = Depends(parse_args)
+) -> SubmitResponse:
+    # Depends on parse_args which are used for settings. The result
+    # is cached the first time it is executed
+    """Submit document"""
+
+    await check_queue(args)
+
+    response = await store_document(args, doc)
+
+    if response.duplicate:
+        return response
+
+    return await enqueue(
+        args, doc, Path(response.filename), response.hexdigest, response.count
+    )
+
+
+@app.post("/submit/file")  # type: ignore
+async def submit_file(
+    request: Request,
+    doc: ScioBaseDocument = Depends(document_metadata),
+    args: argparse.Namespace = Depends(parse_args),
+) -> SubmitResponse:
+    """Submit document as raw request body
+
+    The document metadata (filename, uri, tlp, owner, store and force) are
+    specified as query parameters. The document is streamed to disk, without
+    keeping the full document in memory.
+
+    """
+
+    await check_queue(args)
+
+    loop = asyncio.get_running_loop()
+
+    tmp_file = args.document_store.tmp_file()
+
+    hexdigest, count = await write_stream(tmp_file, request.stream())
+    filename = args.document_store.path(hexdigest, doc.store)
+
+    duplicate = await check_duplicate(args, doc, filename, hexdigest, count)
+    if duplicate:
+        tmp_file.unlink()
+        return duplicate
+
+    try:
+        await loop.run_in_executor(
+            None,
+            args.document_store.add,
+            tmp_file,
+            hexdigest,
+            doc.store,
+            PurePath(doc.filename).name,
+        )
+    except BaseException:
+        await forget(args, hexdigest, doc.store)
+        raise
+
+    return await enqueue(args, doc, filename, hexdigest, count)
+
+
+@app.post("/submit/batch")  # type: ignore
+async def submit_batch(
+    request: Request,
+    args: argparse.Namespace = Depends(parse_args),
+) -> BatchSubmitResponse:
+    """Submit many documents
+
+    The request body is new line delimited JSON (application/x-ndjson), with
+    one document per line, in the same format as /submit. The queue is only
+    checked once for the batch, and the documents are queued after they are
+    stored. The response has the result for each document, in the same
+    order as the documents. Documents that could not be submitted have the
+    error set.
+
+    """
+
+    await check_queue(args)
+
+    results: List[SubmitResponse] = []
+    # Stored documents, that are marked as submitted, but not queued yet
+    queued: List[SubmitResponse] = []
+
+    try:
+        async for line in ndjson_lines(request.stream()):
+            try:
+                doc = Document.parse_raw(line)
+            except ValidationError as e:
+                results.append(
+                    SubmitResponse(
+                        filename="",
+                        hexdigest="",
+                        count=0,
+                        error=f"Invalid document: {e}",
+                    )
+                )
+                continue
+
+            try:
+                response = await store_document(args, doc)
+            except (ValueError, OSError) as e:
+                # E.g. invalid base64 or disk full
+                logging.error("Unable to store %s: %s", doc.filename, e)
+                results.append(
+                    SubmitResponse(
+                        filename=doc.filename,
+                        hexdigest="",
+                        count=0,
+                        error=f"Unable to store document: {e}",
+                    )
+                )
+                continue
+
+            results.append(response)
+
+            if not response.duplicate:
+                queued.append(response)
+
+        errors = await args.beanstalk_client.put_many(
+            [response.json().encode("utf8") for response in queued]
+        )
+    except BaseException:
+        # E.g. the client disconnected. Documents that are not queued must
+        # be submitted again
+        for response in queued:
+            await forget(args, response.hexdigest, response.store)
+        raise
+
+    for response, error in zip(queued, errors):
+        if isinstance(error, Exception):
+            logging.error("Unable to queue %s: %s", response.hexdigest, error)
+            response.error = f"Unable to queue document: {error}"
+            await forget(args, response.hexdigest, response.store)
+
+    return BatchSubmitResponse(results=results)
+
+
 @app.get("/indicators/{indicator_type}", response_class=PlainTextResponse)  # type: ignore
-def indicators(
+async def indicators(
     indicator_type: IndicatorTypeRegex,
     last: PeriodRegex,
+    if_none_match: Optional[Text] = Header(None),
     args: argparse.Namespace = Depends(parse_args),
-) -> PlainTextResponse:
+) -> Response:
     """Download indicators
 
     Allowed indicator types:
@@ -219,6 +1072,10 @@ def indicators(
 
     OR <EPOC> (only digits) where the EPOC is a unix timestamp in milliseconds
 
+    Indicators are cached, and refreshed in the background after
+    --indicators-cache-ttl seconds. Send the ETag of a previous response in
+    If-None-Match to get 304 Not Modified if the indicators are unchanged.
+
     """
 
     if not args.elasticsearch_client:
@@ -232,41 +1089,155 @@ def indicators(
 
     term = f"indicators.{indicator_type}.keyword"
 
-    res = act.scio.es.aggregation(
-        args.elasticsearch_client,
-        term=term,
-        start=start,
-        end="now",
+    def export() -> AsyncIterator[bytes]:
+        return lines(
+            act.scio.es.async_aggregation(
+                args.elasticsearch_client,
+                term=term,
+                start=start,
+                end="now",
+            )
+        )
+
+    if not args.indicators_cache:
+        return StreamingResponse(export(), media_type="text/plain")
+
+    entry = await args.indicators_cache.get(
+        (indicator_type, normalize_period(last)), export
     )
 
-    return PlainTextResponse("\n".join(row[0] for row in res))
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"max-age={args.indicators_cache_ttl}",
+    }
+
+    if etag_match(if_none_match, entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    return FileResponse(entry.filename, media_type="text/plain", headers=headers)
+
+
+@app.get(
+    "/indicators/{indicator_type}/feed", response_class=PlainTextResponse
+)  # type: ignore
+async def indicator_feed(
+    indicator_type: IndicatorTypeRegex,
+    cursor: Optional[CursorRegex] = None,
+    limit: int = Query(10000, ge=1, le=10000),
+    args: argparse.Namespace = Depends(parse_args),
+) -> PlainTextResponse:
+    """Download indicators first seen after cursor
+
+    Returns up to `limit` indicators, ordered by the time they were first
+    seen. The `X-Scio-Cursor` response header contains the cursor to use in
+    the next request, to get indicators first seen after the last indicator
+    in this response. Without cursor, indicators are returned from the start.
+
+    The cursor can also be a unix timestamp in milliseconds, to get
+    indicators first seen after that time.
+
+    """
+
+    if not args.elasticsearch_client:
+        raise HTTPException(status_code=412, detail="Elasticsearch is not configured")
+
+    after, after_id = None, None
+    if cursor:
+        after_str, _, after_id = cast(Text, cursor).partition("-")
+        after = int(after_str)
+
+    before = int((time.time() - args.indicators_feed_delay) * 1000)
+
+    try:
+        res = await act.scio.es.async_first_seen(
+            args.elasticsearch_client,
+            indicator_type,
+            before=before,
+            after=after,
+            after_id=after_id,
+            size=limit,
+            index=args.first_seen_index,
+        )
+    except elasticsearch.exceptions.NotFoundError:
+        # No indicators stored yet
+        res = []
+
+    if res:
+        _, first_seen, doc_id = res[-1]
+        cursor = CursorRegex(f"{first_seen}-{doc_id}")
+
+    return PlainTextResponse(
+        "\n".join(value for value, _, _ in res),
+        headers={"X-Scio-Cursor": cursor or "0"},
+    )
+
+
+@app.get("/metrics", response_class=PlainTextResponse)  # type: ignore
+async def metrics(args: argparse.Namespace = Depends(parse_args)) -> PlainTextResponse:
+    """Metrics in Prometheus text format"""
+
+    metric_lines = []
+
+    if args.queue_monitor:
+        metric_lines += [
+            "# HELP scio_queue_jobs_ready Jobs ready in beanstalk tube",
+            "# TYPE scio_queue_jobs_ready gauge",
+        ]
+        metric_lines += [
+            f'scio_queue_jobs_ready{{tube="{tube}"}} {jobs}'
+            for tube, jobs in sorted(args.queue_monitor.jobs_ready.items())
+        ]
+        metric_lines += [
+            "# HELP scio_queue_sample_age_seconds Seconds since the queue was sampled",
+            "# TYPE scio_queue_sample_age_seconds gauge",
+            f"scio_queue_sample_age_seconds {args.queue_monitor.age():.3f}",
+        ]
+
+    return PlainTextResponse(
+        "\n".join(metric_lines) + "\n", media_type="text/plain; version=0.0.4"
+    )
 
 
 @app.get("/download")  # type: ignore
-def download(
+async def download(
     id: SHA256Regex,
     args: argparse.Namespace = Depends(parse_args),
 ) -> Response:
-    """Download document as original content"""
-    res = document_lookup(id, args.elasticsearch_client)
+    """Download document as original content
+
+    Supports range requests, e.g. to resume downloads of large documents.
+
+    """
+    res = await resolve_document(id, args)
 
     if not Path(res.filename).is_file():
         return Response(content="File not found", media_type="application/text")
 
+    filename = await asyncio.get_running_loop().run_in_executor(
+        None, args.document_store.original_filename, id
+    )
+
+    if not filename:
+        filename = PurePath(res.filename).name
+
+        if not PurePath(filename).suffix:
+            # Content addressed documents are stored without file extension
+            filename += mimetypes.guess_extension(res.content_type) or ""
+
     return FileResponse(
         res.filename,
-        filename=PurePath(res.filename).name,
+        filename=filename,
         media_type=res.content_type,
     )
 
 
-@app.get("/download_json")  # type: ignore
-def download_json(
+@app.get("/download_json", response_model=None)  # type: ignore
+async def download_json(
     id: SHA256Regex,
     args: argparse.Namespace = Depends(parse_args),
-) -> Dict[Text, Any]:
+) -> Union[Dict[Text, Any], StreamingResponse]:
     """Download document base64 decoded in json struct"""
-    res = document_lookup(id, args.elasticsearch_client)
+    res = await resolve_document(id, args)
 
     if not Path(res.filename).is_file():
         return {
@@ -274,14 +1245,23 @@ def download_json(
             "bytes": 0,
         }
 
-    content = open(res.filename, "rb").read()
+    size = os.path.getsize(res.filename)
 
-    return {
-        "error": None,
-        "bytes": len(content),
-        "content": base64.b64encode(content),
-        "encoding": "base64",
-    }
+    # Same JSON document as before, with the content base64 encoded in chunks
+    prefix = f'{{"error":null,"bytes":{size},"content":"'.encode("utf8")
+    suffix = b'","encoding":"base64"}'
+
+    async def body() -> AsyncIterator[bytes]:
+        yield prefix
+        async for chunk in base64_chunks(res.filename):
+            yield chunk
+        yield suffix
+
+    return StreamingResponse(
+        body(),
+        media_type="application/json",
+        headers={"Content-Length": str(len(prefix) + 4 * -(-size // 3) + len(suffix))},
+    )
 
 
 def main() -> None:
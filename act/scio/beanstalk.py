@@ -0,0 +1,113 @@
+"""Asyncio beanstalk client for scio"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Text,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
+
+import greenstalk
+
+T = TypeVar("T")
+
+
+class AsyncBeanstalk:
+    """Asyncio wrapper around greenstalk.Client.
+
+    The blocking greenstalk calls are run in a thread owned by the client, so
+    they do not block the event loop. There is only one thread per client, so
+    the connection is never used by more than one call at a time. Use one
+    client per worker to reserve jobs concurrently."""
+
+    def __init__(
+        self,
+        address: Tuple[Text, int],
+        use: Optional[Text] = None,
+        watch: Optional[Text] = None,
+        encoding: Optional[Text] = None,
+    ) -> None:
+        """
+        Args:
+            address:   (host, port) of beanstalkd
+            use:       Tube used for put
+            watch:     Tube to reserve jobs from. The default tube is ignored
+            encoding:  Encoding of job bodies, None to use bytes
+        """
+        self.client = greenstalk.Client(
+            address,
+            encoding=encoding,
+            use=use or greenstalk.DEFAULT_TUBE,
+            watch=watch or greenstalk.DEFAULT_TUBE,
+        )
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    async def _call(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run func in the client thread"""
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
+
+    async def reserve(self, timeout: Optional[int] = None) -> greenstalk.Job:
+        """Reserve job. Raises greenstalk.TimedOutError if no job is
+        ready within timeout"""
+        return await self._call(self.client.reserve, timeout=timeout)
+
+    async def put(self, body: Union[bytes, Text], **kwargs: Any) -> int:
+        """Put job on the used tube, return job id"""
+        return await self._call(self.client.put, body, **kwargs)
+
+    async def put_many(
+        self, bodies: List[Union[bytes, Text]], **kwargs: Any
+    ) -> List[Union[int, Exception]]:
+        """Put jobs on the used tube in one call to the client thread. Returns
+        the job id, or the exception if put failed, for each job"""
+        return await self._call(self._put_many, bodies, **kwargs)
+
+    def _put_many(
+        self, bodies: List[Union[bytes, Text]], **kwargs: Any
+    ) -> List[Union[int, Exception]]:
+        """Put jobs, run in the client thread"""
+        res: List[Union[int, Exception]] = []
+        for body in bodies:
+            try:
+                res.append(self.client.put(body, **kwargs))  # type: ignore
+            except (greenstalk.Error, OSError) as e:
+                res.append(e)
+        return res
+
+    async def delete(self, job: Union[greenstalk.Job, int]) -> None:
+        """Delete job"""
+        await self._call(self.client.delete, job)
+
+    async def release(self, job: greenstalk.Job, **kwargs: Any) -> None:
+        """Release job back to the ready queue"""
+        await self._call(self.client.release, job, **kwargs)
+
+    async def tubes(self) -> List[Text]:
+        """List existing tubes"""
+        return await self._call(self.client.tubes)
+
+    async def stats(self) -> Dict[Text, Any]:
+        """Server statistics"""
+        return cast(Dict[Text, Any], await self._call(self.client.stats))
+
+    async def stats_tube(self, tube: Text) -> Dict[Text, Any]:
+        """Statistics for tube"""
+        return cast(Dict[Text, Any], await self._call(self.client.stats_tube, tube))
+
+    def close(self) -> None:
+        """Close connection and stop the client thread"""
+        self.client.close()
+        self.executor.shutdown(wait=False)
@@ -25,9 +25,10 @@ from typing import Optional, Text
 
 import caep
 import greenstalk
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch
 
 import act.scio.es
+from act.scio.beanstalk import AsyncBeanstalk
 
 
 def parse_args(description: Text) -> argparse.ArgumentParser:
@@ -48,6 +49,25 @@ def parse_args(description: Text) -> argparse.ArgumentParser:
     parser.add_argument(
         "--elasticsearch-port", type=int, default=9200, help="Default 9200"
     )
+    parser.add_argument(
+        "--elasticsearch-timeout",
+        type=int,
+        default=180,
+        help="Elasticsearch request timeout in seconds (default=180)",
+    )
+    parser.add_argument(
+        "--elasticsearch-retries",
+        type=int,
+        default=3,
+        help="Retry failed elasticsearch requests (including timeouts) "
+        + "this many times (default=3)",
+    )
+    parser.add_argument(
+        "--elasticsearch-connections",
+        type=int,
+        default=10,
+        help="Max concurrent connections to each elasticsearch node (default=10)",
+    )
     parser.add_argument(
         "--config-dir",
         default=caep.get_config_dir("scio"),
@@ -75,6 +95,20 @@ def beanstalk_client(
     return client
 
 
+def async_beanstalk_client(
+    args: argparse.Namespace, use: Optional[Text] = None, watch: Optional[Text] = None
+) -> Optional[AsyncBeanstalk]:
+    """Return asyncio beanstalk client if args.beanstalk, otherwise, return None"""
+    client = None
+    if args.beanstalk:
+        logging.info("Connection to beanstalk")
+        client = AsyncBeanstalk(
+            (args.beanstalk, args.beanstalk_port), use=use, watch=watch
+        )
+
+    return client
+
+
 def elasticsearch_client(
     args: argparse.Namespace,
 ) -> Optional[Elasticsearch]:
@@ -86,6 +120,28 @@ def elasticsearch_client(
             port=args.elasticsearch_port,
             username=args.elasticsearch_user,
             password=args.elasticsearch_password,
+            timeout=args.elasticsearch_timeout,
+            max_retries=args.elasticsearch_retries,
+            connections=args.elasticsearch_connections,
+        )
+    return None
+
+
+def async_elasticsearch_client(
+    args: argparse.Namespace,
+) -> Optional[AsyncElasticsearch]:
+    """Return asyncio elasticsearch client if args.elasticsearch, otherwise,
+    return None"""
+    if args.elasticsearch:
+        logging.info("Connection to elasticsearch")
+        return act.scio.es.async_es_client(
+            host=args.elasticsearch,
+            port=args.elasticsearch_port,
+            username=args.elasticsearch_user,
+            password=args.elasticsearch_password,
+            timeout=args.elasticsearch_timeout,
+            max_retries=args.elasticsearch_retries,
+            connections=args.elasticsearch_connections,
         )
     return None
 
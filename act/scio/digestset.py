@@ -0,0 +1,133 @@
+"""Set of recently submitted documents.
+
+The hexdigest of each submitted document is stored in a sqlite database, so
+duplicates are detected across restarts of the API, with the most recently
+submitted digests also kept in memory. Digests expire after a time to live,
+so documents can be analyzed again later (e.g. with new plugins)."""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Text
+
+# Number of digests kept in memory
+MEMORY_SIZE = 100000
+
+# Remove expired digests from the database every this many seconds
+EXPIRE_INTERVAL = 3600
+
+
+class DigestSet:
+    """Set of document digests, with time to live. Thread safe"""
+
+    def __init__(self, filename: Text, ttl: float) -> None:
+        """
+        Args:
+            filename:  sqlite database file
+            ttl:       Seconds a digest is kept in the set
+        """
+
+        self.filename = filename
+        self.ttl = ttl
+        self.lock = threading.Lock()
+
+        # Digest -> time added, in the order they were added
+        self.memory: "OrderedDict[Text, float]" = OrderedDict()
+        self.expired = time.time()
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        logging.info("Using submitted document database %s", filename)
+
+        self.conn = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS digest (
+                   hexdigest text PRIMARY KEY,
+                   added real NOT NULL);""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS digest_added ON digest (added)")
+        self.conn.commit()
+
+    def add(self, hexdigest: Text) -> bool:
+        """Add digest to the set. Returns False if the digest is already in
+        the set, True if it is added"""
+
+        now = time.time()
+
+        with self.lock:
+            added = self.added(hexdigest)
+
+            if added is not None and now - added < self.ttl:
+                self.remember(hexdigest, added)
+                return False
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO digest VALUES (?, ?)", (hexdigest, now)
+            )
+            self.conn.commit()
+            self.remember(hexdigest, now)
+
+            if now - self.expired > EXPIRE_INTERVAL:
+                self.expire(now)
+
+        return True
+
+    def contains(self, hexdigest: Text) -> bool:
+        """Check whether digest is in the set"""
+
+        now = time.time()
+
+        with self.lock:
+            added = self.added(hexdigest)
+
+        return added is not None and now - added < self.ttl
+
+    def added(self, hexdigest: Text) -> Optional[float]:
+        """Time digest was added, None if not added. Must be called with
+        the lock held"""
+
+        added = self.memory.get(hexdigest)
+
+        if added is None:
+            row = self.conn.execute(
+                "SELECT added FROM digest WHERE hexdigest = ?", (hexdigest,)
+            ).fetchone()
+            added = row[0] if row else None
+
+        return added
+
+    def discard(self, hexdigest: Text) -> None:
+        """Remove digest from the set, e.g. if the document could not be
+        submitted"""
+
+        with self.lock:
+            self.memory.pop(hexdigest, None)
+            self.conn.execute("DELETE FROM digest WHERE hexdigest = ?", (hexdigest,))
+            self.conn.commit()
+
+    def remember(self, hexdigest: Text, added: float) -> None:
+        """Keep digest in memory. Must be called with the lock held"""
+
+        self.memory[hexdigest] = added
+        self.memory.move_to_end(hexdigest)
+
+        if len(self.memory) > MEMORY_SIZE:
+            self.memory.popitem(last=False)
+
+    def expire(self, now: float) -> None:
+        """Remove expired digests from the database. Must be called with the
+        lock held"""
+
+        self.conn.execute("DELETE FROM digest WHERE added < ?", (now - self.ttl,))
+        self.conn.commit()
+        self.expired = now
+
+    def close(self) -> None:
+        """Close database"""
+
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,147 @@
+"""Content addressed document storage.
+
+Documents are stored by the sha256 hexdigest of their content, in two levels
+of directories from the start of the digest (ab/cd/abcd...), so no directory
+gets too many entries. Documents that should not be stored (and are removed
+after they are analyzed) are stored the same way under NOSTORE. Documents
+are written to a temporary file that is renamed when complete, and a
+document that is already stored is not written again. If it is stored in
+the other location, it is hard linked instead of copied.
+
+The filename a stored document was first submitted with is kept next to the
+document, in a file with the same name and the suffix ".name"."""
+
+import logging
+import os
+import uuid
+from pathlib import Path
+from typing import Optional, Text
+
+NAME_SUFFIX = ".name"
+
+
+class DocumentStore:
+    """Content addressed document storage"""
+
+    def __init__(self, root: Path) -> None:
+        """
+        Args:
+            root:  Storage directory
+        """
+
+        self.root = root
+        self.tmp_dir = root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def path(self, hexdigest: Text, store: bool = True) -> Path:
+        """Path of document"""
+
+        hexdigest = hexdigest.lower()
+        root = self.root if store else self.root / "NOSTORE"
+
+        return root / hexdigest[0:2] / hexdigest[2:4] / hexdigest
+
+    def tmp_file(self) -> Path:
+        """Temporary file to write a document to, before it is added"""
+
+        return self.tmp_dir / f"{uuid.uuid4().hex}.part"
+
+    def add(
+        self,
+        tmp_file: Path,
+        hexdigest: Text,
+        store: bool = True,
+        original_filename: Optional[Text] = None,
+    ) -> Path:
+        """Add document written to tmp_file (on the same file system) with
+        the hexdigest of the content. Returns the path of the document"""
+
+        path = self._link(tmp_file, hexdigest, store)
+
+        if store and original_filename:
+            self.add_filename(path, original_filename)
+
+        return path
+
+    def _link(self, tmp_file: Path, hexdigest: Text, store: bool) -> Path:
+        """Move tmp_file to the path of the document, unless it is already
+        stored. Returns the path of the document"""
+
+        path = self.path(hexdigest, store)
+        other = self.path(hexdigest, not store)
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.is_file():
+            # Already stored
+            tmp_file.unlink()
+            return path
+
+        if other.is_file():
+            try:
+                os.link(other, path)
+                tmp_file.unlink()
+                return path
+            except FileExistsError:
+                # Added by another request
+                tmp_file.unlink()
+                return path
+            except OSError as e:
+                # E.g. removed after the check, or no hard link support
+                logging.info("Unable to link %s to %s: %s", other, path, e)
+
+        os.replace(tmp_file, path)
+
+        return path
+
+    def add_filename(self, path: Path, original_filename: Text) -> None:
+        """Store the filename of the document at path, unless the document
+        already has a filename"""
+
+        name_file = path.with_name(path.name + NAME_SUFFIX)
+
+        if name_file.is_file():
+            return
+
+        tmp_file = self.tmp_file()
+        tmp_file.write_text(original_filename, encoding="utf8")
+        os.replace(tmp_file, name_file)
+
+    def write(
+        self,
+        content: bytes,
+        hexdigest: Text,
+        store: bool = True,
+        original_filename: Optional[Text] = None,
+    ) -> Path:
+        """Add document content with the hexdigest of the content. Returns
+        the path of the document"""
+
+        tmp_file = self.tmp_file()
+
+        try:
+            with open(tmp_file, "wb") as f:
+                f.write(content)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+
+        return self.add(tmp_file, hexdigest, store, original_filename)
+
+    def lookup(self, hexdigest: Text) -> Optional[Path]:
+        """Path of stored document, None if the document is not stored"""
+
+        path = self.path(hexdigest)
+
+        return path if path.is_file() else None
+
+    def original_filename(self, hexdigest: Text) -> Optional[Text]:
+        """Filename the stored document was submitted with, None if the
+        document is not stored or the filename is not known"""
+
+        path = self.path(hexdigest)
+
+        try:
+            return path.with_name(path.name + NAME_SUFFIX).read_text(encoding="utf8")
+        except FileNotFoundError:
+            return None
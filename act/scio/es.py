@@ -18,9 +18,70 @@ PERFORMANCE OF THIS SOFTWARE.
 Elasticsearch utilities for scio
 """
 
-from typing import Iterator, Optional, Text, Tuple
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Text,
+    Tuple,
+)
 
-from elasticsearch import Elasticsearch
+from elasticsearch import AsyncElasticsearch, Elasticsearch, helpers
+
+# Max seconds between retries of failed bulk requests
+MAX_BACKOFF = 300
+
+# Number of terms fetched per request when paging through aggregations
+COMPOSITE_PAGE_SIZE = 10000
+
+# Index with the time each indicator was first seen
+FIRST_SEEN_INDEX = "scio2-first-seen"
+
+# Number of indicators the first seen writer remembers, to avoid sending
+# indicators that already exist
+SEEN_CACHE_SIZE = 100000
+
+
+def client_options(
+    host: Text,
+    port: int = 9200,
+    url_prefix: Optional[Text] = None,
+    username: Optional[Text] = None,
+    password: Optional[Text] = None,
+    timeout: int = 180,
+    max_retries: int = 3,
+    connections: int = 10,
+) -> Dict[Text, Any]:
+    """Options shared by the sync and asyncio elasticsearch clients"""
+
+    connection: Dict[Text, Any] = {"host": host, "port": port, "scheme": "http"}
+
+    if url_prefix:
+        connection["path_prefix"] = url_prefix
+
+    options: Dict[Text, Any] = {
+        "hosts": [connection],
+        "request_timeout": timeout,
+        "max_retries": max_retries,
+        "retry_on_timeout": max_retries > 0,
+        "connections_per_node": connections,
+    }
+
+    if username or password:
+        options["basic_auth"] = (username or "", password or "")
+
+    return options
 
 
 def es_client(
@@ -30,23 +91,84 @@ def es_client(
     username: Optional[Text] = None,
     password: Optional[Text] = None,
     timeout: int = 180,
+    max_retries: int = 3,
+    connections: int = 10,
 ) -> Elasticsearch:
     """Elasticsearch client"""
 
-    connection = {"host": host, "port": port, "scheme": "http"}
+    return Elasticsearch(
+        **client_options(
+            host,
+            port,
+            url_prefix,
+            username,
+            password,
+            timeout,
+            max_retries,
+            connections,
+        )
+    )
 
-    if url_prefix:
-        connection["url_prefx"] = url_prefix
 
-    if username or password:
-        http_auth: Optional[Tuple[Optional[Text], Optional[Text]]] = (
+def async_es_client(
+    host: Text,
+    port: int = 9200,
+    url_prefix: Optional[Text] = None,
+    username: Optional[Text] = None,
+    password: Optional[Text] = None,
+    timeout: int = 180,
+    max_retries: int = 3,
+    connections: int = 10,
+) -> AsyncElasticsearch:
+    """Asyncio elasticsearch client (requires aiohttp). Up to connections
+    requests are sent concurrently to each node, failed requests (including
+    timeouts) are retried max_retries times on another connection"""
+
+    return AsyncElasticsearch(
+        **client_options(
+            host,
+            port,
+            url_prefix,
             username,
             password,
+            timeout,
+            max_retries,
+            connections,
         )
-    else:
-        http_auth = None
+    )
+
+
+def aggregation_query(
+    term: Text,
+    start: Text,
+    end: Text,
+    size: int = COMPOSITE_PAGE_SIZE,
+    after: Optional[Dict[Text, Any]] = None,
+) -> Dict[Text, Any]:
+    """Composite aggregation on term for documents analyzed between start and
+    end. Returns one page of size buckets, starting after the after_key
+    returned with the previous page"""
+
+    composite: Dict[Text, Any] = {
+        "size": size,
+        "sources": [{term: {"terms": {"field": term}}}],
+    }
 
-    return Elasticsearch([connection], timeout=timeout, http_auth=http_auth)
+    if after:
+        composite["after"] = after
+
+    return {
+        "size": 0,
+        "query": {
+            "range": {
+                "Analyzed-Date": {
+                    "gte": start,
+                    "lte": end,
+                }
+            }
+        },
+        "aggs": {term: {"composite": composite}},
+    }
 
 
 def aggregation(
@@ -56,28 +178,448 @@ def aggregation(
     end: Text,
     missing: bool = False,
     index: Text = "scio2",
+    size: int = COMPOSITE_PAGE_SIZE,
 ) -> Iterator[Tuple[Text, int]]:
-    """Aggregation"""
+    """Aggregation. Yields (term, document count) for all terms, fetched
+    size terms at a time"""
+
+    after = None
+
+    while True:
+        response = client.search(
+            index=index, body=aggregation_query(term, start, end, size, after)
+        )
+        aggr = response["aggregations"][term]
+
+        for bucket in aggr["buckets"]:
+            yield bucket["key"][term], bucket["doc_count"]
+
+        after = aggr.get("after_key")
+        if not after or len(aggr["buckets"]) < size:
+            break
+
+
+async def async_aggregation(
+    client: AsyncElasticsearch,
+    term: Text,
+    start: Text,
+    end: Text,
+    index: Text = "scio2",
+    size: int = COMPOSITE_PAGE_SIZE,
+) -> AsyncIterator[Tuple[Text, int]]:
+    """Aggregation, using the asyncio client"""
+
+    after = None
+
+    while True:
+        response = await client.search(
+            index=index, body=aggregation_query(term, start, end, size, after)
+        )
+        aggr = response["aggregations"][term]
+
+        for bucket in aggr["buckets"]:
+            yield bucket["key"][term], bucket["doc_count"]
+
+        after = aggr.get("after_key")
+        if not after or len(aggr["buckets"]) < size:
+            break
+
+
+def indicator_id(indicator_type: Text, value: Text) -> Text:
+    """Document id of indicator in the first seen index"""
+
+    return hashlib.sha256(f"{indicator_type}:{value}".encode("utf8")).hexdigest()
+
+
+async def async_first_seen(
+    client: AsyncElasticsearch,
+    indicator_type: Text,
+    before: int,
+    after: Optional[int] = None,
+    after_id: Optional[Text] = None,
+    size: int = 10000,
+    index: Text = FIRST_SEEN_INDEX,
+) -> List[Tuple[Text, int, Text]]:
+    """Indicators first seen after the cursor (after, after_id) and before
+    (both milliseconds since epoch), ordered by first seen time. Returns
+    list of (value, first seen, id), where the last entry is the next cursor"""
+
+    query: Dict[Text, Any] = {
+        "size": size,
+        "query": {
+            "bool": {
+                "filter": [
+                    {"term": {"type.keyword": indicator_type}},
+                    {"range": {"first_seen": {"lte": before}}},
+                ]
+            }
+        },
+        "sort": [{"first_seen": "asc"}, {"id.keyword": "asc"}],
+    }
+
+    if after is not None and after_id:
+        query["search_after"] = [after, after_id]
+    elif after is not None:
+        query["query"]["bool"]["filter"].append(
+            {"range": {"first_seen": {"gt": after}}}
+        )
+
+    response = await client.search(index=index, body=query)
+
+    return [
+        (hit["_source"]["value"], hit["_source"]["first_seen"], hit["_source"]["id"])
+        for hit in response["hits"]["hits"]
+    ]
+
+
+# Add uri and owner to the lists of uris and owners of a document, if they
+# are not the uri or owner of the document already
+MERGE_SCRIPT = """
+boolean changed = false;
+for (field in ["uri", "owner"]) {
+    def value = params[field];
+    String list = field + "s";
+    if (value == null || value == ctx._source[field]) {
+        continue;
+    }
+    if (ctx._source[list] == null) {
+        ctx._source[list] = new ArrayList();
+    }
+    if (!ctx._source[list].contains(value)) {
+        ctx._source[list].add(value);
+        changed = true;
+    }
+}
+if (!changed) {
+    ctx.op = "noop";
+}
+"""
 
-    response = client.search(
+
+async def async_merge_metadata(
+    client: AsyncElasticsearch,
+    hexdigest: Text,
+    uri: Optional[Text],
+    owner: Optional[Text],
+    index: Text = "scio2",
+) -> None:
+    """Add uri and owner of a resubmitted document to the stored document
+    (in the uris and owners fields)"""
+
+    await client.update(
         index=index,
-        body={
-            "size": 0,
-            "query": {
-                "range": {
-                    "Analyzed-Date": {
-                        "gte": start,
-                        "lte": end,
-                    }
-                }
-            },
-            "aggs": {
-                term: {
-                    "terms": {"field": term},
-                }
-            },
+        id=hexdigest,
+        script={
+            "source": MERGE_SCRIPT,
+            "lang": "painless",
+            "params": {"uri": uri, "owner": owner},
         },
     )
 
-    for aggr in response["aggregations"][term]["buckets"]:
-        yield aggr["key"], aggr["doc_count"]
+
+class BulkItem(NamedTuple):
+    """Document waiting to be indexed"""
+
+    doc_id: Text
+    body: bytes
+    spool_file: Optional[Text] = None
+
+
+class BulkWriter:
+    """Index documents with the bulk API from a background thread.
+
+    Documents are sent when batch_size documents are waiting, or flush_interval
+    seconds after the last batch. Failed documents are retried with exponential
+    backoff, and written to the spool directory if they still fail (or if the
+    writer is closed while waiting to retry). Documents in the spool directory are
+    indexed again when the writer is started, and are queued as there is room
+    for them.
+
+    At most max_pending documents are kept in memory. add() blocks when the
+    writer is full (e.g. while elasticsearch is unavailable), so the analyze
+    workers slow down instead of using memory without limit."""
+
+    # Bulk operation. With "create", documents that already exist are not
+    # changed, and are not reported as failed
+    op_type = "index"
+
+    def __init__(
+        self,
+        client: Elasticsearch,
+        index: Text = "scio2",
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_retries: int = 5,
+        initial_backoff: float = 2.0,
+        spool_dir: Optional[Text] = None,
+        max_pending: Optional[int] = None,
+    ) -> None:
+        self.client = client
+        self.index = index
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.spool_dir = spool_dir
+        self.max_pending = max(max_pending or batch_size * 10, batch_size)
+
+        self.pending: List[BulkItem] = []
+        # Spooled documents that are not queued yet, last file first
+        self.spool_files: List[Text] = []
+        self.condition = threading.Condition()
+        self.closing = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+        self.indexed = 0
+        self.spooled = 0
+
+    def start(self) -> None:
+        """Queue spooled documents and start the writer thread"""
+
+        if self.spool_dir:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            self.spool_files = [
+                os.path.join(self.spool_dir, filename)
+                for filename in sorted(os.listdir(self.spool_dir), reverse=True)
+                if filename.endswith(".json")
+            ]
+
+            if self.spool_files:
+                logging.info("Indexing %s spooled documents", len(self.spool_files))
+
+            with self.condition:
+                self.load_spooled()
+
+        self.thread = threading.Thread(target=self.run, name="bulk-writer", daemon=True)
+        self.thread.start()
+
+    def load_spooled(self) -> None:
+        """Queue spooled documents while there is room for them. Must be called
+        with the condition held"""
+
+        while self.spool_files and len(self.pending) < self.max_pending:
+            spool_file = self.spool_files.pop()
+            try:
+                with open(spool_file, "rb") as f:
+                    body = f.read()
+            except FileNotFoundError:
+                continue
+            doc_id = os.path.basename(spool_file)[: -len(".json")]
+            self.pending.append(BulkItem(doc_id, body, spool_file))
+
+    def add(self, doc_id: Text, document: Dict[Text, Any]) -> None:
+        """Queue document for indexing. Documents added after close() are
+        spooled"""
+
+        item = BulkItem(doc_id, json.dumps(document).encode("utf8"))
+
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.closing.is_set() or len(self.pending) < self.max_pending
+            )
+            if not self.closing.is_set():
+                self.pending.append(item)
+                if len(self.pending) >= self.batch_size:
+                    # Both the writer thread and blocked add() wait for the
+                    # condition
+                    self.condition.notify_all()
+                return
+
+        # The writer thread may already be stopped
+        self.spool(item, {"error": "Added after close"})
+
+    def run(self) -> None:
+        """Send batches until closed and there are no pending documents"""
+
+        while True:
+            with self.condition:
+                self.condition.wait_for(
+                    lambda: self.closing.is_set()
+                    or len(self.pending) >= self.batch_size,
+                    timeout=self.flush_interval,
+                )
+                batch = self.pending[: self.batch_size]
+                del self.pending[: self.batch_size]
+                if not self.closing.is_set():
+                    # Spooled documents not queued yet are left in the spool
+                    # directory on shutdown
+                    self.load_spooled()
+                self.condition.notify_all()
+
+                if not batch and self.closing.is_set():
+                    return
+
+            if batch:
+                self.flush(batch)
+
+    def flush(self, batch: List[BulkItem]) -> None:
+        """Index batch, retrying failed documents. Documents that can not be
+        indexed are spooled"""
+
+        attempt = 0
+
+        while batch:
+            failed = self.send(batch)
+
+            for item in set(batch) - {item for item, _ in failed}:
+                self.indexed += 1
+                if item.spool_file:
+                    os.unlink(item.spool_file)
+
+            retry = []
+            for item, error in failed:
+                if error.get("retry") and attempt < self.max_retries:
+                    retry.append(item)
+                else:
+                    self.spool(item, error)
+
+            batch = retry
+
+            if batch:
+                backoff = min(self.initial_backoff * 2**attempt, MAX_BACKOFF)
+                logging.warning(
+                    "%s documents failed to index, retrying in %s seconds",
+                    len(batch),
+                    backoff,
+                )
+                attempt += 1
+                # On shutdown, spool instead of waiting for retries. Without a
+                # spool directory, retry without waiting
+                if self.closing.wait(backoff) and self.spool_dir:
+                    for item in batch:
+                        self.spool(item, {"error": "Closed before indexed"})
+                    return
+
+    def send(self, batch: List[BulkItem]) -> List[Tuple[BulkItem, Dict[Text, Any]]]:
+        """Send batch with the bulk API. Returns the failed documents with
+        the error, where "retry" is set if the document may succeed later"""
+
+        items = {item.doc_id: item for item in batch}
+
+        failed: List[Tuple[BulkItem, Dict[Text, Any]]] = []
+
+        try:
+            for ok, info in helpers.streaming_bulk(
+                self.client,
+                batch,  # type: ignore
+                chunk_size=len(batch),
+                expand_action_callback=self.action,  # type: ignore
+                raise_on_error=False,
+                raise_on_exception=False,
+                # Failed documents are retried by flush(), where the backoff
+                # can be interrupted by close()
+                max_retries=0,
+                yield_ok=False,
+            ):
+                result = info.get(self.op_type, {})
+                status = result.get("status")
+                if self.op_type == "create" and status == 409:
+                    # Document already exists
+                    continue
+                failed.append(
+                    (
+                        items[result["_id"]],
+                        {
+                            "error": result.get("error"),
+                            "status": status,
+                            "retry": not status or status == 429 or status >= 500,
+                        },
+                    )
+                )
+        except Exception as e:
+            # E.g. connection errors
+            logging.error("Bulk request to elasticsearch failed: %s", e)
+            return [(item, {"error": str(e), "retry": True}) for item in batch]
+
+        return failed
+
+    def action(self, item: BulkItem) -> Tuple[Dict[Text, Any], bytes]:
+        """Bulk action and document for item"""
+
+        return {self.op_type: {"_index": self.index, "_id": item.doc_id}}, item.body
+
+    def spool(self, item: BulkItem, error: Dict[Text, Any]) -> None:
+        """Write document that could not be indexed to the spool directory"""
+
+        self.spooled += 1
+
+        if not self.spool_dir:
+            logging.error(
+                "Unable to index %s, document is lost: %s", item.doc_id, error
+            )
+            return
+
+        spool_file = os.path.join(
+            self.spool_dir, os.path.basename(item.doc_id) + ".json"
+        )
+
+        logging.error(
+            "Unable to index %s, spooled to %s: %s", item.doc_id, spool_file, error
+        )
+
+        if item.spool_file == spool_file:
+            return
+
+        tmp_file = spool_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(item.body)
+        os.replace(tmp_file, spool_file)
+
+    def close(self) -> None:
+        """Send pending documents and stop the writer thread"""
+
+        self.closing.set()
+        with self.condition:
+            self.condition.notify_all()
+
+        if self.thread:
+            self.thread.join()
+
+        logging.info(
+            "Bulk writer closed, indexed=%s spooled=%s", self.indexed, self.spooled
+        )
+
+
+class FirstSeenWriter(BulkWriter):
+    """Bulk writer for the first seen index. Indicators are only created
+    once, and first_seen is set when the indicator is sent, so indicators
+    that are retried or spooled are not older than the time they can be
+    found in the index"""
+
+    op_type = "create"
+
+    def __init__(self, client: Elasticsearch, **kwargs: Any) -> None:
+        kwargs.setdefault("index", FIRST_SEEN_INDEX)
+        super().__init__(client, **kwargs)
+
+        # Recently added indicators, that are not sent again. Indicators are
+        # added from several threads
+        self.seen: "OrderedDict[Text, None]" = OrderedDict()
+        self.seen_lock = threading.Lock()
+
+    def add_indicator(self, indicator_type: Text, value: Text) -> None:
+        """Queue indicator, if it is not seen before"""
+
+        doc_id = indicator_id(indicator_type, value)
+
+        with self.seen_lock:
+            if doc_id in self.seen:
+                self.seen.move_to_end(doc_id)
+                return
+
+            self.seen[doc_id] = None
+            if len(self.seen) > SEEN_CACHE_SIZE:
+                self.seen.popitem(last=False)
+
+        self.add(doc_id, {"id": doc_id, "type": indicator_type, "value": value})
+
+    def action(self, item: BulkItem) -> Tuple[Dict[Text, Any], bytes]:
+        """Bulk action and document with first_seen set to now"""
+
+        document = json.loads(item.body)
+        document["first_seen"] = int(time.time() * 1000)
+
+        return (
+            {self.op_type: {"_index": self.index, "_id": item.doc_id}},
+            json.dumps(document).encode("utf8"),
+        )
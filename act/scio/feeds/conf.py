@@ -55,6 +55,12 @@ def get_args() -> argparse.Namespace:
         + "Set to empty value to not upload files.",
         default="http://localhost:3000/submit",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="Number of files uploaded to scio in each request. Default=50",
+    )
     parser.add_argument(
         "--stoplist",
         default=caep.get_config_dir("scio/etc/secstoplist.txt"),
@@ -24,7 +24,7 @@ import datetime
 import hashlib
 import logging
 import os
-from typing import Dict, List, Text
+from typing import Any, Dict, List, Text, Tuple
 
 import urllib3
 
@@ -45,29 +45,64 @@ def sha256_of_file(filename: Text) -> Text:
 
 
 def upload_uncached_files(
-    cache_file: Text, files: List[Dict[Text, Text]], scio_url: Text, tlp: Text
+    cache_file: Text,
+    files: List[Dict[Text, Text]],
+    scio_url: Text,
+    tlp: Text,
+    batch_size: int = 50,
 ) -> int:
     """Check each downloaded file hexdigest against a cache of previously uploaded
-    files. Only upload "new" files."""
+    files. Only upload "new" files, batch_size files in each request."""
 
     mycache = cache.Cache(cache_file)
 
-    nup = 0
+    new_files: List[Tuple[Dict[Text, Text], Text]] = []
+    seen = set()
 
     for filemap in files:
+        sha256 = sha256_of_file(filemap["filename"])
+
+        if sha256 not in seen and not mycache.contains(sha256):
+            new_files.append((filemap, sha256))
+            seen.add(sha256)
 
-        filename: Text = filemap["filename"]
-        sha256 = sha256_of_file(filename)
+    session = upload.new_session()
+    batch_size = max(batch_size, 1)
+
+    nup = 0
 
-        if not mycache.contains(sha256):
-            try:
-                if scio_url != "dummy.url":
-                    upload.upload(scio_url, filemap, tlp)
-                mycache.insert(filename, sha256, str(datetime.datetime.now()))
+    for i in range(0, len(new_files), batch_size):
+        batch = new_files[i : i + batch_size]  # noqa: E203
+
+        try:
+            if scio_url == "dummy.url":
+                results: List[Dict[Text, Any]] = [{} for _ in batch]
+            else:
+                documents = []
+                for filemap, _ in batch:
+                    with open(filemap["filename"], "rb") as f:
+                        documents.append(
+                            upload.to_scio_submit_post_data(f, filemap, tlp)
+                        )
+                results = upload.upload_batch(scio_url, documents, session)
+        except upload.UploadError as err:
+            logging.error(err)
+            continue
+
+        for (filemap, sha256), result in zip(batch, results):
+            filename = filemap["filename"]
+
+            if result.get("error"):
+                logging.error("Unable to upload %s: %s", filename, result["error"])
+                continue
+
+            mycache.insert(filename, sha256, str(datetime.datetime.now()))
+
+            if result.get("duplicate"):
+                logging.info("%s is already submitted to scio", filename)
+            else:
                 logging.info("Uploaded %s to scio", filename)
                 nup += 1
-            except upload.UploadError as err:
-                logging.error(err)
 
     return nup
 
@@ -109,7 +144,7 @@ def main() -> None:
 
     logging.info("Checking upload status of %s files", len(files))
 
-    nup = upload_uncached_files(args.cache, files, args.scio, args.tlp)
+    nup = upload_uncached_files(args.cache, files, args.scio, args.tlp, args.batch_size)
 
     logging.info("Uploaded %s files", nup)
 
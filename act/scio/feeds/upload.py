@@ -1,12 +1,16 @@
 """All functions related to scio upload"""
 
 import base64
+import json
 import time
 from logging import error, warning
-from typing import IO, Dict, Text
+from typing import IO, Any, Dict, Iterator, List, Optional, Text, Tuple
 
 import requests
 
+# Max seconds to wait before retrying a batch that is rejected with 429
+MAX_BACKOFF = 60
+
 
 def read_as_base64(obj: IO[bytes]) -> Text:
     """Create a base64 encoded string from a file like object"""
@@ -33,7 +37,78 @@ def to_scio_submit_post_data(
     return metadata
 
 
-def upload(url: Text, filemap: Dict[Text, Text], tlp: Text) -> None:
+def new_session() -> requests.Session:
+    """Session for uploads to scio, without proxy settings from environment"""
+
+    session = requests.Session()
+    session.trust_env = False
+
+    return session
+
+
+def batch_url(url: Text) -> Text:
+    """URL of the batch submit endpoint, from the submit URL"""
+
+    return url.rstrip("/") + "/batch"
+
+
+def ndjson(documents: List[Dict[Text, Any]]) -> Iterator[bytes]:
+    """Documents as new line delimited JSON"""
+
+    for document in documents:
+        yield json.dumps(document).encode("utf8") + b"\n"
+
+
+def upload_batch(
+    url: Text,
+    documents: List[Dict[Text, Any]],
+    session: Optional[requests.Session] = None,
+    auth: Optional[Tuple[Text, Text]] = None,
+) -> List[Dict[Text, Any]]:
+    """Submit documents (in the format of the submit endpoint) with the batch
+    submit endpoint, in one request. url is the submit URL. Retries with
+    backoff while scio responds with 429 (too many jobs in queue). Returns
+    the result for each document"""
+
+    session = session or new_session()
+    backoff = 1
+
+    while True:
+        started = time.time()
+        try:
+            req = session.post(
+                batch_url(url),
+                data=ndjson(documents),
+                headers={"Content-Type": "application/x-ndjson"},
+                auth=auth,
+            )
+        except requests.exceptions.ConnectionError as e:
+            msg = (
+                f"Failed to upload batch of {len(documents)} documents to {url}. "
+                + f"Time since upload started: {time.time() - started} seconds. "
+                + f"Exception: {e}"
+            )
+            error(msg)
+            raise UploadError(msg)
+
+        if req.status_code == 200:
+            results: List[Dict[Text, Any]] = req.json()["results"]
+            return results
+
+        if req.status_code != 429:
+            raise UploadError("Status {0}: {1}".format(req.status_code, req.text))
+
+        warning("%s: %s, retrying in %s seconds", req.status_code, req.text, backoff)
+        time.sleep(backoff)
+        backoff = min(backoff * 2, MAX_BACKOFF)
+
+
+def upload(
+    url: Text,
+    filemap: Dict[Text, Text],
+    tlp: Text,
+    session: Optional[requests.Session] = None,
+) -> None:
     """Upload a file to the Scio engine"""
 
     retry_codes = [429, None]
@@ -41,9 +116,7 @@ def upload(url: Text, filemap: Dict[Text, Text], tlp: Text) -> None:
     with open(filemap["filename"], "rb") as file_h:
         post_data = to_scio_submit_post_data(file_h, filemap, tlp)
 
-        # Disable all proxy settings from environment
-        session = requests.Session()
-        session.trust_env = False
+        session = session or new_session()
 
         status_code = None
         while status_code in retry_codes:
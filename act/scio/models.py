@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, StrictInt, StrictStr
 
@@ -13,6 +13,8 @@ class ScioBaseDocument(BaseModel):
     tlp: Optional[TLP]
     owner: Optional[StrictStr]
     store: bool = True
+    # Analyze again, also if the document is a duplicate
+    force: bool = False
 
 
 class Document(ScioBaseDocument):
@@ -31,6 +33,17 @@ class LookupResponse(BaseModel):
 class SubmitResponse(ScioBaseDocument):
     """Response model for document submit"""
 
+    # Name of the submitted file (filename is where it is stored)
+    original_filename: Optional[StrictStr]
     hexdigest: StrictStr
     count: StrictInt
     error: Optional[StrictStr]
+    # Document is already submitted, and is not analyzed again
+    duplicate: bool = False
+
+
+class BatchSubmitResponse(BaseModel):
+    """Response model for batch submit, with the response for each document
+    in the order they were submitted"""
+
+    results: List[SubmitResponse]
@@ -9,7 +9,7 @@ import pkgutil
 from importlib import import_module
 from importlib.machinery import ModuleSpec
 from importlib.util import module_from_spec, spec_from_file_location
-from typing import List, Optional, Text
+from typing import Dict, List, Optional, Text
 
 import addict
 from pydantic import BaseModel, StrictStr
@@ -41,6 +41,49 @@ class BasePlugin:
     configdir = ""
     debug = False
 
+    # CPU bound plugins are run in a process pool by the analyze worker,
+    # other plugins (e.g. waiting for external services) run on the event loop
+    cpu_bound = False
+
+    # Results are stored in the result cache (if enabled) and reused when the
+    # same document (hexdigest) is analyzed by the same plugin version again.
+    # Only for plugins where the result depends on the document content alone
+    cache_result = False
+
+    # Results from transient plugins are only used by other plugins, and are
+    # not output to elasticsearch/webdump/stdout unless selected explicitly
+    transient = False
+
+    # module name or file the plugin was loaded from, used to load the
+    # plugin again in worker processes
+    module_name = ""
+
+    # modification times of resources() at the last setup(), None if the
+    # plugin has not been set up yet
+    _resource_mtimes: Optional[Dict[Text, Optional[float]]] = None
+
+    def resources(self) -> List[Text]:
+        """Files (config, aliases, vendor data) the prepared state of the plugin
+        is built from. setup() is run again if any of these are modified"""
+        return []
+
+    def setup(self) -> None:
+        """Load resources and prepare state that should be reused across
+        documents. Plugins that read config files should do it here instead of
+        in analyze()"""
+
+    def warmup(self) -> None:
+        """Run setup() if the plugin is not set up yet, or if any of the
+        resources has been modified since the last setup"""
+
+        if self._resource_mtimes is not None:
+            if self._resource_mtimes == resource_mtimes(self.resources()):
+                return
+            logging.info("Resources for %s modified, running setup", self.name)
+
+        self.setup()
+        self._resource_mtimes = resource_mtimes(self.resources())
+
     async def analyze(self, nlpdata: addict.Dict) -> Result:
         """Main analyzis method"""
         return Result(
@@ -50,6 +93,74 @@ class BasePlugin:
         )
 
 
+def resource_mtimes(filenames: List[Text]) -> Dict[Text, Optional[float]]:
+    """Return modification time for each of the files, None if the
+    file does not exist"""
+
+    mtimes: Dict[Text, Optional[float]] = {}
+    for filename in filenames:
+        try:
+            mtimes[filename] = os.path.getmtime(filename)
+        except OSError:
+            mtimes[filename] = None
+    return mtimes
+
+
+def resolve_dependencies(plugins: List[BasePlugin]) -> List[BasePlugin]:
+    """Return the plugins sorted so that each plugin comes after the plugins it
+    depends on. Plugins that depend on a plugin that is not loaded, or that are
+    part of a dependency cycle, are removed."""
+
+    by_name: Dict[Text, BasePlugin] = {}
+    for p in plugins:
+        if p.name in by_name:
+            logging.warning("Duplicate plugin name %s, ignoring %s", p.name, p)
+            continue
+        by_name[p.name] = p
+
+    ordered: List[BasePlugin] = []
+    resolved: Dict[Text, bool] = {}
+    visiting: List[Text] = []
+
+    def resolve(p: BasePlugin) -> bool:
+        if p.name in resolved:
+            return resolved[p.name]
+
+        if p.name in visiting:
+            cycle = visiting[visiting.index(p.name) :] + [p.name]  # noqa: E203
+            logging.error("Dependency cycle: %s", " -> ".join(cycle))
+            return False
+
+        visiting.append(p.name)
+
+        ok = True
+        for dep in p.dependencies:
+            if dep not in by_name:
+                logging.error("Plugin %s depends on missing plugin %s", p.name, dep)
+                ok = False
+            elif not resolve(by_name[dep]):
+                ok = False
+
+        visiting.pop()
+
+        resolved[p.name] = ok
+        if ok:
+            ordered.append(p)
+        else:
+            logging.warning(
+                "Plugin %s disabled due to unmet dependency %s",
+                p.name,
+                p.dependencies,
+            )
+
+        return ok
+
+    for p in by_name.values():
+        resolve(p)
+
+    return ordered
+
+
 def load_default_plugins() -> List[BasePlugin]:
     """load_default_plugins scans the package for internal plugins, loading
     them dynamically and checking for the presence of the attributes defined in
@@ -119,4 +230,6 @@ def load_plugin(module_name: Text) -> Optional[BasePlugin]:
     if not conform:
         return None
 
+    p.module_name = module_name
+
     return p
@@ -15,6 +15,13 @@ class Plugin(BasePlugin):
     info = "Extract locations from a body of text"
     version = "0.1"
     dependencies: List[Text] = ["pos_tag"]
+    cpu_bound = True
+
+    vocab: Vocabulary
+    cities: Dict[Text, Dict[Text, Any]] = {}
+    country_names: Dict[Text, Text] = {}
+    country_cc: Dict[Text, Text] = {}
+    files: List[Text] = []
 
     def nouns(self, tok: List[Tuple[Text, Text]]) -> List[Text]:
         """Rebuild a list of nouns from the tokenized values. e.g.
@@ -83,10 +90,10 @@ class Plugin(BasePlugin):
 
         return names, alpha2
 
-    async def analyze(self, nlpdata: addict.Dict) -> Result:
-
-        res = addict.Dict()
+    def resources(self) -> List[Text]:
+        return [os.path.join(self.configdir, "locations.ini")] + self.files
 
+    def setup(self) -> None:
         ini = configparser.ConfigParser()
         ini.read([os.path.join(self.configdir, "locations.ini")])
         ini["locations"]["cities"] = os.path.join(
@@ -99,13 +106,24 @@ class Plugin(BasePlugin):
             self.configdir, ini["vocabulary"]["alias"]
         )
 
-        cities = self.cities_from_file(ini["locations"]["cities"])
-        country_names, country_cc = self.countries_from_file(
+        self.files = [
+            ini["locations"]["cities"],
+            ini["locations"]["countries"],
+            ini["vocabulary"]["alias"],
+        ]
+
+        self.cities = self.cities_from_file(ini["locations"]["cities"])
+        self.country_names, self.country_cc = self.countries_from_file(
             ini["locations"]["countries"]
         )
+        self.vocab = Vocabulary(ini["vocabulary"])
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.warmup()
+
+        res = addict.Dict()
 
         nouns = self.nouns(nlpdata.pos_tag.tokens)
-        vocab = Vocabulary(ini["vocabulary"])
 
         res.cities = []
         res.countries = []
@@ -113,15 +131,15 @@ class Plugin(BasePlugin):
         res.countries_mentioned = []
 
         for noun in nouns:
-            if noun in cities:
-                city = cities[noun]
+            if noun in self.cities:
+                city = self.cities[noun]
                 res.cities.append(city)
                 res.countries_inferred.append(
-                    country_cc.get(city["country code"], "UNK")
+                    self.country_cc.get(city["country code"], "UNK")
                 )
-            if noun in country_names:
-                res.countries.append(country_names[noun])
-            if vocab.get(noun):
+            if noun in self.country_names:
+                res.countries.append(self.country_names[noun])
+            if self.vocab.get(noun):
                 res.countries_mentioned.append(noun)
 
         return Result(name=self.name, version=self.version, result=res)
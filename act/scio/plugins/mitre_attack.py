@@ -15,6 +15,7 @@ class Plugin(BasePlugin):  # pylint: disable=r0903
     info = "References to MITRE Att&ck IDs"
     version = "0.1"
     dependencies: List[Text] = []
+    cpu_bound = True
 
     tactic_re = re.compile(r"\bTA[0-9]{4}\b")
     technique_re = re.compile(r"\bT[0-9]{4}(?!\.[0-9]{3})\b")
@@ -1,4 +1,6 @@
+import asyncio
 import configparser
+import functools
 import json
 from typing import List, Dict, Any, cast, Optional
 import openai
@@ -79,6 +81,8 @@ class Plugin(BasePlugin):
         if ini.has_option("DEFAULT", "proxy"):
             openai.proxy = ini["DEFAULT"]["proxy"]
 
+        loop = asyncio.get_event_loop()
+
         res = addict.Dict()
 
         for name in ini.sections():
@@ -110,12 +114,19 @@ class Plugin(BasePlugin):
             # Strip whitespace at start/end of each line
             query = "\n".join(line.strip() for line in prompt.get("query").split("\n"))
 
-            res[name] = openai_query(
-                apikey=prompt.get("apikey"),
-                model=prompt.get("model"),
-                query=query,
-                content=nlpdata.content,
-                format=prompt.get("format", "text"),
-            ).dict()
+            # openai_query is blocking, run it in a thread to not block
+            # the event loop while waiting for the response
+            result = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    openai_query,
+                    apikey=prompt.get("apikey"),
+                    model=prompt.get("model"),
+                    query=query,
+                    content=nlpdata.content,
+                    format=prompt.get("format", "text"),
+                ),
+            )
+            res[name] = result.dict()
 
         return Result(name=self.name, version=self.version, result=res)
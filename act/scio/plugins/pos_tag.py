@@ -1,23 +1,152 @@
-from typing import List, Text
+import asyncio
+import configparser
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Optional, Text, Tuple
 
 import addict
 import nltk
 
 from act.scio.plugin import BasePlugin, Result
+from act.scio.runner import ignore_signals
+from act.scio.tokens import TokenStore
+
+
+def tag(text: Text) -> TokenStore:
+    """Tokenize and part-of-speach tag text"""
+
+    return TokenStore(text, nltk.pos_tag(nltk.word_tokenize(text)))
+
+
+def split_chunks(text: Text, size: int) -> List[Tuple[int, Text]]:
+    """Split text in chunks of up to size characters. Chunks are split at
+    paragraph boundaries if possible, otherwise at line breaks or whitespace.
+    Returns list of (offset, chunk)"""
+
+    chunks: List[Tuple[int, Text]] = []
+
+    start = 0
+    while len(text) - start > size:
+        end = start + size
+        for separator in ("\n\n", "\n", " "):
+            # Do not make chunks smaller than half the chunk size
+            pos = text.rfind(separator, start + size // 2, end)
+            if pos != -1:
+                end = pos + len(separator)
+                break
+        chunks.append((start, text[start:end]))
+        start = end
+
+    chunks.append((start, text[start:]))
+
+    return chunks
+
+
+def exit_with_parent() -> None:
+    """Initializer for tagging processes. Exit if the parent process is gone,
+    e.g. when the analyze worker running the plugin is killed due to timeout"""
+
+    ignore_signals()
+
+    parent = os.getppid()
+
+    def watch() -> None:
+        while os.getppid() == parent:
+            time.sleep(5)
+        os._exit(0)
+
+    threading.Thread(target=watch, daemon=True).start()
 
 
 class Plugin(BasePlugin):
     name = "pos_tag"
     info = "Part-of-speach tagging of a body of text"
-    version = "0.1"
+    version = "0.3"
     dependencies: List[Text] = []
+    # Chunks are tagged in parallel in the processes of the plugin, so the
+    # plugin is not run in the plugin runner process pool, where the workers
+    # can not start processes of their own
+    cpu_bound = False
+    cache_result = True
+    transient = True
+
+    chunk_size = 100000
+    processes = 1
+    executor: Optional[ProcessPoolExecutor] = None
+
+    def resources(self) -> List[Text]:
+        return [os.path.join(self.configdir, "pos_tag.ini")]
+
+    def setup(self) -> None:
+        ini = configparser.ConfigParser()
+        ini.read([os.path.join(self.configdir, "pos_tag.ini")])
+
+        self.chunk_size = ini.getint("pos_tag", "chunk_size", fallback=100000)
+        self.processes = ini.getint("pos_tag", "processes", fallback=0) or (
+            os.cpu_count() or 1
+        )
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Stop the tagging processes"""
+
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def kill(self) -> None:
+        """Kill the tagging processes, e.g. when the plugin is cancelled due
+        to timeout. New processes are started for the next document"""
+
+        if self.executor:
+            # pylint: disable=protected-access
+            for process in list((self.executor._processes or {}).values()):
+                process.kill()
+        self.shutdown()
 
     async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.warmup()
 
-        tokens = nltk.word_tokenize(nlpdata.content)
+        chunks = split_chunks(nlpdata.content, self.chunk_size)
+
+        # Tag in separate processes, also for small documents, so tagging
+        # does not block the event loop of the analyze worker
+        if not self.executor:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=exit_with_parent,
+            )
+
+        loop = asyncio.get_event_loop()
+        try:
+            tagged = await asyncio.gather(
+                *[
+                    loop.run_in_executor(self.executor, tag, chunk)
+                    for _, chunk in chunks
+                ]
+            )
+        except (asyncio.CancelledError, BrokenProcessPool):
+            self.kill()
+            raise
 
         res = addict.Dict()
 
-        res.tokens = nltk.pos_tag(tokens)
+        # Tokens from all chunks, and (content offset, token offset) of each chunk
+        res.tokens = TokenStore.concat(
+            nlpdata.content,
+            [(offset, tokens) for (offset, _), tokens in zip(chunks, tagged)],
+        )
+        res.chunks = []
+
+        token_offset = 0
+        for (offset, _), tokens in zip(chunks, tagged):
+            res.chunks.append([offset, token_offset])
+            token_offset += len(tokens)
 
         return Result(name=self.name, version=self.version, result=res)
@@ -15,8 +15,27 @@ class Plugin(BasePlugin):
     info = "Extract sectors from a body of text"
     version = "0.1"
     dependencies: List[Text] = ["pos_tag"]
+    cpu_bound = True
+
+    vocab: Vocabulary
+    alias = ""
+
+    def resources(self) -> List[Text]:
+        files = [os.path.join(self.configdir, "sectors.ini")]
+        if self.alias:
+            files.append(self.alias)
+        return files
+
+    def setup(self) -> None:
+        ini = configparser.ConfigParser()
+        ini.read([os.path.join(self.configdir, "sectors.ini")])
+        ini["sectors"]["alias"] = os.path.join(self.configdir, ini["sectors"]["alias"])
+
+        self.alias = ini["sectors"]["alias"]
+        self.vocab = Vocabulary(ini["sectors"])
 
     async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.warmup()
 
         res = addict.Dict()
 
@@ -50,15 +69,10 @@ class Plugin(BasePlugin):
                     if pos_tag in posible_tag_types
                 ]
 
-        ini = configparser.ConfigParser()
-        ini.read([os.path.join(self.configdir, "sectors.ini")])
-        ini["sectors"]["alias"] = os.path.join(self.configdir, ini["sectors"]["alias"])
-
-        vocab = Vocabulary(ini["sectors"])
         sectors = []
         unknown_sectors = []
         for pos_sector in pos_sectors:
-            primary = vocab.get(pos_sector, primary=True)
+            primary = self.vocab.get(pos_sector, primary=True)
             if primary:
                 sectors.append(primary)
             else:
@@ -16,6 +16,7 @@ class Plugin(BasePlugin):
     info = "Extract actors based on language from a body of text"
     version = "0.1"
     dependencies: List[Text] = ["pos_tag"]
+    cpu_bound = True
 
     async def analyze(self, nlpdata: addict.Dict) -> Result:
 
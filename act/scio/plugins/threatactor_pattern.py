@@ -1,6 +1,6 @@
 import configparser
 import os.path
-from typing import List, Text
+from typing import List, Optional, Text
 
 import addict
 
@@ -40,28 +40,49 @@ class Plugin(BasePlugin):
     info = "Extracting references to known threat actors from a body of text"
     version = "0.2"
     dependencies: List[Text] = []
+    cpu_bound = True
 
-    async def analyze(self, nlpdata: addict.Dict) -> Result:
+    vocab: Vocabulary
+    uppercase_abbr: List[Text] = []
+    allow_non_alphanumeric: Optional[Text] = None
+    alias = ""
+
+    def resources(self) -> List[Text]:
+        files = [os.path.join(self.configdir, "threatactor_pattern.ini")]
+        if self.alias:
+            files.append(self.alias)
+        return files
+
+    def setup(self) -> None:
         ini = configparser.ConfigParser()
         ini.read([os.path.join(self.configdir, "threatactor_pattern.ini")])
         ini["threat_actor"]["alias"] = os.path.join(
             self.configdir, ini["threat_actor"]["alias"]
         )
 
-        allow_non_alphanumeric = ini["threat_actor"].get("allow_non_alphanumeric", None)
+        self.alias = ini["threat_actor"]["alias"]
 
-        uppercase_abbr = abbreviation_list(
+        self.allow_non_alphanumeric = ini["threat_actor"].get(
+            "allow_non_alphanumeric", None
+        )
+
+        self.uppercase_abbr = abbreviation_list(
             ini["threat_actor"].get("uppercase_abbr", "")
         )
 
-        vocab = Vocabulary(ini["threat_actor"])
+        self.vocab = Vocabulary(ini["threat_actor"])
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.warmup()
 
         res = addict.Dict()
 
-        res.ThreatActors = vocab.regex_search(
+        res.ThreatActors = self.vocab.regex_search(
             nlpdata.content,
             normalize_result=(
-                lambda x: normalize_ta(x, uppercase_abbr, allow_non_alphanumeric)
+                lambda x: normalize_ta(
+                    x, self.uppercase_abbr, self.allow_non_alphanumeric
+                )
             ),
             debug=self.debug,
         )
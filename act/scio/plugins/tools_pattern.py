@@ -13,17 +13,30 @@ class Plugin(BasePlugin):
     info = "Extracting references to known tools from a body of text"
     version = "0.2"
     dependencies: List[Text] = []
+    cpu_bound = True
 
-    async def analyze(self, nlpdata: addict.Dict) -> Result:
+    vocab: Vocabulary
+    alias = ""
+
+    def resources(self) -> List[Text]:
+        files = [os.path.join(self.configdir, "tools_pattern.ini")]
+        if self.alias:
+            files.append(self.alias)
+        return files
 
+    def setup(self) -> None:
         ini = configparser.ConfigParser()
         ini.read([os.path.join(self.configdir, "tools_pattern.ini")])
         ini["tools"]["alias"] = os.path.join(self.configdir, ini["tools"]["alias"])
 
-        vocab = Vocabulary(ini["tools"])
+        self.alias = ini["tools"]["alias"]
+        self.vocab = Vocabulary(ini["tools"])
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.warmup()
 
         res = addict.Dict()
 
-        res.Tools = vocab.regex_search(nlpdata.content, debug=self.debug)
+        res.Tools = self.vocab.regex_search(nlpdata.content, debug=self.debug)
 
         return Result(name=self.name, version=self.version, result=res)
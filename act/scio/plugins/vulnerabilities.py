@@ -11,6 +11,7 @@ class Plugin(BasePlugin):
     info = "Extracting Vulnerability References (CVE, MSID) from body of text"
     version = "0.1"
     dependencies: List[Text] = []
+    cpu_bound = True
 
     cve = re.compile(r"\b(?:CVE|cve)-\d{4}-\d{4,7}\b")
     msid = re.compile(r"\b(?:MS|ms)\d{2}-\d+\b")
@@ -0,0 +1,57 @@
+"""Top level domains from the public suffix list (https://publicsuffix.org/).
+
+Only the top level domain (the last label) of each rule is kept, as that is
+all that is needed to check whether a domain ends with a valid TLD."""
+
+import logging
+from typing import Iterable, Optional, Set, Text
+
+
+def read_rules(filename: Text) -> Iterable[Text]:
+    """Read rules from public suffix list file"""
+
+    with open(filename, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("//"):
+                continue
+            yield line.split()[0]
+
+
+def idna(name: Text) -> Optional[Text]:
+    """Return IDNA (punycode) encoding of name, or None if name is ascii or can
+    not be encoded"""
+
+    if name.isascii():
+        return None
+    try:
+        return name.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+
+
+class PublicSuffixList:
+    """Top level domains in the public suffix list"""
+
+    def __init__(self, rules: Iterable[Text]) -> None:
+        self.tlds: Set[Text] = set()
+
+        for rule in rules:
+            tld = rule.lstrip("!").lower().split(".")[-1]
+            self.tlds.add(tld)
+            encoded = idna(tld)
+            if encoded:
+                self.tlds.add(encoded)
+
+    @classmethod
+    def from_file(cls, filename: Text) -> "PublicSuffixList":
+        """Load public suffix list from file"""
+
+        psl = cls(read_rules(filename))
+        logging.info("Loaded %s TLDs from %s", len(psl.tlds), filename)
+        return psl
+
+    def has_valid_tld(self, domain: Text) -> bool:
+        """Check whether the last label of domain is a top level domain"""
+
+        return domain[domain.rfind(".") + 1 :].lower() in self.tlds  # noqa: E203
@@ -0,0 +1,167 @@
+"""Persistent cache of plugin results.
+
+Results are stored pickled in a sqlite database, indexed on the hexdigest of
+the document and the name and version of the plugin. Pickle keeps the types
+of the result (e.g. the compact token store from pos_tag), and the database
+is only written by the analyze worker. When the total size of the
+stored results exceeds the max size, the least recently used results are
+removed."""
+
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Optional, Text
+
+from act.scio.plugin import Result
+
+# Remove results until the cache is below this fraction of max size when
+# evicting, so eviction is not done on every insert in a full cache
+EVICT_TO = 0.9
+
+
+class ResultCache:
+    """Cache of plugin results. Thread safe, and the same database can be
+    used by several processes"""
+
+    def __init__(self, filename: Text, max_size: int) -> None:
+        """
+        Args:
+            filename:  sqlite database file
+            max_size:  Max total size (bytes) of the stored results
+        """
+
+        self.filename = filename
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        logging.info("Using plugin result cache %s", filename)
+
+        self.conn = sqlite3.connect(filename, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS result (
+                   hexdigest text NOT NULL,
+                   plugin text NOT NULL,
+                   version text NOT NULL,
+                   data blob NOT NULL,
+                   size integer NOT NULL,
+                   accessed real NOT NULL,
+                   PRIMARY KEY (hexdigest, plugin, version));""")
+        self.conn.execute(
+            "CREATE INDEX IF NOT EXISTS result_accessed ON result (accessed)"
+        )
+        self.conn.commit()
+
+    def get(self, hexdigest: Text, plugin: Text, version: Text) -> Optional[Result]:
+        """Get result for document and plugin, None if not in cache"""
+
+        key = (hexdigest, plugin, version)
+
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT data FROM result WHERE hexdigest = ? AND plugin = ? AND version = ?",
+                key,
+            ).fetchone()
+
+            if not row:
+                return None
+
+            self.conn.execute(
+                "UPDATE result SET accessed = ? "
+                + "WHERE hexdigest = ? AND plugin = ? AND version = ?",
+                (time.time(), *key),
+            )
+            self.conn.commit()
+
+        try:
+            result = pickle.loads(zlib.decompress(row[0]))
+        except Exception as e:
+            # E.g. the result type is changed without a new plugin version.
+            # Unpickling can raise almost any exception
+            logging.warning(
+                "Unable to decode cached result from %s on %s: %s", plugin, hexdigest, e
+            )
+            self.delete(hexdigest, plugin, version)
+            return None
+
+        return Result(name=plugin, version=version, result=result)
+
+    def delete(self, hexdigest: Text, plugin: Text, version: Text) -> None:
+        """Remove result for document and plugin"""
+
+        with self.lock:
+            self.conn.execute(
+                "DELETE FROM result WHERE hexdigest = ? AND plugin = ? AND version = ?",
+                (hexdigest, plugin, version),
+            )
+            self.conn.commit()
+
+    def put(self, hexdigest: Text, result: Result) -> None:
+        """Store result for document"""
+
+        data = zlib.compress(pickle.dumps(result.result, pickle.HIGHEST_PROTOCOL))
+
+        if len(data) > self.max_size:
+            logging.info(
+                "Result from %s on %s is larger than the cache", result.name, hexdigest
+            )
+            return
+
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO result VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    hexdigest,
+                    result.name,
+                    result.version,
+                    data,
+                    len(data),
+                    time.time(),
+                ),
+            )
+            self.conn.commit()
+
+            self.evict()
+
+    def size(self) -> int:
+        """Total size of stored results"""
+
+        return int(
+            self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM result").fetchone()[0]
+        )
+
+    def evict(self) -> None:
+        """Remove least recently used results if the cache is full. Must be
+        called with the lock held"""
+
+        size = self.size()
+
+        if size <= self.max_size:
+            return
+
+        removed = 0
+        for rowid, row_size in self.conn.execute(
+            "SELECT rowid, size FROM result ORDER BY accessed"
+        ).fetchall():
+            if size <= self.max_size * EVICT_TO:
+                break
+            self.conn.execute("DELETE FROM result WHERE rowid = ?", (rowid,))
+            size -= row_size
+            removed += 1
+
+        self.conn.commit()
+
+        logging.info("Removed %s results from plugin result cache", removed)
+
+    def close(self) -> None:
+        """Close database"""
+
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,459 @@
+"""runner.py contains the plugin runner used by the analyze worker.
+
+Each plugin is started as soon as the plugins it depends on are finished.
+CPU bound plugins are run in a process pool, where each worker process loads
+and sets up its own instance of the plugins once. Other plugins are run on the
+event loop.
+
+The time budget of a plugin in the process pool starts when a worker starts
+the plugin, not when it is queued. Each worker records the task it is running
+in shared memory, so the main process can kill the worker running a stuck
+plugin without affecting the other workers. The pool replaces killed
+workers."""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.pool
+import os
+import signal
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Text, Tuple
+
+import addict
+
+from act.scio.plugin import BasePlugin, Result, load_plugin, resolve_dependencies
+from act.scio.resultcache import ResultCache
+from act.scio.tokens import bind_tokens
+
+# Seconds between each check of plugins running in the process pool
+POLL_INTERVAL = 0.5
+
+# Plugins loaded in the worker process, indexed on plugin name
+_WORKER_PLUGINS: Dict[Text, BasePlugin] = {}
+_WORKER_LOOP: Optional[asyncio.AbstractEventLoop] = None
+_WORKER_SLOTS: Optional["WorkerSlots"] = None
+_WORKER_SLOT: Optional[int] = None
+
+
+class WorkerDied(Exception):
+    """The worker process running a plugin died"""
+
+
+def alive(pid: int) -> bool:
+    """Check whether process exists"""
+
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+
+    return True
+
+
+class WorkerSlots:
+    """Task running in each worker process, and when it was started, kept in
+    shared memory. Workers update their slot and the main process kills
+    workers with the lock held, so a worker is only killed while it is
+    still running the task that exceeded the time budget"""
+
+    def __init__(self, size: int) -> None:
+        self.lock = multiprocessing.Lock()
+        self.pids = multiprocessing.RawArray("q", size)
+        self.tasks = multiprocessing.RawArray("q", size)
+        self.started = multiprocessing.RawArray("d", size)
+
+    def claim(self) -> Optional[int]:
+        """Claim a free slot for the current (worker) process. Slots of
+        workers that are gone are reused"""
+
+        with self.lock:
+            for slot, pid in enumerate(self.pids):
+                if not pid or not alive(pid):
+                    self.pids[slot] = os.getpid()
+                    self.tasks[slot] = 0
+                    return slot
+
+        return None
+
+    def start(self, slot: int, task_id: int) -> None:
+        """Task started in the worker owning slot"""
+
+        with self.lock:
+            self.tasks[slot] = task_id
+            self.started[slot] = time.time()
+
+    def finish(self, slot: int) -> None:
+        """Task finished in the worker owning slot"""
+
+        with self.lock:
+            self.tasks[slot] = 0
+
+    def running(self, task_id: int) -> Optional[Tuple[int, float]]:
+        """(pid, start time) of the worker running task, None if the task
+        is not running (queued or finished)"""
+
+        with self.lock:
+            for slot, running_task in enumerate(self.tasks):
+                if running_task == task_id:
+                    return self.pids[slot], self.started[slot]
+
+        return None
+
+    def kill(self, task_id: int) -> bool:
+        """Kill the worker running task. Returns False if the task is not
+        running"""
+
+        with self.lock:
+            for slot, running_task in enumerate(self.tasks):
+                if running_task == task_id:
+                    os.kill(self.pids[slot], signal.SIGKILL)
+                    self.pids[slot] = 0
+                    self.tasks[slot] = 0
+                    return True
+
+        return False
+
+
+def ignore_signals() -> None:
+    """Ignore SIGINT and SIGTERM in worker processes. The signals are also
+    sent to the workers on Ctrl-C, or when the service is stopped, and the
+    workers must keep running while the main process finishes the documents
+    in progress. Workers are stopped by the main process on shutdown"""
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, signal.SIG_IGN)
+
+
+def init_worker(
+    plugin_specs: List[Tuple[Text, Text, bool]], slots: WorkerSlots
+) -> None:
+    """Initializer for worker processes. Load and set up each plugin
+    from (module_name, configdir, debug)"""
+
+    global _WORKER_LOOP, _WORKER_SLOTS, _WORKER_SLOT  # pylint: disable=global-statement
+
+    ignore_signals()
+
+    _WORKER_SLOTS = slots
+    _WORKER_SLOT = slots.claim()
+
+    _WORKER_LOOP = asyncio.new_event_loop()
+
+    for module_name, configdir, debug in plugin_specs:
+        p = load_plugin(module_name)
+        if not p:
+            logging.error("Unable to load plugin %s in worker", module_name)
+            continue
+        p.configdir = configdir
+        p.debug = debug
+        try:
+            p.warmup()
+        except Exception as e:
+            logging.error("Unable to set up plugin %s in worker: %s", p.name, e)
+        _WORKER_PLUGINS[p.name] = p
+
+
+def run_in_worker(task_id: int, name: Text, nlpdata: addict.Dict) -> Result:
+    """Run plugin in worker process"""
+
+    if _WORKER_SLOTS and _WORKER_SLOT is not None:
+        _WORKER_SLOTS.start(_WORKER_SLOT, task_id)
+
+    bind_tokens(nlpdata)
+
+    try:
+        return _WORKER_LOOP.run_until_complete(  # type: ignore
+            _WORKER_PLUGINS[name].analyze(nlpdata)
+        )
+    finally:
+        if _WORKER_SLOTS and _WORKER_SLOT is not None:
+            _WORKER_SLOTS.finish(_WORKER_SLOT)
+
+
+def set_future(future: "asyncio.Future[Any]", result: Any, error: bool) -> None:
+    """Set result (or exception if error) of future, unless it is cancelled"""
+
+    if future.done():
+        return
+
+    if error:
+        future.set_exception(result)
+    else:
+        future.set_result(result)
+
+
+class PluginRunner:
+    """Run plugins on the event loop or in a process pool, depending on
+    whether the plugin is CPU bound"""
+
+    def __init__(
+        self,
+        plugins: List[BasePlugin],
+        processes: Optional[int] = None,
+        timeout: Optional[float] = None,
+        timeouts: Optional[Dict[Text, float]] = None,
+        cache: Optional[ResultCache] = None,
+    ) -> None:
+        """
+        Args:
+            plugins:    All plugins that will be run
+            processes:  Number of worker processes. None will use the number of
+                        CPUs, 0 will run all plugins on the event loop.
+            timeout:    Default time budget (seconds) per plugin. None or 0 to
+                        run without time budget.
+            timeouts:   Time budget per plugin name, overriding timeout
+            cache:      Cache for results of plugins with cache_result set
+        """
+
+        self.pool: Optional[multiprocessing.pool.Pool] = None
+        self.processes = processes
+        self.timeout = timeout
+        self.timeouts = timeouts or {}
+        self.cache = cache
+        self.task_ids = itertools.count(1)
+
+        # Plugins sorted by dependencies. Plugins with missing or cyclic
+        # dependencies are removed here, instead of when analyzing documents
+        self.plugins = resolve_dependencies(plugins)
+
+        # Plugins loaded directly (not through load_plugin) can not be loaded
+        # in the worker processes
+        self.pool_specs = [
+            (p.module_name, p.configdir, p.debug)
+            for p in self.plugins
+            if p.cpu_bound and p.module_name
+        ]
+
+        self.pool_plugins = {
+            p.name for p in self.plugins if p.cpu_bound and p.module_name
+        }
+
+        # Room for workers that are started to replace killed workers,
+        # before the killed workers are cleaned up
+        self.slots = WorkerSlots((processes or os.cpu_count() or 1) * 2)
+
+        if self.pool_plugins and processes != 0:
+            logging.info(
+                "Starting process pool for plugins %s", ", ".join(self.pool_plugins)
+            )
+            self.pool = multiprocessing.Pool(
+                processes=processes,
+                initializer=init_worker,
+                initargs=(self.pool_specs, self.slots),
+            )
+
+    def plugin_timeout(self, p: BasePlugin) -> Optional[float]:
+        """Time budget for plugin, None if the plugin can run without limit"""
+
+        timeout = self.timeouts.get(p.name, self.timeout)
+
+        return timeout if timeout else None
+
+    async def run(self, p: BasePlugin, nlpdata: addict.Dict) -> Result:
+        """Run analyze for a plugin on nlpdata. Raises asyncio.TimeoutError if
+        the plugin does not finish within its time budget.
+
+        Plugins that are run on the event loop are cancelled when the time budget
+        is exceeded. This will only have effect if the plugin awaits something, so
+        blocking plugins should be run in the process pool, where the worker is
+        killed instead."""
+
+        timeout = self.plugin_timeout(p)
+
+        if self.pool and p.name in self.pool_plugins:
+            return await self.run_in_pool(self.pool, p, nlpdata, timeout)
+
+        return await asyncio.wait_for(p.analyze(nlpdata), timeout)
+
+    async def run_in_pool(
+        self,
+        pool: multiprocessing.pool.Pool,
+        p: BasePlugin,
+        nlpdata: addict.Dict,
+        timeout: Optional[float],
+    ) -> Result:
+        """Run plugin in the process pool, and kill the worker if the plugin
+        does not finish within timeout seconds after it is started"""
+
+        loop = asyncio.get_event_loop()
+        future: "asyncio.Future[Result]" = loop.create_future()
+        task_id = next(self.task_ids)
+
+        job = pool.apply_async(
+            run_in_worker,
+            (task_id, p.name, nlpdata),
+            callback=lambda res: loop.call_soon_threadsafe(
+                set_future, future, res, False
+            ),
+            error_callback=lambda e: loop.call_soon_threadsafe(
+                set_future, future, e, True
+            ),
+        )
+
+        while True:
+            await asyncio.wait([future], timeout=POLL_INTERVAL)
+
+            if future.done():
+                return future.result()
+
+            running = self.slots.running(task_id)
+
+            if not running:
+                # Waiting for a worker, or the result is on its way
+                continue
+
+            pid, started = running
+
+            if not alive(pid):
+                self.forget(pool, job)
+                raise WorkerDied(f"Worker process {pid} died running {p.name}")
+
+            if timeout and time.time() - started > timeout:
+                if self.slots.kill(task_id):
+                    self.forget(pool, job)
+                    raise asyncio.TimeoutError()
+
+    def forget(
+        self, pool: multiprocessing.pool.Pool, job: multiprocessing.pool.AsyncResult
+    ) -> None:
+        """Stop waiting for the result of a job in a killed worker. The pool
+        waits for all jobs on shutdown"""
+
+        # Pool has no public interface to drop jobs
+        getattr(pool, "_cache", {}).pop(getattr(job, "_job", None), None)
+
+    async def run_all(self, nlpdata: addict.Dict) -> None:
+        """Run all plugins on nlpdata, adding the result of each plugin to
+        nlpdata. Each plugin is started when the plugins it depends on are
+        finished"""
+
+        loop = asyncio.get_event_loop()
+
+        tasks: Dict[Text, "asyncio.Task[bool]"] = {}
+
+        # self.plugins is sorted so that dependencies are created first
+        for p in self.plugins:
+            dependencies = [tasks[dep] for dep in p.dependencies]
+            tasks[p.name] = loop.create_task(self.run_after(p, dependencies, nlpdata))
+
+        # Failures are recorded per plugin, so one failing plugin must not
+        # stop the plugins that do not depend on it
+        for name, res in zip(
+            tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)
+        ):
+            if isinstance(res, BaseException):
+                logging.error("%s failed: %s", name, res)
+                nlpdata.setdefault("errors", []).append(name)
+
+    async def run_after(
+        self,
+        p: BasePlugin,
+        dependencies: List["asyncio.Task[bool]"],
+        nlpdata: addict.Dict,
+    ) -> bool:
+        """Run plugin after dependencies are finished. Returns True if the plugin
+        ran successfully"""
+
+        if dependencies and not all(
+            res is True
+            for res in await asyncio.gather(*dependencies, return_exceptions=True)
+        ):
+            logging.warning(
+                "Candidate %s did not run due to unmet dependency %s",
+                p.name,
+                p.dependencies,
+            )
+            return False
+
+        try:
+            res = await self.cached_result(p, nlpdata)
+            if not res:
+                res = await self.run(p, nlpdata)
+                await self.cache_store(p, nlpdata, res)
+        except asyncio.TimeoutError:
+            logging.error(
+                "%s did not finish within %s seconds (hexdigest=%s)",
+                p.name,
+                self.plugin_timeout(p),
+                nlpdata.get("hexdigest"),
+            )
+            # Mark the document, so it is possible to see that the result
+            # is partial
+            nlpdata.setdefault("timeouts", []).append(p.name)
+            return False
+        except Exception as e:
+            logging.exception("%s returned an exception: %s", p.name, e)
+            nlpdata.setdefault("errors", []).append(p.name)
+            return False
+
+        nlpdata[res.name] = res.result
+
+        # Results from the process pool and the cache are pickled without
+        # the document content
+        bind_tokens(nlpdata)
+
+        return True
+
+    def cache_key(self, p: BasePlugin, nlpdata: addict.Dict) -> Optional[Text]:
+        """hexdigest used to cache the result of plugin, None if the result
+        should not be cached"""
+
+        if self.cache and p.cache_result:
+            return nlpdata.get("hexdigest")  # type: ignore
+
+        return None
+
+    async def cached_result(
+        self, p: BasePlugin, nlpdata: addict.Dict
+    ) -> Optional[Result]:
+        """Result from the cache, None if the result is not cached"""
+
+        hexdigest = self.cache_key(p, nlpdata)
+
+        if not (self.cache and hexdigest):
+            return None
+
+        loop = asyncio.get_event_loop()
+
+        try:
+            res = await loop.run_in_executor(
+                None, self.cache.get, hexdigest, p.name, p.version
+            )
+        except sqlite3.Error as e:
+            logging.warning("Unable to get cached result for %s: %s", p.name, e)
+            return None
+
+        if res:
+            logging.info("Using cached result for %s (hexdigest=%s)", p.name, hexdigest)
+
+        return res
+
+    async def cache_store(
+        self, p: BasePlugin, nlpdata: addict.Dict, res: Result
+    ) -> None:
+        """Store result in the cache"""
+
+        hexdigest = self.cache_key(p, nlpdata)
+
+        if not (self.cache and hexdigest):
+            return
+
+        loop = asyncio.get_event_loop()
+
+        try:
+            await loop.run_in_executor(None, self.cache.put, hexdigest, res)
+        except sqlite3.Error as e:
+            logging.warning("Unable to cache result for %s: %s", p.name, e)
+
+    def shutdown(self) -> None:
+        """Stop worker processes"""
+
+        if self.pool:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
@@ -5,11 +5,12 @@ import base64
 import hashlib
 import os.path
 import sys
-from typing import Any, Dict, Optional, Text, Tuple
+from typing import Any, Dict, List, Optional, Text, Tuple
 
 import requests
 
 from act.scio import tlp
+from act.scio.feeds.upload import UploadError, new_session, upload_batch
 from act.scio.models import Document
 
 "Submit content of URI / File to SCIO"
@@ -46,17 +47,33 @@ def parseargs(description: Text) -> argparse.Namespace:
     parser.add_argument("--http-password", help="SCIO HTTP Basic Auth password")
     parser.add_argument("--uri", help="Download content from URI and submit content")
     parser.add_argument("--filename", help="Submit file")
+    parser.add_argument(
+        "--files",
+        nargs="+",
+        help="Submit files, batch-size files in each request",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="Number of files submitted in each request with --files",
+    )
     parser.add_argument(
         "--nostore",
         action="store_true",
         help="Do not store document to elasticsearch/disk",
     )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Analyze document again, also if it is submitted recently",
+    )
     parser.add_argument("--tlp", default="AMBER", help=f"tlp ({VALID_TLP})")
     parser.add_argument("--owner", help="Document owner (identifier)")
     args = parser.parse_args()
 
-    if not (args.uri or args.filename):
-        fatal("Specify either --uri or --filename")
+    if not (args.uri or args.filename or args.files):
+        fatal("Specify either --uri, --filename or --files")
 
     args.tlp = args.tlp.upper()
 
@@ -99,6 +116,7 @@ def scio_submit(
     uri: Optional[Text],
     tlp: tlp.TLP = "AMBER",
     store: bool = False,
+    force: bool = False,
 ) -> None:
     "Submit content with specified filename to SCIO"
 
@@ -114,6 +132,7 @@ def scio_submit(
         filename=filename,
         owner=owner,
         store=store,
+        force=force,
         uri=uri,
     )
 
@@ -125,6 +144,47 @@ def scio_submit(
     print(f"Submitted {sha256}: {req.text}")
 
 
+def scio_submit_files(
+    submit_uri: Text,
+    filenames: List[Text],
+    owner: Optional[Text],
+    auth: Optional[Tuple[Text, Text]],
+    tlp: tlp.TLP = "AMBER",
+    store: bool = False,
+    batch_size: int = 50,
+    force: bool = False,
+) -> None:
+    "Submit files to SCIO with the batch submit endpoint"
+
+    session = new_session()
+    batch_size = max(batch_size, 1)
+
+    for i in range(0, len(filenames), batch_size):
+        documents = [
+            Document(
+                content=base64.b64encode(get_file(filename)).decode("utf8"),
+                tlp=tlp,
+                filename=os.path.basename(filename),
+                owner=owner,
+                store=store,
+                force=force,
+            ).dict()
+            for filename in filenames[i : i + batch_size]  # noqa: E203
+        ]
+
+        try:
+            results = upload_batch(submit_uri, documents, session, auth)
+        except UploadError as e:
+            fatal(f"Unable to submit files to scio ({submit_uri}), error={e}")
+            return
+
+        for document, result in zip(documents, results):
+            if result.get("error"):
+                print(f"Unable to submit {document['filename']}: {result['error']}")
+            else:
+                print(f"Submitted {result['hexdigest']}: {result}")
+
+
 def main() -> None:
     "main function"
 
@@ -137,6 +197,19 @@ def main() -> None:
         else None
     )
 
+    if args.files:
+        scio_submit_files(
+            args.scio_baseuri,
+            args.files,
+            args.owner,
+            auth,
+            args.tlp,
+            not args.nostore,
+            args.batch_size,
+            args.force,
+        )
+        return
+
     if args.uri:
         content = get_uri(
             args.uri,
@@ -162,6 +235,7 @@ def main() -> None:
             args.uri if args.uri else None,
             args.tlp,
             not args.nostore,
+            args.force,
         )
     except requests.exceptions.ConnectionError as e:
         fatal(f"Unable to connect to {args.scio_baseuri}: {e}")
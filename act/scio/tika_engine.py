@@ -8,7 +8,8 @@ import json
 import logging
 import os
 import time
-from typing import Any, Optional, Text
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Text
 
 import caep
 import greenstalk
@@ -17,79 +18,147 @@ from tika import parser
 
 import act.scio.config
 import act.scio.logsetup
+from act.scio.beanstalk import AsyncBeanstalk
 
 
 def parse_args() -> argparse.Namespace:
     """Helper setting up the argsparse configuration"""
 
     arg_parser = act.scio.config.parse_args("Scio 2 Tika server")
-    return caep.config.handle_args(arg_parser, "scio/etc", "scio.ini", "tika")  # type: ignore
+    arg_parser.add_argument(
+        "--workers",
+        type=int,
+        default=4,
+        help="Number of documents to extract concurrently (default=4)",
+    )
+    arg_parser.add_argument(
+        "--tika-server",
+        default=parser.ServerEndpoint,
+        help="Tika server endpoint. Separate multiple endpoints with comma, "
+        + f"workers will be distributed among them (default={parser.ServerEndpoint})",
+    )
+    arg_parser.add_argument(
+        "--stats-interval",
+        type=int,
+        default=300,
+        help="Seconds between logging of worker statistics, 0 to disable (default=300)",
+    )
+    args = caep.config.handle_args(arg_parser, "scio/etc", "scio.ini", "tika")
+
+    args.tika_server = [
+        endpoint.strip() for endpoint in args.tika_server.split(",") if endpoint.strip()
+    ]
+
+    return args  # type: ignore
+
+
+class WorkerStats:
+    """Throughput statistics for a worker"""
+
+    def __init__(self, worker_id: int) -> None:
+        self.worker_id = worker_id
+        self.started = time.monotonic()
+        self.jobs = 0
+        self.errors = 0
+        self.bytes = 0
+        self.extract_time = 0.0
+
+    def add(self, size: int, extract_time: float) -> None:
+        """Register an extracted document"""
+        self.jobs += 1
+        self.bytes += size
+        self.extract_time += extract_time
+
+    def summary(self) -> Text:
+        """Human readable summary of the statistics"""
+        elapsed = time.monotonic() - self.started
+        return (
+            f"worker={self.worker_id} jobs={self.jobs} errors={self.errors} "
+            + f"bytes={self.bytes} jobs/min={self.jobs * 60 / elapsed:.2f} "
+            + f"MB/s={self.bytes / (1024 * 1024) / elapsed:.3f} "
+            + f"extract_time={self.extract_time:.1f}s "
+            + f"busy={100 * self.extract_time / elapsed:.1f}%"
+        )
+
+
+def extract(
+    filename: Text, server_endpoint: Text, original_filename: Optional[Text] = None
+) -> Dict[Text, Any]:
+    """Read file and extract text and metadata with Tika. This is blocking,
+    and is run in a worker thread. The file extension is taken from
+    original_filename if specified, for documents stored without extension"""
+
+    with open(filename, "rb") as fh:
+        content = fh.read()
+
+    if (original_filename or filename).endswith(".html"):
+        content = html.unescape(content.decode("utf8")).encode("utf8")
+
+    data: Dict[Text, Any] = parser.from_buffer(content, serverEndpoint=server_endpoint)
+
+    return data
 
 
 class Server:
     """The server class listening for new work on beanstalk and sending it to
     Apache Tika for text extraction and den sending it to Scio for text analyzis."""
 
-    def __init__(self, beanstalk_host: Text = "127.0.0.1", beanstalk_port: int = 11300):
-        self.client: Optional[greenstalk.Client] = None
-        self.connect(beanstalk_host, beanstalk_port)
+    def __init__(
+        self,
+        beanstalk_host: Text = "127.0.0.1",
+        beanstalk_port: int = 11300,
+        tika_servers: Optional[List[Text]] = None,
+        stats_interval: int = 300,
+    ):
+        self.beanstalk_host = beanstalk_host
+        self.beanstalk_port = beanstalk_port
+        self.tika_servers = tika_servers or [parser.ServerEndpoint]
+        self.stats_interval = stats_interval
+        self.stats: List[WorkerStats] = []
+        self.executor: Optional[ThreadPoolExecutor] = None
 
         logging.info("initialize tika VM")
         tika.initVM()
 
-    def client_ready(self) -> bool:
-        """client_ready is a utility function checking whether the
-        beanstalk client has a connection that works."""
+    async def connect(self) -> AsyncBeanstalk:
+        """Create a beanstalk connection, retry until connected"""
 
-        if not self.client:
-            return False
-        try:
-            self.client.stats()
-            return True
-        except (OSError, BrokenPipeError, ConnectionError, ConnectionRefusedError):
-            return False
-
-    def connect(
-        self, beanstalk_host: Text = "127.0.0.1", beanstalk_port: int = 11300
-    ) -> None:
-        """Try to create a beanstalk connection"""
-
-        if self.client:
-            # close existing connection
-            self.client.close()
-
-        while not self.client_ready():
+        while True:
             try:
                 logging.info(
                     "Trying to connect to beanstalkd on %s:%s",
-                    beanstalk_host,
-                    beanstalk_port,
+                    self.beanstalk_host,
+                    self.beanstalk_port,
+                )
+                # We only want to receive messages specifically to scio. The default
+                # beanstalk tube is ignored.
+                return AsyncBeanstalk(
+                    (self.beanstalk_host, self.beanstalk_port),
+                    use="scio_analyze",
+                    watch="scio_doc",
+                    encoding="utf-8",
                 )
-                self.client = greenstalk.Client((beanstalk_host, beanstalk_port))
-            except ConnectionRefusedError as err:
+            except (OSError, ConnectionError) as err:
                 logging.warning("Server.connect: %s", err)
                 logging.info("Server.connect: waiting 5 seconds")
-                time.sleep(5)
-
-        # We only want to receive messages specifically to scio. The default
-        # beanstalk tube is ignored.
-        self.client.watch("scio_doc")
-        self.client.ignore("default")
-        self.client.use("scio_analyze")
-
-    async def reserve(self) -> Any:
-        """Async reserve"""
-        return self.client.reserve()  # type: ignore
+                await asyncio.sleep(5)
 
     async def worker(self, worker_id: int) -> None:
         """Main worker code. Listening to the beanstalk client for ready work, sending it to the
         tika service and then posting the extracted document to the queue for consumption by
-        the analyzis module"""
+        the analyzis module. Each worker has its own beanstalk connection, and runs the
+        extraction in its own thread."""
+
+        loop = asyncio.get_event_loop()
+        stats = self.stats[worker_id]
+        server_endpoint = self.tika_servers[worker_id % len(self.tika_servers)]
+
+        client = await self.connect()
 
         while True:
             logging.info("Worker [%s] waiting for work.", worker_id)
             try:
-                job = await self.reserve()
+                job = await client.reserve()
             except greenstalk.TimedOutError:
                 continue
 
@@ -98,48 +167,79 @@ class Server:
                 meta_data = json.loads(job.body)
             except json.decoder.JSONDecodeError as err:
                 logging.warning("Unable to decode body %s [%s ...]", err, job.body[:25])
-                self.client.delete(job)  # type: ignore
+                await client.delete(job)
                 continue
 
             if "filename" not in meta_data:
                 logging.warning("No 'filename' field in meta data : %s", meta_data)
-                self.client.delete(job)  # type: ignore
+                await client.delete(job)
                 continue
 
             if not os.path.isfile(meta_data["filename"]):
                 logging.warning("Could not find file '%s'", meta_data["filename"])
-                self.client.delete(job)  # type: ignore
+                await client.delete(job)
                 continue
 
-            with open(meta_data["filename"], "rb") as fh:
-                content = fh.read()
-                if meta_data["filename"].endswith(".html"):
-                    content = html.unescape(content.decode("utf8")).encode("utf8")
-                data = parser.from_buffer(content)
-                data.update(meta_data)
+            started = time.monotonic()
+            try:
+                data = await loop.run_in_executor(
+                    self.executor,
+                    extract,
+                    meta_data["filename"],
+                    server_endpoint,
+                    meta_data.get("original_filename"),
+                )
+            except Exception as err:
+                logging.error(
+                    "Worker [%s] unable to extract %s: %s",
+                    worker_id,
+                    meta_data["filename"],
+                    err,
+                )
+                stats.errors += 1
+                await client.delete(job)
+                continue
+
+            stats.add(
+                os.path.getsize(meta_data["filename"]), time.monotonic() - started
+            )
 
-            self.client.delete(job)  # type: ignore
+            await client.delete(job)
             logging.info("Worker [%s] waiting to post result.", worker_id)
             try:
-                self.client.put(  # type: ignore
+                await client.put(
                     gzip.compress(json.dumps({**data, **meta_data}).encode("utf8"))
                 )
                 logging.info("Worker [%s] job done.", worker_id)
             except greenstalk.JobTooBigError:
                 logging.error("Job to big: %s.", meta_data["filename"])
 
+    async def log_stats(self) -> None:
+        """Log worker statistics every stats_interval seconds"""
+
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            for stats in self.stats:
+                logging.info("Worker stats: %s", stats.summary())
+
     async def _start(self, n: int) -> None:
         """Start the server, create n number of workers and wait for data on the queue"""
 
         loop = asyncio.get_event_loop()
         workers = []
 
+        self.executor = ThreadPoolExecutor(max_workers=n)
+        self.stats = [WorkerStats(i) for i in range(n)]
+
+        if self.stats_interval > 0:
+            loop.create_task(self.log_stats())
+
         for i in range(n):
             logging.info("Starting worker [%s]", i)
-            workers.append((n, loop.create_task(self.worker(i))))
+            workers.append((i, loop.create_task(self.worker(i))))
 
         logging.info("Gather all workers")
-        asyncio.gather(*[w for (_, w) in workers])
+        await asyncio.gather(*[w for (_, w) in workers], return_exceptions=True)
 
         for i, worker in workers:
             if worker.exception():
@@ -164,10 +264,15 @@ def main() -> None:
 
     act.scio.logsetup.setup_logging(args.loglevel, args.logfile, "scio-tika-server")
 
-    server = Server(args.beanstalk, args.beanstalk_port)
+    server = Server(
+        args.beanstalk,
+        args.beanstalk_port,
+        tika_servers=args.tika_server,
+        stats_interval=args.stats_interval,
+    )
 
-    logging.info("Starting Tika server")
-    server.start()
+    logging.info("Starting Tika server with %s workers", args.workers)
+    server.start(args.workers)
 
     logging.info("Finnished Tika server")
 
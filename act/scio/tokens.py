@@ -0,0 +1,190 @@
+"""Compact storage of part-of-speach tagged tokens.
+
+A list of (token, tag) tuples uses several small objects per token. The token
+store keeps the tag of each token as an id in a byte array, and each token as
+an offset and length into the text it was found in. Tokens that are not found
+as-is in the text (e.g. the tokenizer replaces " with `` and '') are stored as
+strings. The store works like a read only list of (token, tag) tuples.
+
+The text is not pickled with the store, as it is already part of the
+document. Stores received from other processes (or the result cache) are
+bound to the document content again with bind_tokens()."""
+
+import re
+from array import array
+from collections import Counter
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Sequence,
+    Text,
+    Tuple,
+    Union,
+    overload,
+)
+
+# Max number of characters skipped in the text when looking for the next token,
+# in addition to whitespace
+MAX_GAP = 8
+
+WHITESPACE = re.compile(r"\s*")
+
+
+class TokenStore(Sequence[Tuple[Text, Text]]):
+    """Read only sequence of (token, tag) tuples, stored compact"""
+
+    def __init__(self, content: Text, tagged: Iterable[Tuple[Text, Text]] = ()) -> None:
+        """
+        Args:
+            content:  Text the tokens was found in
+            tagged:   (token, tag) in the order they occur in content
+        """
+
+        self.content = content
+        self.tags: List[Text] = []
+        self.tag_ids = array("B")
+        self.starts = array("L")
+        self.lengths = array("L")
+        # Tokens that are not found in content, indexed on position
+        self.other: Dict[int, Text] = {}
+
+        tag_index: Dict[Text, int] = {}
+        cursor = 0
+
+        for token, tag in tagged:
+            if tag not in tag_index:
+                tag_index[tag] = len(self.tags)
+                self.tags.append(tag)
+
+            start = content.find(token, cursor, cursor + MAX_GAP + len(token))
+
+            if start == -1:
+                # Skip long whitespace runs, e.g. blank lines in extracted text
+                skipped = WHITESPACE.match(content, cursor).end()  # type: ignore
+                if skipped - cursor > MAX_GAP:
+                    start = content.find(token, skipped, skipped + MAX_GAP + len(token))
+
+            if start == -1:
+                self.other[len(self.tag_ids)] = token
+                start = cursor
+                length = 0
+            else:
+                length = len(token)
+                cursor = start + length
+
+            self.tag_ids.append(tag_index[tag])
+            self.starts.append(start)
+            self.lengths.append(length)
+
+    @classmethod
+    def concat(
+        cls, content: Text, stores: Iterable[Tuple[int, "TokenStore"]]
+    ) -> "TokenStore":
+        """Combine stores for parts of content, from (offset in content, store)"""
+
+        res = cls(content)
+
+        tag_index: Dict[Text, int] = {}
+
+        for offset, store in stores:
+            tag_map = []
+            for tag in store.tags:
+                if tag not in tag_index:
+                    tag_index[tag] = len(res.tags)
+                    res.tags.append(tag)
+                tag_map.append(tag_index[tag])
+
+            for position, token in store.other.items():
+                res.other[len(res.tag_ids) + position] = token
+
+            res.tag_ids.extend(tag_map[tag_id] for tag_id in store.tag_ids)
+            res.starts.extend(start + offset for start in store.starts)
+            res.lengths.extend(store.lengths)
+
+        return res
+
+    def __getstate__(self) -> Dict[Text, Any]:
+        """Pickle without the text"""
+
+        state = self.__dict__.copy()
+        state["content"] = ""
+        return state
+
+    def token(self, i: int) -> Text:
+        """Token at position i"""
+
+        if i in self.other:
+            return self.other[i]
+
+        start = self.starts[i]
+        return self.content[start : start + self.lengths[i]]  # noqa: E203
+
+    def tag(self, i: int) -> Text:
+        """Tag of token at position i"""
+
+        return self.tags[self.tag_ids[i]]
+
+    def __len__(self) -> int:
+        return len(self.tag_ids)
+
+    @overload
+    def __getitem__(self, i: int) -> Tuple[Text, Text]: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[Tuple[Text, Text]]: ...
+
+    def __getitem__(
+        self, i: Union[int, slice]
+    ) -> Union[Tuple[Text, Text], List[Tuple[Text, Text]]]:
+        if isinstance(i, slice):
+            return [self[n] for n in range(*i.indices(len(self)))]
+
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("token index out of range")
+
+        return (self.token(i), self.tag(i))
+
+    def __iter__(self) -> Iterator[Tuple[Text, Text]]:
+        for i in range(len(self)):
+            yield (self.token(i), self.tag(i))
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, (TokenStore, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(
+            tuple(a) == tuple(b) for a, b in zip(self, other)
+        )
+
+    def __repr__(self) -> Text:
+        return f"TokenStore({len(self)} tokens)"
+
+    def to_list(self) -> List[List[Text]]:
+        """Tokens as list of [token, tag], e.g. for JSON serialization"""
+
+        return [[token, tag] for token, tag in self]
+
+    def summary(self) -> Dict[Text, Any]:
+        """Number of tokens, and number of tokens per tag"""
+
+        counts = Counter(self.tag_ids)
+
+        return {
+            "count": len(self),
+            "tags": {self.tags[tag_id]: count for tag_id, count in counts.items()},
+        }
+
+
+def bind_tokens(nlpdata: Dict[Text, Any]) -> None:
+    """Bind the token stores in the plugin results of nlpdata (that are not
+    bound) to the document content"""
+
+    for value in nlpdata.values():
+        if isinstance(value, dict):
+            tokens = value.get("tokens")
+            if isinstance(tokens, TokenStore) and not tokens.content:
+                tokens.content = nlpdata["content"]
@@ -41,6 +41,7 @@ import magic
 import requests
 
 from act.scio.config import get_cache_dir
+from act.scio.feeds.upload import UploadError, new_session, upload_batch
 
 LOGGER = logging.getLogger("root")
 
@@ -176,6 +177,12 @@ def init() -> argparse.Namespace:
         default="http://localhost:3000/submit",
         help="URL to scio for submit (default=http://localhost:3000)",
     )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=50,
+        help="Number of files uploaded to scio in each request (default=50)",
+    )
     parser.add_argument(
         "directories",
         metavar="DIR",
@@ -256,6 +263,34 @@ def to_scio_submit_post_data(obj: IO[bytes], file_name: Text) -> Dict[Text, Text
     return {"content": read_as_base64(obj), "filename": file_name}
 
 
+def upload_documents(
+    url: Text,
+    documents: List[Dict[Text, Any]],
+    batch_size: int,
+    session: Optional[requests.Session] = None,
+) -> None:
+    """Upload documents to scio with the batch submit endpoint, batch_size
+    documents in each request"""
+
+    session = session or new_session()
+    batch_size = max(batch_size, 1)
+
+    for i in range(0, len(documents), batch_size):
+        batch = documents[i : i + batch_size]  # noqa: E203
+
+        try:
+            results = upload_batch(url, batch, session)
+        except UploadError as err:
+            LOGGER.error(err)
+            continue
+
+        for document, result in zip(batch, results):
+            if result.get("error"):
+                LOGGER.error(
+                    "Unable to upload %s: %s", document["filename"], result["error"]
+                )
+
+
 def upload(args: argparse.Namespace) -> None:
     """entry point"""
 
@@ -265,6 +300,9 @@ def upload(args: argparse.Namespace) -> None:
 
     LOGGER.info("Found %d files", len(candidates))
 
+    session = new_session()
+    documents: List[Dict[Text, Any]] = []
+
     for candidate in candidates:
 
         partial_feed = candidate.metadata.get("partial_feed", False)
@@ -290,14 +328,17 @@ def upload(args: argparse.Namespace) -> None:
                 with open(candidate.filename, "rb") as file_h:
                     post_data = to_scio_submit_post_data(file_h, candidate.filename)
                     my_metadata.update(post_data)
-                    session = requests.Session()
-                    session.trust_env = False
-                    session.post(args.scio, json=my_metadata)
+                    documents.append(my_metadata)
+                if len(documents) >= args.batch_size:
+                    upload_documents(args.scio, documents, args.batch_size, session)
+                    documents = []
             else:
                 LOGGER.info(
                     "Not uploading %s (wrong mimetype)", candidate.filename
                 )  # NOQA
 
+    upload_documents(args.scio, documents, args.batch_size, session)
+
 
 def main() -> None:
     args = init()
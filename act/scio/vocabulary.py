@@ -8,9 +8,8 @@
 
 import configparser
 import re
-import sys
 from logging import info, warning
-from typing import Any, Callable, Dict, List, Optional, Pattern, Text, Union
+from typing import Any, Callable, Dict, List, Match, Optional, Pattern, Text, Union
 
 import addict
 import nltk
@@ -36,6 +35,18 @@ def identity(x: Any) -> Any:
     return x
 
 
+def findall_value(match: Match[Text]) -> Any:
+    """Value of match, as it would be returned by findall"""
+
+    groups = match.groups()
+
+    if not groups:
+        return match.group(0)
+    if len(groups) == 1:
+        return groups[0]
+    return groups
+
+
 def from_config(config_filename: str) -> addict.Dict:
     """
     Load vocabularies from config and return Dict
@@ -95,6 +106,7 @@ class Vocabulary:
         self.config = addict.Dict(DEFAULT_CONFIG)
         self.config.update(config)
         self.regex: List[Pattern[Text]] = []
+        self.alias_matcher: Optional[aliasregex.AliasMatcher] = None
         self.vocab: Dict[str, Dict[str, addict.Dict]] = addict.Dict(
             none=addict.Dict(),
             lower=addict.Dict(),
@@ -117,12 +129,11 @@ class Vocabulary:
             self.regex = []
 
         if self.config.regexfromalias:
-            for aliasre in aliasregex.get_reg_ex_set(self.config.alias):
-                try:
-                    self.regex.append(re.compile(aliasre, re.IGNORECASE))
-                except re.error:
-                    sys.stderr.write(f"ERROR in regex {aliasre}\n")
-                    raise
+            # All alias regexes are searched for in one pass, instead of
+            # one pass over the text for each alias
+            self.alias_matcher = aliasregex.AliasMatcher(
+                aliasregex.regex_alias_set(self.config.alias), re.IGNORECASE
+            )
 
     def load_alias(self, filename: str) -> None:
         """
@@ -193,6 +204,13 @@ class Vocabulary:
                     info("%s found by regex %s", match, regex)
                 result.append(normalize_result(match))
 
+        if self.alias_matcher:
+            for regex, alias_match in self.alias_matcher.finditer(text):
+                match = findall_value(alias_match)
+                if debug:
+                    info("%s found by regex %s", match, regex)
+                result.append(normalize_result(match))
+
         return result
 
     def get_key_mod(self, key_mod: Optional[str]) -> str:
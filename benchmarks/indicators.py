@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Benchmark the indicators plugin against the previous implementation,
+which ran one findall per indicator type over the full text and looked up
+the TLD of each fqdn candidate in a set after splitting it on ".".
+
+Usage: python benchmarks/indicators.py [--size MB] [--rounds N]
+"""
+
+import argparse
+import asyncio
+import ipaddress
+import random
+import re
+import time
+from typing import Callable, Dict, List, Text
+
+import addict
+
+from act.scio.plugins.indicators import Plugin
+
+WORDS = """the threat actor used a custom backdoor to gain access to the network
+of several companies in the energy sector. The malware communicates with its
+command and control servers over https, and persistence is achieved through a
+scheduled task. Version 1.2.3 of the loader was observed in report.pdf and
+setup.exe, see section 4.1 for details.""".split()
+
+INDICATORS = [
+    "hXXp://my.test.no/hxxp/",
+    "be5ee729563fa379e71d82d61cc3fdcf",
+    "103cb6c404ba43527c2deac40fbe984f7d72f0b2366c0b6af01bd0b4f1a30c74",
+    "3c07cb361e053668b4686de6511d6a904a9c4495",
+    "%2fchessbase.com",
+    "127[.]0[.]0[.]2",
+    "127.0.0{.}3",
+    "https://www.vg.no/index.html?q=news#top",
+    "5.6.7.8/9",
+    "www.nytimes3xbfgragh.onion",
+    "fe80::ea39:35ff:fe12:2d71/64",
+    "user@fastmail.fm",
+    "evil-domain[.]com",
+]
+
+PLUGIN = Plugin()
+PLUGIN.warmup()
+
+
+def legacy_analyze(content: Text) -> Dict[Text, List[Text]]:
+    """Previous implementation of Plugin.analyze"""
+
+    p = PLUGIN
+    tlds = p.suffixes.root
+
+    text = (
+        content.replace("[.]", ".")
+        .replace("{.}", ".")
+        .replace("(.)", ".")
+        .replace("\\.", ".")
+    )
+    text = re.sub("%2[fF]", "/", text)
+
+    res = {}
+    res["md5"] = p.md5.findall(text)
+    res["sha1"] = p.sha1.findall(text)
+    res["sha256"] = p.sha256.findall(text)
+    res["email"] = p.email.findall(text)
+    res["fqdn"] = [
+        dn for dn in p.fqdn.findall(text) if dn.split(".")[-1].lower() in tlds
+    ]
+    res["ipv4"] = [".".join(ip) for ip in p.ipv4.findall(text)]
+    res["uri"] = [re.sub("^hxxp", "http", uri, 0, re.I) for uri in p.uri.findall(text)]
+    res["ipv4net"] = p.ipv4net.findall(text)
+
+    pos_ipv6 = []
+    for candidate in p.allposipv6.findall(text):
+        try:
+            if ipaddress.ip_address(candidate).version == 6:
+                pos_ipv6.append(candidate)
+        except ValueError:
+            pass
+    res["ipv6"] = pos_ipv6
+
+    return res
+
+
+def current_analyze(content: Text) -> Dict[Text, List[Text]]:
+    """Current implementation"""
+
+    res = asyncio.run(PLUGIN.analyze(addict.Dict(content=content)))
+    return res.result.to_dict()  # type: ignore
+
+
+def report(size: int) -> Text:
+    """Generate report of approximately size bytes"""
+
+    rnd = random.Random(42)
+    parts: List[Text] = []
+    length = 0
+    while length < size:
+        if rnd.random() < 0.02:
+            token = rnd.choice(INDICATORS)
+        else:
+            token = rnd.choice(WORDS)
+        parts.append(token)
+        length += len(token) + 1
+    return " ".join(parts)
+
+
+def bench(
+    func: Callable[[Text], Dict[Text, List[Text]]], text: Text, rounds: int
+) -> float:
+    """Return best time of rounds"""
+
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=float, default=5, help="Report size in MB")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    text = report(int(args.size * 1024 * 1024))
+
+    assert legacy_analyze(text) == current_analyze(text), "Results differ"
+
+    legacy = bench(legacy_analyze, text, args.rounds)
+    current = bench(current_analyze, text, args.rounds)
+
+    print(f"report size: {len(text) / (1024 * 1024):.1f} MB")
+    print(f"legacy:      {legacy:.3f}s")
+    print(f"current:     {current:.3f}s ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
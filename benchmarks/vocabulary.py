@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""Benchmark Vocabulary.regex_search with regexfromalias against the previous
+implementation, which ran findall for each alias regex over the full text.
+
+Usage: python benchmarks/vocabulary.py [--size KB] [--rounds N]
+"""
+
+import argparse
+import os
+import random
+import re
+import time
+from typing import Callable, List, Text
+
+import addict
+
+from act.scio.aliasregex import alias_set_from_config, get_reg_ex_set
+from act.scio.vocabulary import Vocabulary
+
+CONFIGDIR = os.path.join(os.path.dirname(__file__), "../act/scio/etc/plugins")
+
+VOCABULARIES = ["ta_aliases.cfg", "tools.cfg", "sectors.cfg", "country_aliases.cfg"]
+
+WORDS = """the threat actor used a custom backdoor to gain access to the network
+of several companies in the energy sector. The malware communicates with its
+command and control servers over https, and persistence is achieved through a
+scheduled task. Version 1.2.3 of the loader was observed in report.pdf and
+setup.exe, see section 4.1 for details.""".split()
+
+
+def legacy_search(alias: Text) -> Callable[[Text], List[Text]]:
+    """Previous implementation of Vocabulary.regex_search"""
+
+    regexes = [re.compile(regex, re.IGNORECASE) for regex in get_reg_ex_set(alias)]
+
+    def search(text: Text) -> List[Text]:
+        result = []
+        for regex in regexes:
+            result += regex.findall(text)
+        return result
+
+    return search
+
+
+def current_search(alias: Text) -> Callable[[Text], List[Text]]:
+    """Current implementation"""
+
+    vocab = Vocabulary(addict.Dict(alias=alias, regexfromalias=True))
+
+    return vocab.regex_search
+
+
+def report(size: int, aliases: List[Text]) -> Text:
+    """Generate report of approximately size bytes"""
+
+    rnd = random.Random(42)
+    parts: List[Text] = []
+    length = 0
+    while length < size:
+        if rnd.random() < 0.01:
+            token = rnd.choice(aliases)
+        else:
+            token = rnd.choice(WORDS)
+        parts.append(token)
+        length += len(token) + 1
+    return " ".join(parts)
+
+
+def bench(func: Callable[[Text], List[Text]], text: Text, rounds: int) -> float:
+    """Return best time of rounds"""
+
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func(text)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=float, default=200, help="Report size in KB")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    for name in VOCABULARIES:
+        alias = os.path.join(CONFIGDIR, name)
+
+        text = report(int(args.size * 1024), sorted(alias_set_from_config(alias)))
+
+        legacy_func = legacy_search(alias)
+        current_func = current_search(alias)
+
+        # The order of the legacy result depends on the order of a set
+        assert sorted(map(str, legacy_func(text))) == sorted(
+            map(str, current_func(text))
+        ), f"Results differ for {name}"
+
+        legacy = bench(legacy_func, text, args.rounds)
+        current = bench(current_func, text, args.rounds)
+
+        print(f"{name}:")
+        print(f"  legacy:  {legacy:.3f}s")
+        print(f"  current: {current:.3f}s ({legacy / current:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
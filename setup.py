@@ -46,10 +46,11 @@ setup(
         "beautifulsoup4",
         "bs4",
         "caep",
-        "elasticsearch>=8.0.0",
-        "fastapi",
+        "elasticsearch[async]>=8.0.0",
+        "fastapi>=0.115.3",
         "feedparser",
         "greenstalk>=2.0.0",
+        "httpx",
         "ipaddress",
         "justext",
         "nltk",
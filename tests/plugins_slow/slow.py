@@ -0,0 +1,22 @@
+import time
+from typing import List, Text
+
+import addict
+
+from act.scio.plugin import BasePlugin, Result
+
+
+class Plugin(BasePlugin):
+    """
+    Block for the number of seconds given in the content
+    """
+
+    name = "slow"
+    info = "test timeout info"
+    version = "0.1"
+    dependencies: List[Text] = []
+    cpu_bound = True
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        time.sleep(float(nlpdata.content))
+        return Result(name=self.name, version=self.version, result=addict.Dict())
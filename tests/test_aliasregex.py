@@ -1,5 +1,8 @@
 "Alias regex tests"
-from act.scio.aliasregex import normalize
+
+import re
+
+from act.scio.aliasregex import AliasMatcher, normalize, regex_from_alias
 
 
 def test_aliasregex_normalization() -> None:
@@ -11,3 +14,41 @@ def test_aliasregex_normalization() -> None:
     assert normalize("APT-27") == "apt 27"
     assert normalize("APT- 27") == "apt 27"
     assert normalize("winntiGroup") == "winnti group"
+
+
+def test_alias_matcher() -> None:
+    "Combined matcher gives the same result as the individual alias regexes"
+
+    aliases = [
+        "APT28",
+        "APT 28 Group",
+        "Fancy Bear",
+        "Bear",
+        "Agent.BTZ",
+        "Sakula (variant)",
+    ]
+
+    text = """apt_28, APT28 group, Fancy-Bear and fancybear. The BEAR is not
+    agent-btz, but AgentXBTZ is. apt 2828 sakula variant"""
+
+    expected = sorted(
+        match.group(0)
+        for alias in aliases
+        for match in re.finditer(regex_from_alias(alias), text, re.IGNORECASE)
+    )
+
+    matches = [match.group(0) for _, match in AliasMatcher(aliases).finditer(text)]
+
+    assert sorted(matches) == expected
+    assert matches == [
+        "apt_28",
+        "APT28",
+        "APT28 group",
+        "Fancy-Bear",
+        "Bear",
+        "fancybear",
+        "BEAR",
+        "agent-btz",
+        "AgentXBTZ",
+        "sakula variant",
+    ]
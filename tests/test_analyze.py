@@ -0,0 +1,111 @@
+"""test analyze worker"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+
+import addict
+import pytest
+
+# Unfortunately not exported
+from _pytest.capture import CaptureFixture
+from _pytest.monkeypatch import MonkeyPatch
+
+from act.scio import analyze, plugin
+from act.scio.runner import PluginRunner
+from act.scio.tokens import TokenStore
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_worker_stdin(
+    monkeypatch: MonkeyPatch, capsys: CaptureFixture[str]
+) -> None:
+    """Without beanstalk, the worker should analyze one document from stdin"""
+
+    plugin_dir = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "plugins_deps"
+    )
+
+    plugins = plugin.load_external_plugins(plugin_dir)
+
+    monkeypatch.setattr(
+        "sys.stdin", io.StringIO("This is a test. And this is another one.")
+    )
+
+    args = argparse.Namespace(
+        beanstalk=None,
+        webdump=None,
+        metadata_date_fields=[],
+        pos_tag_tokens="full",
+        stdout_fields=["*"],
+    )
+
+    runner = PluginRunner(plugins, processes=0)
+
+    await analyze.worker(0, args, plugins, runner, None, None, asyncio.Event())
+
+    res = json.loads(capsys.readouterr().out)
+
+    assert res["count"]["This is a test"] == 14
+    assert res["content"] == "This is a test. And this is another one."
+
+
+def test_project() -> None:
+    """Only selected fields and non-transient plugins should be output"""
+
+    result = addict.Dict(
+        content="APT28 is active",
+        hexdigest="abc",
+        metadata={"Content-Type": "text/plain", "X-Parsed-By": "tika"},
+        pos_tag={"tokens": [["APT28", "NNP"]]},
+        indicators={"fqdn": ["example.com"], "md5": []},
+    )
+
+    transient = {"pos_tag"}
+
+    es = analyze.project(result, ["*", "-content", "-metadata.X-Parsed-By"], transient)
+    assert sorted(es) == ["hexdigest", "indicators", "metadata"]
+    assert es.metadata == {"Content-Type": "text/plain"}
+
+    # The result is not modified
+    assert "X-Parsed-By" in result.metadata
+    assert "content" in result
+
+    selected = analyze.project(
+        result, ["hexdigest", "indicators.fqdn", "pos_tag"], transient
+    )
+    assert selected == {
+        "hexdigest": "abc",
+        "indicators": {"fqdn": ["example.com"]},
+        "pos_tag": {"tokens": [["APT28", "NNP"]]},
+    }
+
+    assert analyze.project(result, ["missing", "-missing.field"], transient) == {}
+
+
+def test_output_tokens() -> None:
+    """pos_tag tokens should be output as list, summary or dropped"""
+
+    def result() -> addict.Dict:
+        tokens = TokenStore("APT28 is active", [("APT28", "NNP"), ("is", "VBZ")])
+        return addict.Dict(pos_tag=addict.Dict(tokens=tokens, chunks=[[0, 0]]))
+
+    full = result()
+    analyze.output_tokens(full, "full")
+    assert full.pos_tag.tokens == [["APT28", "NNP"], ["is", "VBZ"]]
+
+    summary = result()
+    analyze.output_tokens(summary, "summary")
+    assert "tokens" not in summary.pos_tag
+    assert summary.pos_tag.summary == {"count": 2, "tags": {"NNP": 1, "VBZ": 1}}
+
+    drop = result()
+    analyze.output_tokens(drop, "drop")
+    assert drop.pos_tag == {"chunks": [[0, 0]]}
+
+    # Results without pos_tag are not changed
+    other = addict.Dict(content="test")
+    analyze.output_tokens(other, "drop")
+    assert other == {"content": "test"}
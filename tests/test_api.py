@@ -0,0 +1,614 @@
+"""test api helpers and endpoints"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Text, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+
+import act.scio.api
+from act.scio.api import (
+    QueueMonitor,
+    ResponseCache,
+    base64_chunks,
+    etag_match,
+    lines,
+    ndjson_lines,
+    normalize_period,
+    parse_args,
+    write_stream,
+)
+from act.scio.digestset import DigestSet
+from act.scio.docstore import DocumentStore
+
+
+async def rows(keys: List[Text]) -> AsyncIterator[Tuple[Text, int]]:
+    """Async (key, count) rows"""
+    for key in keys:
+        yield key, 1
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_lines() -> None:
+    """Keys should be new line separated, and sent in chunks"""
+
+    keys = [f"{i}.example.com" for i in range(100)]
+
+    chunks = [chunk async for chunk in lines(rows(keys), chunk_size=100)]
+
+    assert len(chunks) > 1
+    assert b"".join(chunks).decode("utf8") == "\n".join(keys)
+
+    assert [chunk async for chunk in lines(rows([]))] == []
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_response_cache(tmp_path: Path) -> None:
+    """Cached entries should be returned until expired, and then refreshed
+    in the background while the expired entry is returned"""
+
+    fetched: List[bytes] = []
+
+    async def fetch() -> AsyncIterator[bytes]:
+        fetched.append(f"body {len(fetched)}".encode("utf8"))
+        yield fetched[-1]
+
+    cache = ResponseCache(ttl=60, idle=600, directory=str(tmp_path))
+
+    entry = await cache.get("ipv4", fetch)
+    assert entry.filename.read_bytes() == b"body 0"
+    assert (await cache.get("ipv4", fetch)).etag == entry.etag
+    assert len(fetched) == 1
+
+    # Expire entry
+    cache.entries["ipv4"] = entry._replace(created=entry.created - 61)
+
+    assert (await cache.get("ipv4", fetch)).filename == entry.filename
+    await asyncio.sleep(0.01)  # Let the background refresh run
+    refreshed = await cache.get("ipv4", fetch)
+    assert refreshed.filename.read_bytes() == b"body 1"
+    assert refreshed.etag != entry.etag
+
+    # The replaced body is kept for responses that are already sending it
+    assert entry.filename.exists()
+
+    cache.close()
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_response_cache_single_fetch(tmp_path: Path) -> None:
+    """Concurrent requests for a key should share one fetch"""
+
+    calls = 0
+
+    async def fetch() -> AsyncIterator[bytes]:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        yield b"body"
+
+    cache = ResponseCache(ttl=60, idle=600, directory=str(tmp_path))
+
+    entries = await asyncio.gather(*[cache.get("ipv4", fetch) for _ in range(5)])
+
+    assert calls == 1
+    assert all(entry.filename.read_bytes() == b"body" for entry in entries)
+
+    cache.close()
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_response_cache_size(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The least recently used entries should be removed, and their files
+    deleted"""
+
+    monkeypatch.setattr(act.scio.api, "RETIRE_DELAY", 0)
+
+    async def fetch() -> AsyncIterator[bytes]:
+        yield b"body"
+
+    cache = ResponseCache(ttl=60, idle=600, max_entries=2, directory=str(tmp_path))
+
+    for key in ("ipv4", "ipv6", "ipv4", "fqdn"):
+        await cache.get(key, fetch)
+
+    await asyncio.sleep(0.01)
+
+    assert sorted(cache.entries) == ["fqdn", "ipv4"]
+    assert len(list(cache.directory.iterdir())) == 2
+
+    cache.close()
+
+
+class TermsClient:
+    """Asyncio elasticsearch client returning keys from a composite
+    aggregation in one page"""
+
+    def __init__(self, keys: List[Text]) -> None:
+        self.keys = keys
+        self.searches = 0
+
+    async def search(self, index: Text, body: Dict[Text, Any]) -> Dict[Text, Any]:
+        self.searches += 1
+        (term,) = body["aggs"]
+        after = body["aggs"][term]["composite"].get("after")
+        keys = [] if after else self.keys
+        return {
+            "aggregations": {
+                term: {
+                    "buckets": [{"key": {term: key}, "doc_count": 1} for key in keys],
+                    **({"after_key": {term: keys[-1]}} if keys else {}),
+                }
+            }
+        }
+
+
+def api_client(**kwargs: Any) -> TestClient:
+    """Test client for the API, with args from kwargs"""
+
+    act.scio.api.app.dependency_overrides[parse_args] = lambda: argparse.Namespace(
+        **kwargs
+    )
+
+    return TestClient(act.scio.api.app)
+
+
+@pytest.fixture(autouse=True)  # type: ignore
+def clear_overrides() -> Iterator[None]:
+    """Remove args set by api_client after each test"""
+
+    yield
+    act.scio.api.app.dependency_overrides.clear()
+
+
+def test_indicators(tmp_path: Path) -> None:
+    """Indicators should be served from the cache, with ETag"""
+
+    es_client = TermsClient(["a.example.com", "b.example.com"])
+    cache = ResponseCache(ttl=300, idle=3000, directory=str(tmp_path))
+
+    client = api_client(
+        elasticsearch_client=es_client,
+        indicators_cache_ttl=300,
+        indicators_cache=cache,
+    )
+
+    res = client.get("/indicators/fqdn", params={"last": "1d"})
+    assert res.status_code == 200
+    assert res.text == "a.example.com\nb.example.com"
+
+    etag = res.headers["ETag"]
+
+    res = client.get("/indicators/fqdn", params={"last": "24h"})
+    assert res.headers["ETag"] == etag
+    assert es_client.searches == 1
+
+    res = client.get(
+        "/indicators/fqdn", params={"last": "1d"}, headers={"If-None-Match": etag}
+    )
+    assert res.status_code == 304
+
+    cache.close()
+
+
+class FakeQueue:
+    """Beanstalk client and queue monitor, recording queued jobs"""
+
+    def __init__(self) -> None:
+        self.jobs: List[Dict[Text, Any]] = []
+
+    def max_jobs_ready(self) -> int:
+        return 0
+
+    async def put(self, body: bytes, **kwargs: Any) -> int:
+        self.jobs.append(json.loads(body))
+        return len(self.jobs)
+
+    async def put_many(self, bodies: List[bytes], **kwargs: Any) -> List[Any]:
+        return [await self.put(body) for body in bodies]
+
+
+def submit_args(tmp_path: Path, queue: FakeQueue) -> argparse.Namespace:
+    """Args for the submit endpoints"""
+
+    return argparse.Namespace(
+        queue_monitor=queue,
+        beanstalk_client=queue,
+        max_jobs=10,
+        document_store=DocumentStore(tmp_path / "documents"),
+        submitted=DigestSet(str(tmp_path / "submitted.db"), ttl=3600),
+        dedup_elasticsearch=False,
+        dedup_merge=False,
+        elasticsearch_client=None,
+    )
+
+
+def submit_client(tmp_path: Path, queue: FakeQueue) -> TestClient:
+    """Test client for the submit endpoints"""
+
+    return api_client(**vars(submit_args(tmp_path, queue)))
+
+
+def test_submit_duplicate(tmp_path: Path) -> None:
+    """Documents submitted again should be duplicates, unless they are only
+    submitted without store before"""
+
+    queue = FakeQueue()
+    client = submit_client(tmp_path, queue)
+
+    content = base64.b64encode(b"report").decode("ascii")
+    hexdigest = hashlib.sha256(b"report").hexdigest()
+
+    def submit(store: bool) -> Dict[Text, Any]:
+        res = client.post(
+            "/submit", json={"content": content, "filename": "a.txt", "store": store}
+        )
+        assert res.status_code == 200
+        return res.json()  # type: ignore
+
+    assert not submit(store=False)["duplicate"]
+    assert submit(store=False)["duplicate"]
+
+    stored = submit(store=True)
+    assert not stored["duplicate"]
+    assert Path(stored["filename"]).read_bytes() == b"report"
+    assert stored["filename"] == str(
+        tmp_path / "documents" / hexdigest[:2] / hexdigest[2:4] / hexdigest
+    )
+
+    assert submit(store=True)["duplicate"]
+    assert submit(store=False)["duplicate"]
+
+    assert [job["store"] for job in queue.jobs] == [False, True]
+
+
+def test_submit_force(tmp_path: Path) -> None:
+    """Documents submitted with force should be analyzed again"""
+
+    queue = FakeQueue()
+    client = submit_client(tmp_path, queue)
+
+    content = base64.b64encode(b"report").decode("ascii")
+
+    def submit(force: bool) -> Dict[Text, Any]:
+        res = client.post(
+            "/submit", json={"content": content, "filename": "a.txt", "force": force}
+        )
+        assert res.status_code == 200
+        return res.json()  # type: ignore
+
+    assert not submit(force=False)["duplicate"]
+    assert submit(force=False)["duplicate"]
+    assert not submit(force=True)["duplicate"]
+    assert submit(force=False)["duplicate"]
+
+    res = client.post(
+        "/submit/file", params={"filename": "a.txt", "force": "true"}, content=b"report"
+    )
+    assert res.status_code == 200
+    assert not res.json()["duplicate"]
+
+    assert len(queue.jobs) == 3
+
+
+def test_download_filename(tmp_path: Path) -> None:
+    """Downloads should be named with the submitted filename"""
+
+    client = submit_client(tmp_path, FakeQueue())
+
+    res = client.post(
+        "/submit/file", params={"filename": "dir/report_1.pdf"}, content=b"report"
+    )
+    assert res.status_code == 200
+    hexdigest = res.json()["hexdigest"]
+
+    res = client.get("/download", params={"id": hexdigest})
+    assert res.status_code == 200
+    assert res.content == b"report"
+    assert 'filename="report_1.pdf"' in res.headers["content-disposition"]
+
+    # Documents stored without a filename are named by hexdigest
+    content = b"other report"
+    hexdigest = hashlib.sha256(content).hexdigest()
+    DocumentStore(tmp_path / "documents").write(content, hexdigest)
+
+    res = client.get("/download", params={"id": hexdigest})
+    assert f'filename="{hexdigest}.txt"' in res.headers["content-disposition"]
+
+
+def test_download_range(tmp_path: Path) -> None:
+    """Range requests should return the requested part of the document"""
+
+    client = submit_client(tmp_path, FakeQueue())
+
+    content = bytes(range(256)) * 4
+    hexdigest = hashlib.sha256(content).hexdigest()
+    DocumentStore(tmp_path / "documents").write(content, hexdigest)
+
+    res = client.get(
+        "/download", params={"id": hexdigest}, headers={"Range": "bytes=0-9"}
+    )
+
+    assert res.status_code == 206
+    assert res.headers["content-range"] == f"bytes 0-9/{len(content)}"
+    assert res.headers["content-length"] == "10"
+    assert res.content == content[:10]
+
+
+def test_download_json(tmp_path: Path) -> None:
+    """The JSON download should decode to the original document"""
+
+    client = submit_client(tmp_path, FakeQueue())
+
+    # The largest document is encoded in more than one chunk
+    for content in (b"", b"a", b"report", bytes(range(256)) * 4001):
+        hexdigest = hashlib.sha256(content).hexdigest()
+        DocumentStore(tmp_path / "documents").write(content, hexdigest)
+
+        res = client.get("/download_json", params={"id": hexdigest})
+
+        assert res.status_code == 200
+        assert res.headers["content-length"] == str(len(res.content))
+
+        data = res.json()
+        assert data["error"] is None
+        assert data["bytes"] == len(content)
+        assert data["encoding"] == "base64"
+        assert base64.b64decode(data["content"]) == content
+
+
+def document(content: bytes, store: bool = True) -> Dict[Text, Any]:
+    """Document for submit"""
+
+    return {
+        "content": base64.b64encode(content).decode("ascii"),
+        "filename": "report.txt",
+        "store": store,
+    }
+
+
+def ndjson(*documents: Any) -> bytes:
+    """Documents as new line delimited JSON"""
+
+    return b"".join(
+        (doc if isinstance(doc, bytes) else json.dumps(doc).encode("utf8")) + b"\n"
+        for doc in documents
+    )
+
+
+def test_submit_batch(tmp_path: Path) -> None:
+    """Each document should have a result, and only new documents queued"""
+
+    queue = FakeQueue()
+    client = submit_client(tmp_path, queue)
+
+    res = client.post(
+        "/submit/batch",
+        content=ndjson(
+            document(b"a"), b"{not json", document(b"a"), document(b"b", store=False)
+        ),
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert res.status_code == 200
+
+    results = res.json()["results"]
+
+    assert [result["hexdigest"] for result in results] == [
+        hashlib.sha256(b"a").hexdigest(),
+        "",
+        hashlib.sha256(b"a").hexdigest(),
+        hashlib.sha256(b"b").hexdigest(),
+    ]
+    assert results[1]["error"].startswith("Invalid document")
+    assert [result["duplicate"] for result in results] == [False, False, True, False]
+
+    assert [job["hexdigest"] for job in queue.jobs] == [
+        results[0]["hexdigest"],
+        results[3]["hexdigest"],
+    ]
+
+
+class FailingQueue(FakeQueue):
+    """Queue where put_many fails"""
+
+    async def put_many(self, bodies: List[bytes], **kwargs: Any) -> List[Any]:
+        raise ConnectionError("beanstalk is gone")
+
+
+def test_submit_batch_queue_error(tmp_path: Path) -> None:
+    """Documents should not be marked as submitted if the batch fails"""
+
+    client = submit_client(tmp_path, FailingQueue())
+
+    with pytest.raises(ConnectionError):
+        client.post("/submit/batch", content=ndjson(document(b"a")))
+
+    queue = FakeQueue()
+    client = submit_client(tmp_path, queue)
+
+    res = client.post("/submit/batch", content=ndjson(document(b"a")))
+
+    assert not res.json()["results"][0]["duplicate"]
+    assert len(queue.jobs) == 1
+
+
+class DisconnectingRequest:
+    """Request where the client disconnects after the first document"""
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        yield ndjson(document(b"a"))
+        raise ConnectionResetError("client disconnected")
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_submit_batch_disconnect(tmp_path: Path) -> None:
+    """Stored documents should not be marked as submitted if the client
+    disconnects before the documents are queued"""
+
+    queue = FakeQueue()
+    args = submit_args(tmp_path, queue)
+
+    with pytest.raises(ConnectionResetError):
+        await act.scio.api.submit_batch(DisconnectingRequest(), args)  # type: ignore
+
+    assert not queue.jobs
+    assert not args.submitted.contains(hashlib.sha256(b"a").hexdigest())
+
+
+def test_etag_match() -> None:
+    """ETags should match in If-None-Match lists, weak tags and *"""
+
+    assert etag_match('"abc"', '"abc"')
+    assert etag_match('"def", W/"abc"', '"abc"')
+    assert etag_match("*", '"abc"')
+    assert not etag_match('"def"', '"abc"')
+    assert not etag_match(None, '"abc"')
+
+
+def test_normalize_period() -> None:
+    """Equal periods should have the same key"""
+
+    assert normalize_period("1d") == normalize_period("24h") == "86400s"
+    assert normalize_period("90d") == normalize_period("2160h")
+    assert normalize_period("01M") == "1M"
+    assert normalize_period("1700000000000") == "1700000000000"
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_write_stream(tmp_path: Path) -> None:
+    """Chunks should be written to file and hashed"""
+
+    chunks = [b"a" * 1000, b"b" * 1000, b"c"]
+
+    async def stream() -> AsyncIterator[bytes]:
+        for chunk in chunks:
+            yield chunk
+
+    filename = tmp_path / "document.pdf"
+
+    hexdigest, count = await write_stream(filename, stream(), buffer_size=1500)
+
+    assert filename.read_bytes() == b"".join(chunks)
+    assert hexdigest == hashlib.sha256(b"".join(chunks)).hexdigest()
+    assert count == 2001
+    assert [p.name for p in tmp_path.iterdir()] == ["document.pdf"]
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_write_stream_error(tmp_path: Path) -> None:
+    """Partial files should be removed if the upload fails"""
+
+    async def stream() -> AsyncIterator[bytes]:
+        yield b"a"
+        raise ConnectionError("client disconnected")
+
+    with pytest.raises(ConnectionError):
+        await write_stream(tmp_path / "document.pdf", stream())
+
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_ndjson_lines() -> None:
+    """Lines should be split across chunks, without empty lines"""
+
+    async def stream() -> AsyncIterator[bytes]:
+        for chunk in (b'{"a": 1}\n{"b"', b": 2}\n\n", b'{"c": 3}'):
+            yield chunk
+
+    assert [line async for line in ndjson_lines(stream())] == [
+        b'{"a": 1}',
+        b'{"b": 2}',
+        b'{"c": 3}',
+    ]
+
+    long_line = b"x" * 100000
+
+    async def long_stream() -> AsyncIterator[bytes]:
+        data = b"\n" + long_line + b"\n" + long_line
+        for i in range(0, len(data), 1000):
+            yield data[i : i + 1000]  # noqa: E203
+
+    assert [line async for line in ndjson_lines(long_stream())] == [
+        long_line,
+        long_line,
+    ]
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_base64_chunks(tmp_path: Path) -> None:
+    """Chunks should join to the base64 encoding of the file"""
+
+    content = bytes(range(256)) * 10
+    filename = tmp_path / "document.pdf"
+    filename.write_bytes(content)
+
+    chunks = [chunk async for chunk in base64_chunks(str(filename), chunk_size=300)]
+
+    assert len(chunks) == 9
+    assert b"".join(chunks) == base64.b64encode(content)
+
+
+class FakeBeanstalk:
+    """Beanstalk client with fixed tube statistics"""
+
+    def __init__(self, jobs: Dict[Text, int]) -> None:
+        self.jobs = jobs
+        self.closed = False
+
+    async def tubes(self) -> List[Text]:
+        return list(self.jobs)
+
+    async def stats_tube(self, tube: Text) -> Dict[Text, Any]:
+        if self.closed:
+            raise ConnectionError("closed")
+        return {"current-jobs-ready": self.jobs[tube]}
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_queue_monitor() -> None:
+    """Sampled queue depth should be used until stale, and the monitor
+    should reconnect after errors"""
+
+    clients: List[FakeBeanstalk] = []
+
+    def connect() -> FakeBeanstalk:
+        clients.append(FakeBeanstalk({"scio_doc": 3, "scio_analyze": 7}))
+        return clients[-1]
+
+    monitor = QueueMonitor(
+        connect, ["scio_doc", "scio_analyze", "other"], max_age=10  # type: ignore
+    )
+
+    assert monitor.max_jobs_ready() is None
+
+    await monitor.sample()
+
+    assert monitor.jobs_ready == {"scio_doc": 3, "scio_analyze": 7, "other": 0}
+    assert monitor.max_jobs_ready() == 7
+
+    # Connection lost
+    clients[0].closed = True
+    await monitor.sample()
+    assert monitor.failed
+    assert monitor.client is None
+
+    await monitor.sample()
+    assert len(clients) == 2
+    assert not monitor.failed
+
+    # Stale
+    monitor.sampled -= 11
+    assert monitor.max_jobs_ready() is None
@@ -0,0 +1,47 @@
+"""test set of submitted documents"""
+
+from pathlib import Path
+
+from act.scio.digestset import DigestSet
+
+
+def test_digest_set(tmp_path: Path) -> None:
+    """Digests should only be added once, also after a restart"""
+
+    digests = DigestSet(str(tmp_path / "submitted.db"), ttl=3600)
+
+    assert digests.add("abc")
+    assert not digests.add("abc")
+    assert digests.add("def")
+
+    assert digests.contains("abc")
+    assert not digests.contains("ghi")
+
+    digests.discard("def")
+    assert not digests.contains("def")
+    assert digests.add("def")
+
+    digests.close()
+
+    # Read from disk
+    digests = DigestSet(str(tmp_path / "submitted.db"), ttl=3600)
+    assert not digests.add("abc")
+    assert not digests.add("def")
+    digests.close()
+
+
+def test_digest_set_ttl(tmp_path: Path) -> None:
+    """Expired digests can be added again"""
+
+    digests = DigestSet(str(tmp_path / "submitted.db"), ttl=3600)
+
+    assert digests.add("abc")
+
+    # Expire
+    digests.memory["abc"] -= 3601
+    digests.conn.execute("UPDATE digest SET added = added - 3601")
+
+    assert digests.add("abc")
+    assert not digests.add("abc")
+
+    digests.close()
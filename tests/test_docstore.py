@@ -0,0 +1,70 @@
+"""test content addressed document store"""
+
+import hashlib
+from pathlib import Path
+
+from act.scio.docstore import DocumentStore
+
+
+def test_document_store(tmp_path: Path) -> None:
+    """Documents should be stored by hexdigest, in two levels of directories"""
+
+    store = DocumentStore(tmp_path)
+
+    content = b"document"
+    hexdigest = hashlib.sha256(content).hexdigest()
+
+    path = store.write(content, hexdigest)
+
+    assert path == tmp_path / hexdigest[:2] / hexdigest[2:4] / hexdigest
+    assert path.read_bytes() == content
+    assert store.lookup(hexdigest) == path
+    assert store.lookup(hexdigest.upper()) == path
+    assert store.lookup("0" * 64) is None
+
+    # Writing the same document again keeps the stored document
+    assert store.write(content, hexdigest) == path
+    assert not list(store.tmp_dir.iterdir())
+
+
+def test_document_store_nostore(tmp_path: Path) -> None:
+    """Documents that are also stored should be hard linked, so removing one
+    keeps the other"""
+
+    store = DocumentStore(tmp_path)
+
+    content = b"document"
+    hexdigest = hashlib.sha256(content).hexdigest()
+
+    stored = store.write(content, hexdigest)
+
+    tmp_file = store.tmp_file()
+    tmp_file.write_bytes(content)
+    nostore = store.add(tmp_file, hexdigest, store=False)
+
+    assert nostore.parts[-4] == "NOSTORE"
+    assert nostore.stat().st_ino == stored.stat().st_ino
+    assert not tmp_file.exists()
+
+    # Removed after analysis
+    nostore.unlink()
+    assert store.lookup(hexdigest) == stored
+
+
+def test_document_store_filename(tmp_path: Path) -> None:
+    """The first filename of stored documents should be kept"""
+
+    store = DocumentStore(tmp_path)
+
+    content = b"document"
+    hexdigest = hashlib.sha256(content).hexdigest()
+
+    assert store.original_filename(hexdigest) is None
+
+    store.write(content, hexdigest, store=False, original_filename="nostore.txt")
+    assert store.original_filename(hexdigest) is None
+
+    store.write(content, hexdigest, original_filename="report.pdf")
+    store.write(content, hexdigest, original_filename="other.pdf")
+    assert store.original_filename(hexdigest) == "report.pdf"
+    assert not list(store.tmp_dir.iterdir())
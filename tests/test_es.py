@@ -0,0 +1,211 @@
+"""test elasticsearch client utilities"""
+
+import json
+import threading
+import time
+from typing import Any, Dict, List, Text, Tuple
+
+import pytest
+
+from act.scio import es
+from act.scio.es import (
+    FIRST_SEEN_INDEX,
+    FirstSeenWriter,
+    async_aggregation,
+    async_first_seen,
+    client_options,
+    indicator_id,
+)
+
+
+class FakeClient:
+    """Asyncio elasticsearch client returning terms from a composite
+    aggregation, one page at a time"""
+
+    def __init__(self, term: Text, counts: List[Tuple[Text, int]]) -> None:
+        self.term = term
+        self.counts = counts
+        self.bodies: List[Dict[Text, Any]] = []
+
+    async def search(self, index: Text, body: Dict[Text, Any]) -> Dict[Text, Any]:
+        self.bodies.append(body)
+
+        composite = body["aggs"][self.term]["composite"]
+        after = composite.get("after", {}).get(self.term)
+        page = [(key, count) for key, count in self.counts if not after or key > after]
+        page = page[: composite["size"]]
+
+        aggr: Dict[Text, Any] = {
+            "buckets": [
+                {"key": {self.term: key}, "doc_count": count} for key, count in page
+            ]
+        }
+        if page:
+            aggr["after_key"] = {self.term: page[-1][0]}
+
+        return {"aggregations": {self.term: aggr}}
+
+
+class SearchClient:
+    """Asyncio elasticsearch client returning a fixed search response"""
+
+    def __init__(self, response: Dict[Text, Any]) -> None:
+        self.response = response
+        self.body: Dict[Text, Any] = {}
+
+    async def search(self, index: Text, body: Dict[Text, Any]) -> Dict[Text, Any]:
+        self.body = body
+        return self.response
+
+
+def test_client_options() -> None:
+    """Timeout, retries and pool size should be passed to the client"""
+
+    options = client_options(
+        "localhost", username="scio", timeout=30, max_retries=0, connections=25
+    )
+
+    assert options["hosts"] == [{"host": "localhost", "port": 9200, "scheme": "http"}]
+    assert options["request_timeout"] == 30
+    assert options["max_retries"] == 0
+    assert not options["retry_on_timeout"]
+    assert options["connections_per_node"] == 25
+    assert options["basic_auth"] == ("scio", "")
+
+    assert "basic_auth" not in client_options("localhost")
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_async_aggregation() -> None:
+    """All terms should be returned as (key, count), paging through the
+    composite aggregation"""
+
+    term = "indicators.fqdn.keyword"
+    counts = [("a.example.com", 2), ("b.example.com", 1), ("c.example.com", 5)]
+    client = FakeClient(term, counts)
+
+    res = [
+        row
+        async for row in async_aggregation(
+            client, term, "now-90d", "now", size=2  # type: ignore
+        )
+    ]
+
+    assert res == counts
+
+    # One full page, and a last page with the remaining term
+    assert len(client.bodies) == 2
+    assert client.bodies[0]["query"]["range"]["Analyzed-Date"]["gte"] == "now-90d"
+    assert "after" not in client.bodies[0]["aggs"][term]["composite"]
+    assert client.bodies[1]["aggs"][term]["composite"]["after"] == {
+        term: "b.example.com"
+    }
+
+
+def test_first_seen_writer() -> None:
+    """Indicators should only be queued once, and created with first_seen"""
+
+    writer = FirstSeenWriter(None)  # type: ignore
+    writer.add_indicator("fqdn", "example.com")
+    writer.add_indicator("fqdn", "example.com")
+    writer.add_indicator("ipv4", "127.0.0.1")
+
+    assert len(writer.pending) == 2
+
+    item = writer.pending[0]
+    assert item.doc_id == indicator_id("fqdn", "example.com")
+
+    action, body = writer.action(item)
+    document = json.loads(body)
+
+    assert action == {"create": {"_index": FIRST_SEEN_INDEX, "_id": item.doc_id}}
+    assert document["value"] == "example.com"
+    assert document["type"] == "fqdn"
+    assert document["id"] == item.doc_id
+    assert document["first_seen"] > 0
+
+
+def test_first_seen_writer_retry() -> None:
+    """first_seen should be set again when a failed indicator is retried"""
+
+    class RetryWriter(FirstSeenWriter):
+        """Writer failing the first batch with 429"""
+
+        first_seen: List[int] = []
+
+        def send(self, batch: List[Any]) -> List[Tuple[Any, Dict[Text, Any]]]:
+            _, body = self.action(batch[0])
+            self.first_seen.append(json.loads(body)["first_seen"])
+            if len(self.first_seen) == 1:
+                return [(batch[0], {"status": 429, "retry": True})]
+            return []
+
+    writer = RetryWriter(None, batch_size=1, initial_backoff=0.1)  # type: ignore
+    writer.start()
+    writer.add_indicator("fqdn", "example.com")
+    # Retries are not delayed by the backoff after close
+    time.sleep(0.5)
+    writer.close()
+
+    assert len(writer.first_seen) == 2
+    assert writer.first_seen[1] > writer.first_seen[0]
+
+
+def test_first_seen_writer_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Indicators should be added safely from several threads"""
+
+    monkeypatch.setattr(es, "SEEN_CACHE_SIZE", 10)
+
+    writer = FirstSeenWriter(None, max_pending=1000000)  # type: ignore
+    errors: List[Exception] = []
+
+    def add() -> None:
+        try:
+            for i in range(10000):
+                writer.add_indicator("fqdn", f"{i % 20}.example.com")
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=add) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(writer.seen) == 10
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_async_first_seen() -> None:
+    """Indicators should be returned after the cursor"""
+
+    client = SearchClient(
+        {
+            "hits": {
+                "hits": [
+                    {
+                        "_source": {
+                            "value": "example.com",
+                            "first_seen": 2000,
+                            "id": "abc",
+                        }
+                    }
+                ]
+            }
+        }
+    )
+
+    res = await async_first_seen(
+        client, "fqdn", before=3000, after=1000, after_id="aaa"  # type: ignore
+    )
+
+    assert res == [("example.com", 2000, "abc")]
+    assert client.body["search_after"] == [1000, "aaa"]
+
+    # Timestamp cursor
+    await async_first_seen(client, "fqdn", before=3000, after=1000)  # type: ignore
+    assert "search_after" not in client.body
+    assert {"range": {"first_seen": {"gt": 1000}}} in client.body["query"]["bool"][
+        "filter"
+    ]
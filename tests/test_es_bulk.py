@@ -0,0 +1,188 @@
+"""test elasticsearch bulk writer"""
+
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set, Text, Tuple
+
+from act.scio.es import BulkItem, BulkWriter
+
+
+class FakeWriter(BulkWriter):
+    """Bulk writer recording batches instead of sending them to elasticsearch.
+    Documents in fail are failed with error"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(None, *args, **kwargs)  # type: ignore
+        self.batches: List[List[Text]] = []
+        self.fail: Set[Text] = set()
+        self.error: Dict[Text, Any] = {}
+
+    def send(self, batch: List[BulkItem]) -> List[Tuple[BulkItem, Dict[Text, Any]]]:
+        self.batches.append([item.doc_id for item in batch])
+        failed = [(item, self.error) for item in batch if item.doc_id in self.fail]
+        # Only fail once
+        self.fail = set()
+        return failed
+
+
+def test_bulk_writer_batches() -> None:
+    """Documents should be sent in batches, and pending documents on close"""
+
+    writer = FakeWriter(batch_size=2, flush_interval=60)
+    writer.start()
+
+    for doc_id in ("a", "b", "c"):
+        writer.add(doc_id, {"hexdigest": doc_id})
+
+    writer.close()
+
+    assert writer.batches == [["a", "b"], ["c"]]
+    assert writer.indexed == 3
+
+
+def test_bulk_writer_retry() -> None:
+    """Documents failing with temporary errors should be retried"""
+
+    writer = FakeWriter(batch_size=2, flush_interval=60, initial_backoff=0.01)
+    writer.fail = {"b"}
+    writer.error = {"error": "too many requests", "status": 429, "retry": True}
+    writer.start()
+
+    writer.add("a", {"hexdigest": "a"})
+    writer.add("b", {"hexdigest": "b"})
+
+    writer.close()
+
+    assert writer.batches == [["a", "b"], ["b"]]
+    assert writer.indexed == 2
+    assert writer.spooled == 0
+
+
+def test_bulk_writer_spool(tmp_path: Path) -> None:
+    """Documents that can not be indexed should be spooled, and indexed
+    when the writer is started again"""
+
+    writer = FakeWriter(flush_interval=60, spool_dir=str(tmp_path))
+    writer.fail = {"b"}
+    writer.error = {"error": "mapper_parsing_exception", "status": 400, "retry": False}
+    writer.start()
+
+    writer.add("a", {"hexdigest": "a"})
+    writer.add("b", {"hexdigest": "b"})
+
+    writer.close()
+
+    assert writer.spooled == 1
+    assert json.loads((tmp_path / "b.json").read_text()) == {"hexdigest": "b"}
+
+    writer = FakeWriter(flush_interval=60, spool_dir=str(tmp_path))
+    writer.start()
+    writer.close()
+
+    assert writer.batches == [["b"]]
+    assert not list(tmp_path.iterdir())
+
+
+class BlockingWriter(FakeWriter):
+    """Fake writer where send blocks until released"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.released = threading.Event()
+
+    def send(self, batch: List[BulkItem]) -> List[Tuple[BulkItem, Dict[Text, Any]]]:
+        self.released.wait()
+        return super().send(batch)
+
+
+def test_bulk_writer_max_pending() -> None:
+    """add() should block when max_pending documents are waiting"""
+
+    writer = BlockingWriter(batch_size=1, flush_interval=60, max_pending=2)
+    writer.start()
+
+    # "a" is sent (blocked), "b" and "c" are pending
+    for doc_id in ("a", "b", "c"):
+        writer.add(doc_id, {"hexdigest": doc_id})
+
+    adder = threading.Thread(target=writer.add, args=("d", {"hexdigest": "d"}))
+    adder.start()
+    adder.join(0.2)
+
+    assert adder.is_alive()
+    assert len(writer.pending) == 2
+
+    writer.released.set()
+    adder.join(5)
+
+    assert not adder.is_alive()
+
+    writer.close()
+
+    assert writer.batches == [["a"], ["b"], ["c"], ["d"]]
+
+
+def test_bulk_writer_spool_max_pending(tmp_path: Path) -> None:
+    """Spooled documents should be queued as there is room for them"""
+
+    for doc_id in ("a", "b", "c", "d", "e"):
+        (tmp_path / f"{doc_id}.json").write_text(json.dumps({"hexdigest": doc_id}))
+
+    writer = BlockingWriter(
+        batch_size=1, flush_interval=60, max_pending=2, spool_dir=str(tmp_path)
+    )
+    writer.start()
+    time.sleep(0.2)
+
+    # "a" is sent (blocked), "b" and "c" are pending
+    assert len(writer.pending) == 2
+    assert writer.spool_files
+
+    writer.released.set()
+    writer.add("f", {"hexdigest": "f"})
+    writer.close()
+
+    assert sorted(doc_id for batch in writer.batches for doc_id in batch) == [
+        "a",
+        "b",
+        "c",
+        "d",
+        "e",
+        "f",
+    ]
+    assert not list(tmp_path.iterdir())
+
+
+def test_bulk_writer_add_closed(tmp_path: Path) -> None:
+    """Documents added after close should be spooled"""
+
+    writer = FakeWriter(flush_interval=60, spool_dir=str(tmp_path))
+    writer.start()
+    writer.close()
+
+    writer.add("a", {"hexdigest": "a"})
+
+    assert writer.spooled == 1
+    assert json.loads((tmp_path / "a.json").read_text()) == {"hexdigest": "a"}
+
+
+def test_bulk_writer_close_backoff() -> None:
+    """close() should not wait for the backoff before retries, also without a
+    spool directory"""
+
+    writer = FakeWriter(batch_size=1, flush_interval=60, initial_backoff=60)
+    writer.fail = {"a"}
+    writer.error = {"error": "too many requests", "status": 429, "retry": True}
+    writer.start()
+
+    writer.add("a", {"hexdigest": "a"})
+    time.sleep(0.2)
+
+    started = time.time()
+    writer.close()
+
+    assert time.time() - started < 5
+    assert writer.batches == [["a"], ["a"]]
+    assert writer.indexed == 1
@@ -0,0 +1,41 @@
+""" test plugin setup/warmup """
+
+import os
+import shutil
+from pathlib import Path
+
+import addict
+import pytest
+
+from act.scio.plugins import tools_pattern
+
+CONFIGDIR = os.path.join(os.path.dirname(__file__), "../act/scio/etc/plugins")
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_warmup(tmp_path: Path) -> None:
+    """setup() should only run again when a resource is modified"""
+
+    for filename in ("tools_pattern.ini", "tools.cfg"):
+        shutil.copy(os.path.join(CONFIGDIR, filename), tmp_path)
+
+    plugin = tools_pattern.Plugin()
+    plugin.configdir = str(tmp_path)
+
+    plugin.warmup()
+    vocab = plugin.vocab
+
+    nlpdata = addict.Dict(content="The actor used mimikatz and a custom tool")
+    res = await plugin.analyze(nlpdata)
+    assert plugin.vocab is vocab
+    assert "mimikatz" in res.result.Tools
+
+    alias = tmp_path / "tools.cfg"
+    alias.write_text(alias.read_text() + "\nfoobartool:\n")
+    stat = alias.stat()
+    os.utime(alias, (stat.st_atime, stat.st_mtime + 10))
+
+    nlpdata = addict.Dict(content="The actor used foobartool")
+    res = await plugin.analyze(nlpdata)
+    assert plugin.vocab is not vocab
+    assert "foobartool" in res.result.Tools
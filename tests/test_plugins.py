@@ -2,6 +2,7 @@
 
 import io
 import os
+from typing import List, Text
 
 import pytest
 
@@ -37,3 +38,57 @@ async def test_plugins(monkeypatch: MonkeyPatch) -> None:
 
     assert res["count"]["This is a test"] == 14
     assert res["count"]["And this is another one"] == 23
+
+
+def make_plugin(name: Text, dependencies: List[Text]) -> plugin.BasePlugin:
+    """Create empty plugin with name and dependencies"""
+
+    p = plugin.BasePlugin()
+    p.name = name
+    p.dependencies = dependencies
+    return p
+
+
+def test_resolve_dependencies() -> None:
+    """Plugins should be sorted by dependencies, and plugins with missing
+    or cyclic dependencies removed"""
+
+    plugins = [
+        make_plugin("locations", ["pos_tag"]),
+        make_plugin("pos_tag", []),
+        make_plugin("indicators", []),
+        make_plugin("missing", ["not_loaded"]),
+        make_plugin("depends_on_missing", ["missing"]),
+        make_plugin("cycle1", ["cycle2"]),
+        make_plugin("cycle2", ["cycle1"]),
+    ]
+
+    resolved = [p.name for p in plugin.resolve_dependencies(plugins)]
+
+    assert sorted(resolved) == ["indicators", "locations", "pos_tag"]
+    assert resolved.index("pos_tag") < resolved.index("locations")
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_plugin_failed_dependency(monkeypatch: MonkeyPatch) -> None:
+    """Plugins depending on a failed plugin should not run, other plugins should"""
+
+    plugin_dir = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)), "plugins_deps"
+    )
+
+    plugins = plugin.load_external_plugins(plugin_dir)
+
+    for p in plugins:
+        if p.name == "sentences":
+            monkeypatch.setattr(p, "analyze", None)
+
+    plugins.append(plugin.BasePlugin())
+
+    monkeypatch.setattr("sys.stdin", io.StringIO("This is a test."))
+
+    res = await analyze.analyze(plugins, beanstalk_client=False)
+
+    assert "sentences" not in res
+    assert "count" not in res
+    assert res["BasePlugin"]["test"] == "This is a test."
@@ -0,0 +1,112 @@
+"""pos_tag chunking tests"""
+
+import os
+
+import addict
+import pytest
+
+from act.scio import plugin
+from act.scio.plugins import pos_tag
+from act.scio.plugins.pos_tag import split_chunks
+from act.scio.runner import PluginRunner
+
+CONFIGDIR = os.path.join(os.path.dirname(__file__), "../act/scio/etc/plugins")
+
+TEXT = """First paragraph with some words.
+
+Second paragraph, which is a bit longer than the first one.
+It spans two lines.
+
+Third paragraph."""
+
+
+def test_split_chunks() -> None:
+    """Chunks should cover the full text, split at paragraph boundaries or
+    line breaks"""
+
+    chunks = split_chunks(TEXT, 60)
+
+    assert "".join(chunk for _, chunk in chunks) == TEXT
+
+    for offset, chunk in chunks:
+        assert TEXT[offset : offset + len(chunk)] == chunk  # noqa: E203
+        assert len(chunk) <= 60
+
+    assert chunks[0][1] == "First paragraph with some words.\n\n"
+    assert chunks[1][1].endswith("the first one.\n")
+    assert chunks[2][1] == "It spans two lines.\n\nThird paragraph."
+
+
+def test_split_chunks_small() -> None:
+    """Text smaller than the chunk size is one chunk"""
+
+    assert split_chunks(TEXT, 1000) == [(0, TEXT)]
+    assert split_chunks("", 1000) == [(0, "")]
+
+
+def test_split_chunks_no_whitespace() -> None:
+    """Text without whitespace is split at the chunk size"""
+
+    assert split_chunks("a" * 25, 10) == [(0, "a" * 10), (10, "a" * 10), (20, "a" * 5)]
+
+
+def nltk_data() -> bool:
+    """Check whether the nltk data used by pos_tag is installed"""
+
+    try:
+        pos_tag.tag("Test")
+    except LookupError:
+        return False
+    return True
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_pos_tag_chunks() -> None:
+    """Chunks tagged in parallel through the plugin runner should give the
+    same tokens and offsets as the document tagged in one chunk"""
+
+    if not nltk_data():
+        pytest.skip("nltk data is not installed")
+
+    p = plugin.load_plugin("act.scio.plugins.pos_tag")
+    assert p
+    p.configdir = CONFIGDIR
+    p.warmup()
+
+    runner = PluginRunner([p], processes=1)
+
+    # pos_tag starts processes of its own, and is not run in the runner pool
+    assert "pos_tag" not in runner.pool_plugins
+
+    content = "\n\n".join([TEXT] * 5)
+
+    try:
+        p.processes = 1
+        p.chunk_size = len(content)
+        single = addict.Dict(content=content)
+        await runner.run_all(single)
+
+        p.shutdown()
+        p.processes = 2
+        p.chunk_size = 60
+        chunked = addict.Dict(content=content)
+        await runner.run_all(chunked)
+    finally:
+        p.shutdown()
+        runner.shutdown()
+
+    assert len(single.pos_tag.chunks) == 1
+    assert len(chunked.pos_tag.chunks) > 2
+
+    # Tags may differ at chunk boundaries, tokens and offsets should not
+    tokens = chunked.pos_tag.tokens
+    expected = single.pos_tag.tokens
+
+    assert [tokens.token(i) for i in range(len(tokens))] == [
+        expected.token(i) for i in range(len(expected))
+    ]
+    assert tokens.starts == expected.starts
+    assert tokens.lengths == expected.lengths
+
+    for offset, token_offset in chunked.pos_tag.chunks:
+        assert tokens.starts[token_offset] >= offset
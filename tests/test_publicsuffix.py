@@ -0,0 +1,39 @@
+"""
+Public suffix list tests
+"""
+
+import os
+
+from act.scio.publicsuffix import PublicSuffixList
+
+PUBLIC_SUFFIX_LIST = os.path.join(
+    os.path.dirname(__file__), "../act/scio/vendor/public_suffix_list.dat"
+)
+
+
+def test_public_suffix_rules() -> None:
+    """TLDs from rules, wildcards and exceptions, and IDN TLDs"""
+
+    psl = PublicSuffixList(
+        ["com", "uk", "co.uk", "jp", "*.kawasaki.jp", "!city.kawasaki.jp", "рф"]
+    )
+
+    assert psl.has_valid_tld("www.example.com")
+    assert psl.has_valid_tld("www.example.COM")
+    assert psl.has_valid_tld("com")
+    assert psl.has_valid_tld("www.example.kawasaki.jp")
+    assert psl.has_valid_tld("example.xn--p1ai")
+    assert psl.has_valid_tld("example.рф")
+    assert not psl.has_valid_tld("report.pdf")
+    assert not psl.has_valid_tld("version.1.2")
+
+
+def test_public_suffix_list_file() -> None:
+    """Vendored public suffix list"""
+
+    psl = PublicSuffixList.from_file(PUBLIC_SUFFIX_LIST)
+
+    assert psl.has_valid_tld("www.mnemonic.no")
+    assert psl.has_valid_tld("www.nytimes3xbfgragh.onion")
+    assert not psl.has_valid_tld("setup.exe")
+    assert psl.has_valid_tld("www.bbc.co.uk")
@@ -0,0 +1,113 @@
+"""test plugin result cache"""
+
+from pathlib import Path
+
+import addict
+import pytest
+
+from act.scio.plugin import BasePlugin, Result
+from act.scio.resultcache import ResultCache
+from act.scio.runner import PluginRunner
+
+
+class CountingPlugin(BasePlugin):
+    """Plugin counting the number of documents analyzed"""
+
+    name = "counting"
+    cache_result = True
+    calls = 0
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        self.calls += 1
+        return Result(
+            name=self.name,
+            version=self.version,
+            result=addict.Dict(tokens=[("Scio", "NNP")]),
+        )
+
+
+def test_result_cache(tmp_path: Path) -> None:
+    """Results are cached per hexdigest, plugin and version"""
+
+    cache = ResultCache(str(tmp_path / "results.db"), 1024 * 1024)
+
+    res = Result(
+        name="pos_tag", version="0.1", result=addict.Dict(tokens=[["a", "DT"]])
+    )
+
+    assert cache.get("abc", "pos_tag", "0.1") is None
+
+    cache.put("abc", res)
+
+    assert cache.get("abc", "pos_tag", "0.1") == res
+    assert cache.get("abc", "pos_tag", "0.2") is None
+    assert cache.get("def", "pos_tag", "0.1") is None
+
+    cache.close()
+
+
+def test_result_cache_eviction(tmp_path: Path) -> None:
+    """Least recently used results are removed when the cache is full"""
+
+    results = {
+        hexdigest: Result(
+            name="test", version="0.1", result=addict.Dict(data=hexdigest * 100)
+        )
+        for hexdigest in ("a", "b", "c")
+    }
+
+    cache = ResultCache(str(tmp_path / "results.db"), 1024 * 1024)
+    cache.put("a", results["a"])
+    cache.put("b", results["b"])
+
+    # Room for two results, but not three
+    cache.max_size = int(cache.size() * 1.25)
+
+    assert cache.get("a", "test", "0.1")  # b is now least recently used
+
+    cache.put("c", results["c"])
+
+    assert cache.get("a", "test", "0.1") == results["a"]
+    assert cache.get("b", "test", "0.1") is None
+    assert cache.get("c", "test", "0.1") == results["c"]
+
+    cache.close()
+
+
+def test_result_cache_corrupt(tmp_path: Path) -> None:
+    """Results that can not be decoded are cache misses, and removed"""
+
+    cache = ResultCache(str(tmp_path / "results.db"), 1024 * 1024)
+    cache.put("abc", Result(name="pos_tag", version="0.1", result=addict.Dict()))
+
+    with cache.lock:
+        cache.conn.execute("UPDATE result SET data = ?", (b"not zlib",))
+        cache.conn.commit()
+
+    assert cache.get("abc", "pos_tag", "0.1") is None
+    assert cache.size() == 0
+
+    cache.close()
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_result_cache(tmp_path: Path) -> None:
+    """Plugins with cache_result only run once per document"""
+
+    p = CountingPlugin()
+
+    cache = ResultCache(str(tmp_path / "results.db"), 1024 * 1024)
+    runner = PluginRunner([p], cache=cache)
+
+    for _ in range(2):
+        nlpdata = addict.Dict(content="Scio", hexdigest="abc")
+        await runner.run_all(nlpdata)
+        assert [list(token) for token in nlpdata.counting.tokens] == [["Scio", "NNP"]]
+
+    assert p.calls == 1
+
+    # Documents without hexdigest are not cached
+    await runner.run_all(addict.Dict(content="Scio"))
+    assert p.calls == 2
+
+    cache.close()
@@ -0,0 +1,173 @@
+"""test plugin runner"""
+
+import asyncio
+import os
+import signal
+import time
+
+import addict
+import pytest
+
+from act.scio import plugin
+from act.scio.plugin import Result
+from act.scio.runner import PluginRunner
+
+CONFIGDIR = os.path.join(os.path.dirname(__file__), "../act/scio/etc/plugins")
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_process_pool() -> None:
+    """CPU bound plugins should give the same result in the process pool"""
+
+    vulnerabilities = plugin.load_plugin("act.scio.plugins.vulnerabilities")
+    tools = plugin.load_plugin("act.scio.plugins.tools_pattern")
+
+    assert vulnerabilities and tools
+
+    for p in (vulnerabilities, tools):
+        p.configdir = CONFIGDIR
+
+    nlpdata = addict.Dict(content="CVE-2021-44228 was exploited using mimikatz")
+
+    runner = PluginRunner([vulnerabilities, tools], processes=1)
+
+    try:
+        assert runner.pool_plugins == {"vulnerabilities", "tools"}
+
+        for p in (vulnerabilities, tools):
+            res = await runner.run(p, nlpdata)
+            assert res == await p.analyze(nlpdata)
+
+        # Workers should keep running while the main process drains
+        assert runner.pool
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            handler = runner.pool.apply(signal.getsignal, (sig,))
+            assert handler == signal.SIG_IGN
+    finally:
+        runner.shutdown()
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_in_loop() -> None:
+    """Plugins that are not CPU bound, or created directly, run on the loop"""
+
+    p = plugin.BasePlugin()
+    p.cpu_bound = True
+
+    runner = PluginRunner([p])
+
+    assert runner.pool is None
+
+    res = await runner.run(p, addict.Dict(content="test"))
+    assert res.result.test == "test"
+
+
+class FailingPlugin(plugin.BasePlugin):
+    """Plugin raising an exception for every document"""
+
+    name = "failing"
+
+    async def analyze(self, nlpdata: addict.Dict) -> Result:
+        raise LookupError("missing")
+
+
+class DependentPlugin(plugin.BasePlugin):
+    """Plugin depending on the failing plugin"""
+
+    name = "dependent"
+    dependencies = ["failing"]
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_exception() -> None:
+    """A failing plugin should be recorded on the document, while plugins
+    that do not depend on it still produce a result"""
+
+    sibling = plugin.BasePlugin()
+
+    runner = PluginRunner([FailingPlugin(), DependentPlugin(), sibling])
+
+    nlpdata = addict.Dict(content="test")
+    await runner.run_all(nlpdata)
+
+    assert nlpdata.errors == ["failing"]
+    assert nlpdata.BasePlugin.test == "test"
+    assert "failing" not in nlpdata
+    assert "dependent" not in nlpdata
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_timeout() -> None:
+    """Plugins exceeding the time budget should be killed and the document
+    marked, while other plugins still produce a result"""
+
+    slow = plugin.load_plugin(
+        os.path.join(os.path.dirname(__file__), "plugins_slow", "slow.py")
+    )
+    vulnerabilities = plugin.load_plugin("act.scio.plugins.vulnerabilities")
+
+    assert slow and vulnerabilities
+
+    runner = PluginRunner(
+        [slow, vulnerabilities],
+        processes=2,
+        timeout=30,
+        timeouts={"slow": 1},
+    )
+
+    try:
+        nlpdata = addict.Dict(content="60")
+        await runner.run_all(nlpdata)
+
+        assert nlpdata.timeouts == ["slow"]
+        assert "vulnerabilities" in nlpdata
+        assert "slow" not in nlpdata
+
+        # The pool should be replaced, and work for the next document
+        nlpdata = addict.Dict(content="0")
+        await runner.run_all(nlpdata)
+
+        assert "timeouts" not in nlpdata
+        assert "slow" in nlpdata
+    finally:
+        runner.shutdown()
+
+
+@pytest.mark.asyncio  # type: ignore
+async def test_runner_timeout_starts_in_worker() -> None:
+    """Time waiting for a worker should not count against the time budget,
+    and only the worker running a stuck plugin should be killed"""
+
+    slow = plugin.load_plugin(
+        os.path.join(os.path.dirname(__file__), "plugins_slow", "slow.py")
+    )
+
+    assert slow
+
+    runner = PluginRunner([slow], processes=1, timeouts={"slow": 2})
+
+    try:
+        # The second document waits for the first in the only worker
+        started = time.time()
+        await asyncio.gather(
+            runner.run(slow, addict.Dict(content="1.5")),
+            runner.run(slow, addict.Dict(content="1.5")),
+        )
+        assert time.time() - started > 3
+    finally:
+        runner.shutdown()
+
+    runner = PluginRunner([slow], processes=2, timeouts={"slow": 5})
+
+    try:
+        healthy = asyncio.ensure_future(runner.run(slow, addict.Dict(content="3")))
+        await asyncio.sleep(0.5)
+
+        runner.timeouts = {"slow": 1}
+        with pytest.raises(asyncio.TimeoutError):
+            await runner.run(slow, addict.Dict(content="60"))
+
+        # Not affected by the killed worker
+        assert (await healthy).name == "slow"
+    finally:
+        runner.shutdown()
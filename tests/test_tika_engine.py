@@ -0,0 +1,47 @@
+""" test tika engine """
+
+from pathlib import Path
+from typing import Any, Dict, Text
+
+# Unfortunately not exported
+from _pytest.monkeypatch import MonkeyPatch
+
+from act.scio import tika_engine
+
+
+def test_extract(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """extract should unescape html and use the specified tika server"""
+
+    calls = []
+
+    def from_buffer(content: bytes, serverEndpoint: Text) -> Dict[Text, Any]:
+        calls.append((content, serverEndpoint))
+        return {"content": content.decode("utf8")}
+
+    monkeypatch.setattr(tika_engine.parser, "from_buffer", from_buffer)
+
+    filename = tmp_path / "test.html"
+    filename.write_text("<p>A &amp; B</p>")
+
+    data = tika_engine.extract(str(filename), "http://tika:9998")
+
+    assert data["content"] == "<p>A & B</p>"
+    assert calls == [(b"<p>A & B</p>", "http://tika:9998")]
+
+
+def test_worker_stats() -> None:
+    """Worker stats"""
+
+    stats = tika_engine.WorkerStats(3)
+    stats.add(1024, 0.5)
+    stats.add(2048, 1.5)
+    stats.errors += 1
+
+    assert stats.jobs == 2
+    assert stats.bytes == 3072
+    assert stats.extract_time == 2.0
+
+    summary = stats.summary()
+    assert "worker=3" in summary
+    assert "jobs=2" in summary
+    assert "errors=1" in summary
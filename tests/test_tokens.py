@@ -0,0 +1,101 @@
+"""token store tests"""
+
+import pickle
+
+import addict
+
+from act.scio.tokens import TokenStore, bind_tokens
+
+TEXT = 'The "Fancy Bear" group, also known as APT28.\n\nNext paragraph.'
+
+TAGGED = [
+    ("The", "DT"),
+    ("``", "``"),
+    ("Fancy", "NNP"),
+    ("Bear", "NNP"),
+    ("''", "''"),
+    ("group", "NN"),
+    (",", ","),
+    ("also", "RB"),
+    ("known", "VBN"),
+    ("as", "IN"),
+    ("APT28", "NNP"),
+    (".", "."),
+    ("Next", "JJ"),
+    ("paragraph", "NN"),
+    (".", "."),
+]
+
+
+def test_token_store() -> None:
+    """Token store should work like a list of (token, tag)"""
+
+    tokens = TokenStore(TEXT, TAGGED)
+
+    assert len(tokens) == len(TAGGED)
+    assert list(tokens) == TAGGED
+    assert tokens == TAGGED
+    assert tokens[2] == ("Fancy", "NNP")
+    assert tokens[-1] == (".", ".")
+    assert tokens[-3:-1] == TAGGED[-3:-1]
+    assert tokens[5][1] == "NN"
+
+    # Only the tokens not found in the text are stored as strings
+    assert tokens.other == {1: "``", 4: "''"}
+    assert TEXT[tokens.starts[10] :].startswith("APT28")  # noqa: E203
+
+
+def test_token_store_gap() -> None:
+    """Tokens after long whitespace runs should be found in the text"""
+
+    text = "First.\n\n\n\n\n\n\n\n\n\n\n\nSecond line." * 100
+    tagged = [("First", "JJ"), (".", "."), ("Second", "JJ"), ("line", "NN"), (".", ".")]
+
+    tokens = TokenStore(text, tagged * 100)
+
+    assert tokens == tagged * 100
+    assert not tokens.other
+
+
+def test_token_store_pickle() -> None:
+    """Stores should be pickled without the text, and bound to the document
+    content after they are unpickled"""
+
+    nlpdata = addict.Dict(content=TEXT * 100)
+    nlpdata.pos_tag.tokens = TokenStore(nlpdata.content, TAGGED * 100)
+
+    data = pickle.dumps(nlpdata.pos_tag)
+    assert b"paragraph" not in data
+
+    nlpdata.pos_tag = pickle.loads(data)
+    bind_tokens(nlpdata)
+
+    assert nlpdata.pos_tag.tokens == TAGGED * 100
+
+
+def test_token_store_concat() -> None:
+    """Stores for chunks of a text should combine to a store for the text"""
+
+    split = TEXT.index("Next")
+
+    tokens = TokenStore.concat(
+        TEXT,
+        [
+            (0, TokenStore(TEXT[:split], TAGGED[:12])),
+            (split, TokenStore(TEXT[split:], TAGGED[12:])),
+        ],
+    )
+
+    assert tokens == TAGGED
+    assert tokens.starts[12] == split
+    assert tokens.other == {1: "``", 4: "''"}
+
+
+def test_token_store_summary() -> None:
+    """Summary should count tokens per tag"""
+
+    summary = TokenStore(TEXT, TAGGED).summary()
+
+    assert summary["count"] == 15
+    assert summary["tags"]["NNP"] == 3
+    assert summary["tags"]["."] == 2